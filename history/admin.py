@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TimePeriod, HistoricalFigure, HistoricalSite
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, Job
 
 
 @admin.register(TimePeriod)
@@ -22,4 +22,12 @@ class HistoricalSiteAdmin(admin.ModelAdmin):
     list_display = ['name', 'city', 'built_year']
     search_fields = ['name', 'description']
     list_filter = ['city', 'time_periods']
-    filter_horizontal = ['time_periods', 'related_figures']
\ No newline at end of file
+    filter_horizontal = ['time_periods', 'related_figures']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_after', 'finished_at']
+    search_fields = ['name', 'key']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'last_error']
\ No newline at end of file
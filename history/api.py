@@ -0,0 +1,227 @@
+"""
+Read-only JSON API, version 1.
+
+    /api/v1/<resource>/            periods, figures or sites, cursor-paginated
+    /api/v1/<resource>/<pk>/
+
+`?fields=a,b` limits the columns loaded (via .only()) and returned, and
+`?include=rel` embeds related objects fetched in one batched query per
+relation. Every response carries a strong ETag and Last-Modified taken from
+the ContentVersion rows of the models involved, so a conditional GET is
+answered with 304 after a single read of that small table.
+"""
+import hashlib
+from dataclasses import dataclass, field
+
+from django.db.models import Prefetch
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+from . import versions
+from .metrics import query_budget
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+from .pagination import paginate
+from .routers import replica_reads
+
+
+@dataclass
+class Relation:
+    model: type
+    many: bool
+    # Columns the related queryset must load besides pk and name
+    join_fields: tuple = ()
+
+
+@dataclass
+class Resource:
+    model: type
+    fields: list
+    relations: dict = field(default_factory=dict)
+
+
+RESOURCES = {
+    'periods': Resource(
+        TimePeriod,
+        ['id', 'name', 'start_year', 'end_year', 'description', 'image', 'created_at', 'updated_at'],
+        {
+            'figures': Relation(HistoricalFigure, many=True, join_fields=('time_period',)),
+            'sites': Relation(HistoricalSite, many=True),
+        },
+    ),
+    'figures': Resource(
+        HistoricalFigure,
+        ['id', 'name', 'birth_year', 'death_year', 'biography', 'role', 'time_period',
+         'image', 'created_at', 'updated_at'],
+        {
+            'time_period': Relation(TimePeriod, many=False),
+            'sites': Relation(HistoricalSite, many=True),
+        },
+    ),
+    'sites': Resource(
+        HistoricalSite,
+        ['id', 'name', 'city', 'built_year', 'latitude', 'longitude', 'description', 'image', 'created_at', 'updated_at'],
+        {
+            'time_periods': Relation(TimePeriod, many=True),
+            'related_figures': Relation(HistoricalFigure, many=True),
+        },
+    ),
+}
+RESOURCE_NAMES = {resource.model: name for name, resource in RESOURCES.items()}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _resource(name):
+    if name not in RESOURCES:
+        raise Http404
+    return RESOURCES[name]
+
+
+def _requested(request, key, allowed):
+    value = request.GET.get(key)
+    if not value:
+        return None
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise BadRequest(f"Unknown {key}: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return names
+
+
+def _queryset(resource, fields, includes):
+    model = resource.model
+    queryset = model.objects.all()
+    columns = {'pk', model._meta.ordering[0]}
+    columns.update('pk' if name == 'id' else name for name in fields)
+    # A deferred foreign key would be loaded row by row to match the prefetch
+    columns.update(
+        model._meta.get_field(name).attname
+        for name in includes if model._meta.get_field(name).many_to_one
+    )
+    queryset = queryset.only(*columns)
+    for name in includes:
+        relation = resource.relations[name]
+        related = relation.model.objects.only('pk', 'name', *relation.join_fields)
+        queryset = queryset.prefetch_related(Prefetch(name, queryset=related))
+    return queryset
+
+
+def _detail_url(model, pk):
+    return reverse('history:api_detail', args=[RESOURCE_NAMES[model], pk])
+
+
+def _summary(obj):
+    return {'id': obj.pk, 'name': obj.name, 'url': _detail_url(type(obj), obj.pk)}
+
+
+def _value(obj, name):
+    if name == 'id':
+        return obj.pk
+    if name == 'time_period':
+        return obj.time_period_id
+    value = getattr(obj, name)
+    if name == 'image':
+        return value.url if value else None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def serialize(resource, obj, fields, includes):
+    data = {name: _value(obj, name) for name in fields}
+    data['url'] = _detail_url(resource.model, obj.pk)
+    for name in includes:
+        if resource.relations[name].many:
+            data[name] = [_summary(related) for related in getattr(obj, name).all()]
+        else:
+            related = getattr(obj, name)
+            data[name] = _summary(related) if related is not None else None
+    return data
+
+
+def _validators(request, resource, includes):
+    """Strong ETag and Last-Modified from the versions of every model involved"""
+    models = [resource.model] + [resource.relations[name].model for name in includes]
+    stamps = versions.current(*models)
+    parts = [request.path, request.GET.urlencode()] + [f'{label}:{version}' for label, (version, _) in sorted(stamps.items())]
+    etag = '"' + hashlib.sha1('|'.join(parts).encode()).hexdigest() + '"'
+    changed = [changed_at for _, changed_at in stamps.values() if changed_at is not None]
+    last_modified = max(changed).timestamp() if changed else None
+    return etag, last_modified
+
+
+def _respond(request, etag, last_modified, build):
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(build(), json_dumps_params={'ensure_ascii': False})
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _parse(request, resource):
+    fields = _requested(request, 'fields', resource.fields) or resource.fields
+    includes = _requested(request, 'include', list(resource.relations)) or []
+    return fields, includes
+
+
+def _bad_request(exc):
+    return JsonResponse({'error': str(exc)}, status=400)
+
+
+@query_budget(5)
+@replica_reads
+@require_GET
+def resource_list(request, resource):
+    """Cursor-paginated list of periods, figures or sites"""
+    resource = _resource(resource)
+    try:
+        fields, includes = _parse(request, resource)
+    except BadRequest as exc:
+        return _bad_request(exc)
+
+    def build():
+        page = paginate(request, _queryset(resource, fields, includes))
+        base = request.build_absolute_uri(request.path)
+        return {
+            'data': [serialize(resource, obj, fields, includes) for obj in page],
+            'links': {
+                'next': base + page.next_query if page.has_next else None,
+                'previous': base + page.previous_query if page.has_previous else None,
+            },
+        }
+
+    etag, last_modified = _validators(request, resource, includes)
+    return _respond(request, etag, last_modified, build)
+
+
+@query_budget(5)
+@replica_reads
+@require_GET
+def resource_detail(request, resource, pk):
+    """One period, figure or site"""
+    resource = _resource(resource)
+    try:
+        fields, includes = _parse(request, resource)
+    except BadRequest as exc:
+        return _bad_request(exc)
+
+    def build():
+        obj = _queryset(resource, fields, includes).filter(pk=pk).first()
+        if obj is None:
+            raise Http404
+        return {'data': serialize(resource, obj, fields, includes)}
+
+    # The validators only track versions, so a missing object must not be answered with 304
+    conditional = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    if conditional and not resource.model.objects.filter(pk=pk).exists():
+        raise Http404
+    etag, last_modified = _validators(request, resource, includes)
+    return _respond(request, etag, last_modified, build)
@@ -0,0 +1,120 @@
+"""
+Async versions of the read-only pages, used when SERVER_MODE is 'asgi'.
+
+They mirror the views of the same name in views.py but fetch through the
+async ORM, so an uvicorn worker can keep serving other requests while one
+waits on the database or on a slow client. Every queryset is evaluated before
+rendering: templates run synchronously and must not touch the database.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import render
+
+from .facets import FIGURE_FACETS, SITE_FACETS, FacetedList
+from .graph import arelated_for
+from .metrics import query_budget
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, PeriodCard, FigureCard, SiteCard
+from .pagecache import cache_anonymous
+from .pagination import apaginate
+from .routers import replica_reads
+from .stats import ahomepage_context
+
+
+async def _aget_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def _arender(request, template_name, context):
+    # request.user loads the session and user lazily; do that in a thread
+    # rather than from inside the template
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return render(request, template_name, context)
+
+
+@query_budget(5)
+@replica_reads
+@cache_anonymous
+async def home(request):
+    """Home page with overview, served from the materialized statistics"""
+    return await _arender(request, 'history/home.html', await ahomepage_context())
+
+
+@query_budget(3)
+@replica_reads
+@cache_anonymous
+async def period_list(request):
+    """List all time periods"""
+    periods = await apaginate(request, PeriodCard.objects.all())
+    return await _arender(request, 'history/period_list.html', {'periods': periods, 'page': periods})
+
+
+@query_budget(5)
+@replica_reads
+@cache_anonymous
+async def period_detail(request, pk):
+    """Detail view for a specific period"""
+    period = await _aget_or_404(TimePeriod.objects.for_detail(), pk=pk)
+    context = {
+        'period': period,
+        'figures': period.figures.all(),
+        'sites': period.sites.all(),
+    }
+    return await _arender(request, 'history/period_detail.html', context)
+
+
+@query_budget(5)
+@replica_reads
+@cache_anonymous
+async def figure_list(request):
+    """List historical figures, narrowed by role and period"""
+    faceted = FacetedList(request, FigureCard.objects.all(), FIGURE_FACETS)
+    figures = await apaginate(request, faceted.queryset)
+    context = {'figures': figures, 'page': figures, 'facets': await faceted.afacet_groups()}
+    return await _arender(request, 'history/figure_list.html', context)
+
+
+@query_budget(7)
+@replica_reads
+@cache_anonymous
+async def figure_detail(request, pk):
+    """Detail view for a specific figure"""
+    figure = await _aget_or_404(HistoricalFigure.objects.for_detail(), pk=pk)
+    suggested = await arelated_for(figure)
+    context = {
+        'figure': figure,
+        'related_sites': figure.sites.all(),
+        'suggested_figures': suggested['figures'],
+        'suggested_sites': suggested['sites'],
+    }
+    return await _arender(request, 'history/figure_detail.html', context)
+
+
+@query_budget(5)
+@replica_reads
+@cache_anonymous
+async def site_list(request):
+    """List historical sites, narrowed by city and period"""
+    faceted = FacetedList(request, SiteCard.objects.all(), SITE_FACETS)
+    sites = await apaginate(request, faceted.queryset)
+    context = {'sites': sites, 'page': sites, 'facets': await faceted.afacet_groups()}
+    return await _arender(request, 'history/site_list.html', context)
+
+
+@query_budget(8)
+@replica_reads
+@cache_anonymous
+async def site_detail(request, pk):
+    """Detail view for a specific site"""
+    site = await _aget_or_404(HistoricalSite.objects.for_detail(), pk=pk)
+    suggested = await arelated_for(site)
+    context = {
+        'site': site,
+        'time_periods': site.time_periods.all(),
+        'related_figures': site.related_figures.all(),
+        'suggested_figures': suggested['figures'],
+        'suggested_sites': suggested['sites'],
+    }
+    return await _arender(request, 'history/site_detail.html', context)
@@ -0,0 +1,194 @@
+"""
+Instant name autocomplete across periods, figures and sites.
+
+/autocomplete/?q=samar answers from an index held in each worker's memory,
+without touching the database:
+
+    {"results": [{"kind": "site", "id": 3, "label": "Registan", "url": "/sites/3/"}]}
+
+Every name is folded by listing.name_key, the key the form pickers look names
+up by, so the spellings a visitor may type meet: "Xiva", "Khiva" and "Хива"
+all find each other. The index is a sorted list of folded keys, one per word
+of each name, searched with bisect.
+
+Each worker loads the index from the listing cards when it starts (wsgi.py,
+asgi.py). Saves and deletes made by the worker are applied to its own index
+by signal handlers. Changes made by other workers are noticed through the
+ContentVersion counters, checked at most every AUTOCOMPLETE_REFRESH_SECONDS:
+only the cards written since the last check are read back.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from . import versions
+from .listing import name_key
+from .metrics import query_budget, upkeep
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, PeriodCard, FigureCard, SiteCard
+from .routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+INDEXED = {TimePeriod: PeriodCard, HistoricalFigure: FigureCard, HistoricalSite: SiteCard}
+CARDS = {card_model.kind: card_model for card_model in INDEXED.values()}
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+# Keys read past the first match before giving up on finding better ones
+SCAN_LIMIT = 200
+
+
+def _keys(name):
+    """The folded name from each of its words on, so "temur" finds "Amir Temur" """
+    words = name_key(name).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    def __init__(self):
+        # keys is sorted; refs[i] is the (kind, pk, word position) the key came from
+        self.keys = []
+        self.refs = []
+        self.names = {}
+        self.counts = {kind: 0 for kind in CARDS}
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.stamp = None
+        self.since = None
+        self.checked_at = 0.0
+
+    def load(self):
+        """Read every name from the listing cards"""
+        entries, names, since = [], {}, None
+        for kind, card_model in CARDS.items():
+            for pk, name, updated_at in card_model.objects.values_list('pk', 'name', 'updated_at').iterator():
+                names[kind, pk] = name
+                entries.extend((key, (kind, pk, position)) for position, key in enumerate(_keys(name)))
+                since = updated_at if since is None else max(since, updated_at)
+        entries.sort()
+        with self.lock:
+            self.keys = [key for key, ref in entries]
+            self.refs = [ref for key, ref in entries]
+            self.names = names
+            self.counts = {kind: sum(1 for item in names if item[0] == kind) for kind in CARDS}
+            self.since = since
+            self.loaded = True
+
+    def add(self, kind, pk, name):
+        with self.lock:
+            if self.names.get((kind, pk)) == name:
+                return
+            self.remove(kind, pk)
+            self.names[kind, pk] = name
+            self.counts[kind] += 1
+            for position, key in enumerate(_keys(name)):
+                ref = (kind, pk, position)
+                index = bisect.bisect_right(self.keys, key)
+                self.keys.insert(index, key)
+                self.refs.insert(index, ref)
+
+    def remove(self, kind, pk):
+        with self.lock:
+            name = self.names.pop((kind, pk), None)
+            if name is None:
+                return
+            self.counts[kind] -= 1
+            for position, key in enumerate(_keys(name)):
+                index = bisect.bisect_left(self.keys, key)
+                while self.refs[index] != (kind, pk, position):
+                    index += 1
+                del self.keys[index]
+                del self.refs[index]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """[(kind, pk, name)] whose name, or a word of it onwards, starts with query"""
+        prefix = name_key(query)
+        if not prefix:
+            return []
+        found = {}
+        with self.lock:
+            index = bisect.bisect_left(self.keys, prefix)
+            end = min(index + SCAN_LIMIT, len(self.keys))
+            while index < end and self.keys[index].startswith(prefix):
+                kind, pk, position = self.refs[index]
+                # Matches on the start of the whole name come first
+                rank = (position > 0, self.keys[index])
+                if (kind, pk) not in found or rank < found[kind, pk]:
+                    found[kind, pk] = rank
+                index += 1
+            best = sorted(found.items(), key=lambda item: item[1])[:limit]
+            return [(kind, pk, self.names[kind, pk]) for (kind, pk), rank in best]
+
+    def refresh(self):
+        """Load the index, or apply the cards other workers changed since the last check"""
+        self.checked_at = time.monotonic()
+        stamp = versions.current(*INDEXED)
+        with upkeep():
+            if not self.loaded:
+                self.load()
+            elif stamp != self.stamp:
+                self.catch_up()
+        self.stamp = stamp
+
+    def catch_up(self):
+        since = self.since
+        for kind, card_model in CARDS.items():
+            cards = card_model.objects.all()
+            changed = cards.filter(updated_at__gte=since) if since is not None else cards
+            for pk, name, updated_at in changed.values_list('pk', 'name', 'updated_at'):
+                self.add(kind, pk, name)
+                self.since = updated_at if self.since is None else max(self.since, updated_at)
+            # A deletion elsewhere leaves the index with more names than cards; one list of pks finds them
+            if self.counts[kind] != cards.count():
+                live = set(cards.values_list('pk', flat=True))
+                for gone in [pk for item_kind, pk in self.names if item_kind == kind and pk not in live]:
+                    self.remove(kind, gone)
+
+    def ensure_fresh(self):
+        if not self.loaded or time.monotonic() - self.checked_at >= settings.AUTOCOMPLETE_REFRESH_SECONDS:
+            self.refresh()
+
+
+index = PrefixIndex()
+
+
+def warm():
+    """Build this worker's index before its first request"""
+    try:
+        index.refresh()
+    except DatabaseError:
+        # Not migrated yet, or the database is down: the first request loads it
+        logger.warning('Autocomplete index not loaded at startup', exc_info=True)
+
+
+def object_saved(instance):
+    if index.loaded:
+        index.add(INDEXED[type(instance)].kind, instance.pk, instance.name)
+
+
+def object_deleted(instance):
+    if index.loaded:
+        index.remove(INDEXED[type(instance)].kind, instance.pk)
+
+
+@query_budget(1)
+@replica_reads
+@require_GET
+def autocomplete(request):
+    """Name matches across all entities, as JSON"""
+    index.ensure_fresh()
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    results = [
+        {'kind': kind, 'id': pk, 'label': name, 'url': reverse(f'history:{kind}_detail', args=[pk])}
+        for kind, pk, name in index.search(request.GET.get('q', ''), limit)
+    ]
+    return JsonResponse({'results': results})
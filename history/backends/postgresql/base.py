@@ -0,0 +1,55 @@
+"""
+PostgreSQL backend that draws connections from a per-process pool.
+
+Settings are the stock backend's plus a POOL dict of ConnectionPool options
+(see history.pool). Run it with CONN_MAX_AGE = 0: Django then "closes" the
+connection at the end of each request, which returns it to the pool.
+"""
+from django.db.backends.postgresql import base, creation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel, is_psycopg3
+
+from ... import pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the test database in use
+        pool.close_all()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        settings = self.settings_dict
+        key = (self.alias, settings['NAME'], settings['HOST'], settings['PORT'], settings['USER'])
+        return pool.get_pool(key, **settings.get('POOL', {}))
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        if not is_psycopg3:
+            # Server-side prepared statements need psycopg 3
+            params.pop('prepare_threshold', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        opened = []
+
+        def connect():
+            opened.append(super(DatabaseWrapper, self).get_new_connection(conn_params))
+            return opened[0]
+
+        connection = self.pool.getconn(connect)
+        if not opened:
+            # The stock backend sets this when it opens a connection
+            level = self.settings_dict['OPTIONS'].get('isolation_level')
+            self.isolation_level = IsolationLevel.READ_COMMITTED if level is None else IsolationLevel(level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                broken = self.errors_occurred and not self.is_usable()
+                self.pool.putconn(self.connection, discard=broken)
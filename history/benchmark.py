@@ -0,0 +1,203 @@
+"""
+Benchmark harness: drive every URL in history/urls.py against a running server.
+
+Each URL gets a fixed number of GETs at a fixed concurrency over plain
+asyncio sockets. Latency percentiles and throughput are measured client-side.
+Query counts and per-worker RSS come from the X-Query-Count, X-Worker-Pid and
+X-Worker-RSS headers, which the server adds when METRICS_RESPONSE_HEADERS is
+on. Results are plain JSON, so runs from different commits can be compared
+offline with compare().
+"""
+import asyncio
+import statistics
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.urls import reverse
+
+from . import api, urls
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+
+# Views that change state on GET
+SKIP = {'logout'}
+QUERY_STRINGS = {
+    'search': 'q=samarkand',
+    'timeline': 'year=1400',
+    'timeline_data': 'start=1300&end=1500',
+    'site_nearby': 'lat=39.6547&lon=66.9758&radius=25',
+    'site_map': 'bbox=55.9,37.1,73.2,45.6&zoom=6',
+}
+MODEL_PREFIXES = {'period': TimePeriod, 'figure': HistoricalFigure, 'site': HistoricalSite}
+
+
+def benchmark_urls():
+    """(label, path) for every named route, filled in with sample objects"""
+    samples = {model: model.objects.order_by('pk').values_list('pk', flat=True).first() for model in MODEL_PREFIXES.values()}
+    found = []
+    for pattern in urls.urlpatterns:
+        name = pattern.name
+        if name is None or name in SKIP:
+            continue
+        converters = pattern.pattern.converters
+        if 'resource' in converters:
+            variants = [(f'{name}[{resource}]', {'resource': resource}, spec.model) for resource, spec in api.RESOURCES.items()]
+        else:
+            variants = [(name, {}, MODEL_PREFIXES.get(name.split('_')[0]))]
+        for label, kwargs, model in variants:
+            if 'pk' in converters:
+                if samples.get(model) is None:
+                    continue
+                kwargs['pk'] = samples[model]
+            path = reverse(f'history:{name}', kwargs=kwargs)
+            if name in QUERY_STRINGS:
+                path += '?' + QUERY_STRINGS[name]
+            found.append((label, path))
+    return found
+
+
+def session_cookie(username):
+    """A session cookie for an existing user, so login-only pages can be measured"""
+    user = get_user_model().objects.get(username=username)
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+def _request(host, path, cookie):
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}', 'User-Agent: heritage-benchmark', 'Connection: close']
+    if cookie:
+        lines.append(f'Cookie: {cookie}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+async def _fetch(host, port, request, timeout):
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    head = raw.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+    status = int(head[0].split()[1]) if head and head[0] else 0
+    headers = {}
+    for line in head[1:]:
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return status, elapsed, headers
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def _drive(base_url, path, requests, concurrency, cookie, timeout, workers):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    request = _request(parts.netloc, path, cookie)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, queries = [], {}, []
+
+    async def one():
+        async with semaphore:
+            try:
+                status, elapsed, headers = await _fetch(host, port, request, timeout)
+            except (OSError, asyncio.TimeoutError):
+                status, elapsed, headers = 0, None, {}
+        statuses[status] = statuses.get(status, 0) + 1
+        if elapsed is not None and status and status < 500:
+            latencies.append(elapsed)
+        if 'x-query-count' in headers:
+            queries.append(int(headers['x-query-count']))
+        if 'x-worker-pid' in headers:
+            pid = headers['x-worker-pid']
+            workers[pid] = max(workers.get(pid, 0), int(headers.get('x-worker-rss', 0)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    result = {
+        'path': path,
+        'requests': requests,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+    if latencies:
+        result.update({
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        })
+    if queries:
+        result['queries'] = {'min': min(queries), 'max': max(queries), 'mean': round(statistics.mean(queries), 2)}
+    return result
+
+
+def git_revision():
+    try:
+        completed = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def run(base_url, requests=100, concurrency=10, cookie=None, timeout=30.0, only=None, progress=None):
+    """Benchmark every route and return the JSON-ready report"""
+    workers = {}
+    results = {}
+    for label, path in benchmark_urls():
+        if only and label not in only:
+            continue
+        results[label] = asyncio.run(_drive(base_url, path, requests, concurrency, cookie, timeout, workers))
+        if progress:
+            progress(label, results[label])
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'base_url': base_url,
+        'requests': requests,
+        'concurrency': concurrency,
+        'authenticated': bool(cookie),
+        'dataset': {
+            'periods': TimePeriod.objects.count(),
+            'figures': HistoricalFigure.objects.count(),
+            'sites': HistoricalSite.objects.count(),
+        },
+        'urls': results,
+        'workers': {pid: {'rss_bytes': rss} for pid, rss in sorted(workers.items())},
+    }
+
+
+def compare(baseline, current, threshold=0.2):
+    """Lines describing p95 latency and query-count changes, worst first"""
+    changes = []
+    for label, now in current['urls'].items():
+        before = baseline['urls'].get(label)
+        if not before or 'p95_ms' not in before or 'p95_ms' not in now:
+            continue
+        ratio = now['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1.0
+        queries_before = before.get('queries', {}).get('max')
+        queries_now = now.get('queries', {}).get('max')
+        regressed = ratio > 1 + threshold or (
+            queries_before is not None and queries_now is not None and queries_now > queries_before
+        )
+        changes.append((regressed, ratio, (
+            f"{'REGRESSION ' if regressed else ''}{label}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms "
+            f"({(ratio - 1) * 100:+.0f}%), queries {queries_before} -> {queries_now}"
+        )))
+    changes.sort(key=lambda change: (not change[0], -change[1]))
+    return [line for _, _, line in changes], sum(1 for regressed, _, _ in changes if regressed)
@@ -0,0 +1,357 @@
+"""
+Streaming bulk import and export of the heritage catalogue.
+
+Records are JSON Lines (one object per line) or CSV rows with a `type` column
+of period, figure or site. Relations are written by name: a figure's
+`time_period`, and a site's `time_periods` and `related_figures` (a list in
+JSONL, `|`-separated in CSV). Imports buffer fixed-size batches and write them
+with bulk_create/bulk_update, resolving names through in-memory name -> pk
+maps. A record whose values do not fit its columns (a list for a year, a
+fraction, a role or city outside the choices) is reported and skipped.
+Exports stream through iterator(chunk_size=...).
+"""
+import csv
+import json
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import fragments, geo, graph, listing, pagecache, prerender, search, stats, versions
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+
+CSV_FIELDS = [
+    'type', 'name', 'start_year', 'end_year', 'birth_year', 'death_year', 'built_year',
+    'latitude', 'longitude', 'role', 'city', 'time_period', 'time_periods', 'related_figures', 'description', 'biography',
+]
+FIELDS = {
+    'period': ['name', 'start_year', 'end_year', 'description'],
+    'figure': ['name', 'birth_year', 'death_year', 'biography', 'role', 'time_period'],
+    'site': ['name', 'city', 'built_year', 'latitude', 'longitude', 'description'],
+}
+LIST_SEPARATOR = '|'
+MODELS = {'period': TimePeriod, 'figure': HistoricalFigure, 'site': HistoricalSite}
+ROLES = {value for value, _ in HistoricalFigure.ROLE_CHOICES}
+CITIES = {value for value, _ in HistoricalSite.CITY_CHOICES}
+# The range of an IntegerField on every supported database
+MAX_INTEGER = 2 ** 31 - 1
+
+
+class RecordError(ValueError):
+    """A record that cannot be imported"""
+
+
+def _number(value, field):
+    if value in (None, ''):
+        return None
+    # bool is an int, and lists or objects in JSONL have no number in them
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise RecordError(f'{field} must be a number, not {value!r}')
+    try:
+        number = float(value)
+    except ValueError:
+        raise RecordError(f'{field} must be a number, not {value!r}') from None
+    if not math.isfinite(number):
+        raise RecordError(f'{field} must be a number, not {value!r}')
+    return number
+
+
+def _integer(value, field):
+    number = _number(value, field)
+    if number is None:
+        return None
+    if not number.is_integer() or abs(number) > MAX_INTEGER:
+        raise RecordError(f'{field} must be a whole number, not {value!r}')
+    return int(number)
+
+
+def _choice(value, field, choices):
+    if value in (None, ''):
+        return 'other'
+    if value not in choices:
+        raise RecordError(f'unknown {field} {value!r}')
+    return value
+
+
+def _names(value, field):
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        return [name for name in value.split(LIST_SEPARATOR) if name]
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise RecordError(f'{field} must be a list of names, not {value!r}')
+    return value
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise RecordError(f'line {line_number}: {exc}') from exc
+
+
+def read_csv(stream):
+    for line_number, row in enumerate(csv.DictReader(stream), 2):
+        yield line_number, {key: value for key, value in row.items() if value != ''}
+
+
+class Importer:
+    """Buffer records per type and flush them in dependency order"""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.buffers = {'period': [], 'figure': [], 'site': []}
+        self.period_ids = dict(TimePeriod.objects.values_list('name', 'pk'))
+        self.figure_ids = dict(HistoricalFigure.objects.values_list('name', 'pk'))
+        self.site_ids = dict(HistoricalSite.objects.values_list('name', 'pk'))
+        self.created = {'period': 0, 'figure': 0, 'site': 0}
+        self.updated = {'period': 0, 'figure': 0, 'site': 0}
+        # pks written per type, for rebuild_derived()
+        self.imported = {'period': set(), 'figure': set(), 'site': set()}
+        self.skipped = []
+
+    def add(self, line_number, record):
+        kind = record.get('type')
+        if kind not in self.buffers:
+            raise RecordError(f'line {line_number}: unknown type {kind!r}')
+        if not record.get('name'):
+            raise RecordError(f'line {line_number}: missing name')
+        self.buffers[kind].append((line_number, record))
+        if len(self.buffers[kind]) >= self.batch_size:
+            self.flush(kind)
+
+    def flush(self, kind):
+        # Figures and sites refer to rows that may still be buffered
+        dependencies = {'period': [], 'figure': ['period'], 'site': ['period', 'figure']}
+        for dependency in dependencies[kind]:
+            if self.buffers[dependency]:
+                self.flush(dependency)
+        batch, self.buffers[kind] = self.buffers[kind], []
+        if batch:
+            getattr(self, f'_flush_{kind}s')(batch)
+
+    def finish(self):
+        for kind in ('period', 'figure', 'site'):
+            self.flush(kind)
+
+    def _split(self, model, ids, objects, fields):
+        now = timezone.now()
+        new, existing = [], []
+        for obj in objects:
+            pk = ids.get(obj.name)
+            if pk is None:
+                new.append(obj)
+            else:
+                obj.pk = pk
+                obj.updated_at = now
+                existing.append(obj)
+        model.objects.bulk_create(new, batch_size=self.batch_size)
+        model.objects.bulk_update(existing, fields + ['updated_at'], batch_size=self.batch_size)
+        for obj in new:
+            ids[obj.name] = obj.pk
+        return len(new), len(existing)
+
+    def _flush_periods(self, batch):
+        objects = []
+        for line_number, record in batch:
+            try:
+                start_year = _integer(record.get('start_year'), 'start_year')
+                if start_year is None:
+                    raise RecordError('missing start_year')
+                objects.append(TimePeriod(
+                    name=record['name'],
+                    start_year=start_year,
+                    end_year=_integer(record.get('end_year'), 'end_year'),
+                    description=record.get('description', ''),
+                ))
+            except RecordError as exc:
+                self.skipped.append(f'line {line_number}: {exc}')
+        created, updated = self._split(TimePeriod, self.period_ids, objects, FIELDS['period'][1:])
+        self.imported['period'].update(obj.pk for obj in objects)
+        self.created['period'] += created
+        self.updated['period'] += updated
+
+    def _flush_figures(self, batch):
+        objects = []
+        for line_number, record in batch:
+            try:
+                period_name = record.get('time_period')
+                period_id = self.period_ids.get(period_name) if isinstance(period_name, str) else None
+                if period_id is None:
+                    raise RecordError(f'unknown time period {period_name!r}')
+                objects.append(HistoricalFigure(
+                    name=record['name'],
+                    birth_year=_integer(record.get('birth_year'), 'birth_year'),
+                    death_year=_integer(record.get('death_year'), 'death_year'),
+                    biography=record.get('biography', ''),
+                    role=_choice(record.get('role'), 'role', ROLES),
+                    time_period_id=period_id,
+                ))
+            except RecordError as exc:
+                self.skipped.append(f'line {line_number}: {exc}')
+        fields = ['birth_year', 'death_year', 'biography', 'role', 'time_period']
+        created, updated = self._split(HistoricalFigure, self.figure_ids, objects, fields)
+        self.imported['figure'].update(obj.pk for obj in objects)
+        self.created['figure'] += created
+        self.updated['figure'] += updated
+
+    def _flush_sites(self, batch):
+        objects, links = [], []
+        for line_number, record in batch:
+            try:
+                latitude = _number(record.get('latitude'), 'latitude')
+                longitude = _number(record.get('longitude'), 'longitude')
+                site = HistoricalSite(
+                    name=record['name'],
+                    city=_choice(record.get('city'), 'city', CITIES),
+                    built_year=_integer(record.get('built_year'), 'built_year'),
+                    latitude=latitude,
+                    longitude=longitude,
+                    geohash=geo.geohash_for(latitude, longitude),
+                    description=record.get('description', ''),
+                )
+                names = (
+                    _names(record.get('time_periods'), 'time_periods'),
+                    _names(record.get('related_figures'), 'related_figures'),
+                )
+            except RecordError as exc:
+                self.skipped.append(f'line {line_number}: {exc}')
+                continue
+            objects.append(site)
+            links.append((line_number, names))
+        created, updated = self._split(HistoricalSite, self.site_ids, objects, FIELDS['site'][1:] + ['geohash'])
+        self.imported['site'].update(obj.pk for obj in objects)
+        self.created['site'] += created
+        self.updated['site'] += updated
+
+        site_ids = [obj.pk for obj in objects]
+        period_links, figure_links = [], []
+        PeriodLink = HistoricalSite.time_periods.through
+        FigureLink = HistoricalSite.related_figures.through
+        for obj, (line_number, (period_names, figure_names)) in zip(objects, links):
+            for name in period_names:
+                if name in self.period_ids:
+                    period_links.append(PeriodLink(historicalsite_id=obj.pk, timeperiod_id=self.period_ids[name]))
+                else:
+                    self.skipped.append(f'line {line_number}: unknown time period {name!r}')
+            for name in figure_names:
+                if name in self.figure_ids:
+                    figure_links.append(FigureLink(historicalsite_id=obj.pk, historicalfigure_id=self.figure_ids[name]))
+                else:
+                    self.skipped.append(f'line {line_number}: unknown figure {name!r}')
+        # The file is authoritative for the relations of the sites it lists
+        PeriodLink.objects.filter(historicalsite_id__in=site_ids).delete()
+        FigureLink.objects.filter(historicalsite_id__in=site_ids).delete()
+        PeriodLink.objects.bulk_create(period_links, batch_size=self.batch_size, ignore_conflicts=True)
+        FigureLink.objects.bulk_create(figure_links, batch_size=self.batch_size, ignore_conflicts=True)
+
+
+def import_records(records, batch_size=1000):
+    """Import (line_number, record) pairs inside one transaction"""
+    with transaction.atomic():
+        importer = Importer(batch_size)
+        for line_number, record in records:
+            importer.add(line_number, record)
+        importer.finish()
+    return importer
+
+
+def rebuild_derived(imported, batch_size=1000):
+    """
+    Bulk writes skip model signals, so bring the derived data of the imported rows up to date
+
+    imported is Importer.imported, the pks written per type. Only their search
+    documents, cards and related content are rewritten, and only the pages
+    showing them purged.
+    """
+    models = [MODELS[kind] for kind, pks in imported.items() if pks]
+    if not models:
+        return
+    for kind, pks in imported.items():
+        search.index_objects(MODELS[kind], pks, batch_size)
+        listing.refresh_cards(MODELS[kind], pks, batch_size)
+        fragments.invalidate(MODELS[kind], pks)
+    stats.rebuild()
+    affected = graph.refresh_nodes({(kind, pk) for kind, pks in imported.items() for pk in pks})
+    versions.bump(*models)
+
+    paths = pagecache.detail_paths(affected)
+    for model in models:
+        paths.update(pagecache.pages_showing(graph.KINDS[model], ()))
+    pagecache.purge_paths(paths)
+    if settings.PRERENDER:
+        prerender.discard(paths)
+
+
+def export_records(batch_size=1000):
+    """Yield every period, figure and site as a plain record, streaming in chunks"""
+    period_names = dict(TimePeriod.objects.values_list('pk', 'name'))
+    figure_names = dict(HistoricalFigure.objects.values_list('pk', 'name'))
+
+    periods = TimePeriod.objects.order_by('pk').values(*FIELDS['period'])
+    for row in periods.iterator(chunk_size=batch_size):
+        yield {'type': 'period', **row}
+
+    figures = HistoricalFigure.objects.order_by('pk').values(
+        'name', 'birth_year', 'death_year', 'biography', 'role', 'time_period_id',
+    )
+    for row in figures.iterator(chunk_size=batch_size):
+        row['time_period'] = period_names.get(row.pop('time_period_id'))
+        yield {'type': 'figure', **row}
+
+    sites = HistoricalSite.objects.order_by('pk').values('pk', *FIELDS['site'])
+    chunk = []
+    for row in sites.iterator(chunk_size=batch_size):
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            yield from _site_records(chunk, period_names, figure_names)
+            chunk = []
+    yield from _site_records(chunk, period_names, figure_names)
+
+
+def _site_records(chunk, period_names, figure_names):
+    if not chunk:
+        return
+    site_ids = [row['pk'] for row in chunk]
+    periods, figures = {}, {}
+    links = HistoricalSite.time_periods.through.objects.filter(historicalsite_id__in=site_ids)
+    for site_id, period_id in links.values_list('historicalsite_id', 'timeperiod_id'):
+        periods.setdefault(site_id, []).append(period_names[period_id])
+    links = HistoricalSite.related_figures.through.objects.filter(historicalsite_id__in=site_ids)
+    for site_id, figure_id in links.values_list('historicalsite_id', 'historicalfigure_id'):
+        figures.setdefault(site_id, []).append(figure_names[figure_id])
+    for row in chunk:
+        pk = row.pop('pk')
+        yield {
+            'type': 'site',
+            **row,
+            'time_periods': periods.get(pk, []),
+            'related_figures': figures.get(pk, []),
+        }
+
+
+def write_jsonl(records, stream):
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(records, stream):
+    writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for record in records:
+        row = dict(record)
+        for key in ('time_periods', 'related_figures'):
+            if key in row:
+                row[key] = LIST_SEPARATOR.join(row[key])
+        writer.writerow(row)
+        count += 1
+    return count
@@ -0,0 +1,142 @@
+"""
+Faceted filtering of the figure and site lists.
+
+Figures can be narrowed by ?role= and ?period=, sites by ?city= and ?period=
+(the admin's list_filters). Parameters can be repeated: values of one facet
+are ORed, different facets are ANDed. Each facet lists every choice with the
+number of results it would give alongside the other facets' selections, so
+choosing it never leads to an empty page unexpectedly. The counts of a facet
+come from one grouped query over the listing cards, which the composite
+(facet column, list order) indexes from migration 0013 keep cheap.
+"""
+from django.db.models import Count, Q
+
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+from .pagination import MAX_PK
+
+
+class ChoiceFacet:
+    """A facet over a card column holding one of a model field's choices"""
+
+    def __init__(self, param, label, column, choices):
+        self.param = param
+        self.label = label
+        self.column = column
+        self.choices = choices
+
+    def parse(self, values):
+        known = dict(self.choices)
+        return sorted({value for value in values if value in known})
+
+    def filter(self, queryset, selected):
+        return queryset.filter(**{f'{self.column}__in': selected})
+
+    def counts(self, queryset):
+        """(value, count) rows for the results in queryset"""
+        return queryset.order_by().values_list(self.column).annotate(count=Count('pk'))
+
+    def options(self, rows):
+        counts = dict(rows)
+        return [(value, label, counts.get(value, 0)) for value, label in self.choices]
+
+
+class PeriodFacet:
+    """A facet over the time periods, in chronological order"""
+
+    def __init__(self, lookup, relation):
+        self.param = 'period'
+        self.label = 'Time Period'
+        # Card lookup matching a list of period pks, and the reverse relation from TimePeriod
+        self.lookup = lookup
+        self.relation = relation
+
+    def parse(self, values):
+        selected = set()
+        for value in values:
+            try:
+                pk = int(value)
+            except ValueError:
+                continue
+            # Out of range values could never match and overflow the database's integers
+            if 0 < pk <= MAX_PK:
+                selected.add(pk)
+        return sorted(selected)
+
+    def filter(self, queryset, selected):
+        matching = queryset.model.objects.filter(**{self.lookup: selected}).values('pk')
+        return queryset.filter(pk__in=matching)
+
+    def counts(self, queryset):
+        """(pk, name, count) rows for every period, counting the results in queryset"""
+        found = Count(self.relation, filter=Q(**{f'{self.relation}__in': queryset.values('pk')}))
+        return TimePeriod.objects.order_by('start_year', 'pk').values_list('pk', 'name').annotate(count=found)
+
+    def options(self, rows):
+        return [(str(pk), name, count) for pk, name, count in rows]
+
+
+FIGURE_FACETS = (
+    ChoiceFacet('role', 'Role', 'role_code', HistoricalFigure.ROLE_CHOICES),
+    PeriodFacet('time_period__in', 'figure_cards'),
+)
+SITE_FACETS = (
+    ChoiceFacet('city', 'City', 'city_code', HistoricalSite.CITY_CHOICES),
+    PeriodFacet('site__time_periods__in', 'sites'),
+)
+
+
+class FacetedList:
+    """The filtered queryset of a list page and the grouped count queries for its facets"""
+
+    def __init__(self, request, queryset, facets):
+        self.params = request.GET.copy()
+        self.params.pop('after', None)
+        self.params.pop('before', None)
+        self.facets = facets
+        self.selected = {facet.param: facet.parse(request.GET.getlist(facet.param)) for facet in facets}
+        self.queryset = self._filtered(queryset)
+        # A facet's counts ignore its own selection, so its other choices stay visible
+        self.count_queries = [facet.counts(self._filtered(queryset, skip=facet)) for facet in facets]
+
+    def _filtered(self, queryset, skip=None):
+        for facet in self.facets:
+            if facet is not skip and self.selected[facet.param]:
+                queryset = facet.filter(queryset, self.selected[facet.param])
+        return queryset
+
+    def _url(self, param, values):
+        params = self.params.copy()
+        params.setlist(param, values)
+        query = params.urlencode()
+        return f'?{query}' if query else '?'
+
+    def groups(self, results):
+        """Template context for each facet, from the rows of its count query"""
+        groups = []
+        for facet, rows in zip(self.facets, results):
+            selected = [str(value) for value in self.selected[facet.param]]
+            options = []
+            for value, label, count in facet.options(rows):
+                chosen = value in selected
+                toggled = [other for other in selected if other != value] if chosen else selected + [value]
+                options.append({
+                    'label': label,
+                    'count': count,
+                    'selected': chosen,
+                    'url': self._url(facet.param, toggled),
+                })
+            groups.append({
+                'label': facet.label,
+                'options': options,
+                'clear_url': self._url(facet.param, []) if selected else None,
+            })
+        return groups
+
+    def facet_groups(self):
+        return self.groups([list(rows) for rows in self.count_queries])
+
+    async def afacet_groups(self):
+        results = []
+        for rows in self.count_queries:
+            results.append([row async for row in rows])
+        return self.groups(results)
@@ -1,5 +1,6 @@
 from django import forms
 from .models import HistoricalFigure, TimePeriod, HistoricalSite
+from .widgets import LookupSelect, LookupSelectMultiple
 
 
 class HistoricalFigureForm(forms.ModelForm):
@@ -12,7 +13,7 @@ class HistoricalFigureForm(forms.ModelForm):
             'death_year': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g., 1405'}),
             'biography': forms.Textarea(attrs={'class': 'form-control', 'rows': 5, 'placeholder': 'Write biography...'}),
             'role': forms.Select(attrs={'class': 'form-control'}),
-            'time_period': forms.Select(attrs={'class': 'form-control'}),
+            'time_period': LookupSelect('periods', attrs={'class': 'form-control'}),
             'image': forms.FileInput(attrs={'class': 'form-control'}),
         }
 
@@ -33,13 +34,15 @@ class TimePeriodForm(forms.ModelForm):
 class HistoricalSiteForm(forms.ModelForm):
     class Meta:
         model = HistoricalSite
-        fields = ['name', 'city', 'built_year', 'description', 'time_periods', 'related_figures', 'image']
+        fields = ['name', 'city', 'built_year', 'latitude', 'longitude', 'description', 'time_periods', 'related_figures', 'image']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g., Registan Square'}),
             'city': forms.Select(attrs={'class': 'form-control'}),
             'built_year': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g., 1420'}),
+            'latitude': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'placeholder': 'e.g., 39.6547'}),
+            'longitude': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'placeholder': 'e.g., 66.9758'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 5, 'placeholder': 'Describe this site...'}),
-            'time_periods': forms.CheckboxSelectMultiple(),
-            'related_figures': forms.CheckboxSelectMultiple(),
+            'time_periods': LookupSelectMultiple('periods', attrs={'class': 'form-control'}),
+            'related_figures': LookupSelectMultiple('figures', attrs={'class': 'form-control'}),
             'image': forms.FileInput(attrs={'class': 'form-control'}),
         }
\ No newline at end of file
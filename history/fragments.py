@@ -0,0 +1,73 @@
+"""
+Cache of rendered list cards.
+
+Cards are rendered from the listing projection (history/listing.py). Each is
+stored under (kind, variant, pk) together with the card row's updated_at
+marker, so a stale entry is never served even if an invalidation was missed.
+A whole list is fetched with one get_many and only the missing cards are
+rendered.
+"""
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATES = {
+    'period': 'history/cards/period_card.html',
+    'figure': 'history/cards/figure_card.html',
+    'site': 'history/cards/site_card.html',
+}
+# Card kind of each source model, for invalidation
+KINDS = {
+    'timeperiod': 'period',
+    'historicalfigure': 'figure',
+    'historicalsite': 'site',
+}
+VARIANTS = ('list', 'home')
+
+
+def fragment_cache():
+    return caches['fragments']
+
+
+def card_key(kind, pk, variant):
+    return f'card:{kind}:{variant}:{pk}'
+
+
+def _marker(card):
+    return card.updated_at.isoformat() if card.updated_at else ''
+
+
+def render_card(card, variant):
+    return render_to_string(CARD_TEMPLATES[card.kind], {card.kind: card, 'variant': variant})
+
+
+def render_cards(cards, variant='list'):
+    """Render a list of cards, reusing cached fragments where they are current"""
+    cards = list(cards)
+    keys = [card_key(card.kind, card.pk, variant) for card in cards]
+    cache = fragment_cache()
+    cached = cache.get_many(keys)
+
+    fragments, missing = [], {}
+    for key, card in zip(keys, cards):
+        marker = _marker(card)
+        entry = cached.get(key)
+        if entry is not None and entry[0] == marker:
+            fragments.append(entry[1])
+            continue
+        fragment = render_card(card, variant)
+        missing[key] = (marker, fragment)
+        fragments.append(fragment)
+
+    if missing:
+        cache.set_many(missing)
+    return mark_safe(''.join(fragments))
+
+
+def invalidate(model, pks):
+    """Drop every cached card variant for the given objects"""
+    pks = list(pks)
+    if not pks:
+        return
+    kind = KINDS[model._meta.model_name]
+    fragment_cache().delete_many([card_key(kind, pk, variant) for pk in pks for variant in VARIANTS])
@@ -0,0 +1,198 @@
+"""
+Site coordinates: geohashes, nearby sites and clustered map markers.
+
+A site's latitude and longitude are stored with their geohash (precision 9,
+about 5 m), which a pre_save handler keeps in step and migration 0015
+indexes. A geohash cell is a prefix: every site inside it has a geohash from
+the prefix up to the prefix followed by '{' (the character after 'z'), so
+reading a cell is one range scan of a plain B-tree index, the same on SQLite
+and PostgreSQL without PostGIS.
+
+A radius query reads the 3x3 block of cells around the point at the finest
+precision whose block still covers the radius, then measures great-circle
+distances in Python. Blocks do not wrap over the poles, so when none covers
+the radius (near a pole, or a wide radius at high latitude) every placed site
+is measured instead. A k-nearest query moves to coarser cells until k sites
+lie within the distance its block is sure to cover.
+
+Map markers cluster the sites sharing a geohash cell, finer as the map zooms
+in. Clusters are computed per tile (a cell one precision coarser) and cached
+under the site ContentVersion, so every viewport at a zoom level reuses them.
+"""
+import math
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import versions
+from .models import HistoricalSite
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+# Sorts after every geohash character, closing a cell's range
+RANGE_END = '{'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Where a k-nearest search starts: cells of about 5 km
+NEAREST_PRECISION = 5
+MAX_TILES = 64
+MAX_RADIUS_KM = 1000
+NEARBY_FIELDS = ('pk', 'name', 'city', 'latitude', 'longitude')
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """The geohash of a point"""
+    latitudes, longitudes = [-90.0, 90.0], [-180.0, 180.0]
+    chars, value, bits, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (longitudes, longitude) if even else (latitudes, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            value, bits = 0, 0
+    return ''.join(chars)
+
+
+def geohash_for(latitude, longitude):
+    """The stored geohash of a site, '' without coordinates"""
+    if latitude is None or longitude is None:
+        return ''
+    return encode(latitude, longitude)
+
+
+def cell_size(precision):
+    """(height, width) of a cell in degrees"""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def covered_km(latitude, precision):
+    """How far from a point its 3x3 block of cells reaches in every direction"""
+    height, width = cell_size(precision)
+    # Cells are narrowest on the side nearer the pole
+    edge = min(abs(latitude) + height, 90)
+    return min(height, width * math.cos(math.radians(edge))) * KM_PER_DEGREE
+
+
+def block(latitude, longitude, precision):
+    """The cell holding a point and its eight neighbours"""
+    height, width = cell_size(precision)
+    cells = set()
+    for lat_step in (-height, 0, height):
+        cell_latitude = latitude + lat_step
+        if not -90 <= cell_latitude <= 90:
+            continue
+        for lon_step in (-width, 0, width):
+            cell_longitude = (longitude + lon_step + 180) % 360 - 180
+            cells.add(encode(cell_latitude, cell_longitude, precision))
+    return cells
+
+
+def in_cells(cells):
+    """Sites inside any of the cells, one index range each"""
+    condition = Q()
+    for cell in sorted(cells):
+        condition |= Q(geohash__gte=cell, geohash__lt=cell + RANGE_END)
+    return HistoricalSite.objects.filter(condition)
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance by the haversine formula"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _measured(latitude, longitude, sites):
+    """[(distance, row)] of NEARBY_FIELDS rows, nearest first"""
+    rows = sites.values_list(*NEARBY_FIELDS)
+    return sorted((distance_km(latitude, longitude, row[3], row[4]), row) for row in rows)
+
+
+def within(latitude, longitude, radius_km, limit):
+    """The sites at most radius_km from a point, nearest first"""
+    for precision in range(PRECISION, 0, -1):
+        if covered_km(latitude, precision) >= radius_km:
+            sites = in_cells(block(latitude, longitude, precision))
+            break
+    else:
+        # No block is sure to cover the radius: it would run over a pole, or
+        # its cells are too narrow this far north or south. Measure them all
+        sites = HistoricalSite.objects.exclude(geohash='')
+    found = _measured(latitude, longitude, sites)
+    return [(distance, row) for distance, row in found if distance <= radius_km][:limit]
+
+
+def nearest(latitude, longitude, count):
+    """The count sites nearest a point, widening the search until they are certain"""
+    for precision in range(NEAREST_PRECISION, 0, -1):
+        found = _measured(latitude, longitude, in_cells(block(latitude, longitude, precision)))
+        if len(found) >= count and found[count - 1][0] <= covered_km(latitude, precision):
+            return found[:count]
+    # Fewer than count sites within thousands of km: measure them all
+    return _measured(latitude, longitude, HistoricalSite.objects.exclude(geohash=''))[:count]
+
+
+def zoom_precision(zoom):
+    """The cluster cell size for a web map zoom level (0 = whole world)"""
+    return min(PRECISION - 1, max(1, (zoom * 2 + 6) // 5))
+
+
+def tiles(south, west, north, east, precision):
+    """The cells of a precision covering a bounding box; east < west crosses the antimeridian"""
+    height, width = cell_size(precision)
+    north = min(north, 90 - height / 2)
+    span = east - west if east >= west else east - west + 360
+    first_row = math.floor((south + 90) / height)
+    first_column = math.floor((west + 180) / width)
+    rows = math.floor((north + 90) / height) - first_row + 1
+    columns = min(math.floor((west + span + 180) / width) - first_column + 1, round(360 / width))
+    if rows * columns > MAX_TILES:
+        raise ValueError(f'the box needs more than {MAX_TILES} tiles at this zoom')
+    return {
+        encode((first_row + row + 0.5) * height - 90, ((first_column + column + 0.5) * width) % 360 - 180, precision)
+        for row in range(rows)
+        for column in range(columns)
+    }
+
+
+def _clusters(rows, precision):
+    groups = {}
+    for pk, latitude, longitude, geohash in rows:
+        group = groups.setdefault(geohash[:precision], [0, 0.0, 0.0, pk])
+        group[0] += 1
+        group[1] += latitude
+        group[2] += longitude
+    return [
+        [round(lat_sum / count, 5), round(lon_sum / count, 5), count, pk if count == 1 else None]
+        for count, lat_sum, lon_sum, pk in groups.values()
+    ]
+
+
+def markers(south, west, north, east, zoom):
+    """Compact [latitude, longitude, count, site pk or None] clusters for a map view"""
+    precision = zoom_precision(zoom)
+    tile_precision = max(1, precision - 1)
+    version, _ = versions.current(HistoricalSite)[HistoricalSite._meta.label_lower]
+    keys = {
+        tile: f'geo:tile:{version}:{precision}:{tile}'
+        for tile in tiles(south, west, north, east, tile_precision)
+    }
+    cached = cache.get_many(keys.values())
+    missing = {tile: [] for tile, key in keys.items() if key not in cached}
+    if missing:
+        for row in in_cells(missing).values_list('pk', 'latitude', 'longitude', 'geohash'):
+            missing[row[3][:tile_precision]].append(row)
+        computed = {keys[tile]: _clusters(rows, precision) for tile, rows in missing.items()}
+        cache.set_many(computed)
+        cached.update(computed)
+    return [marker for key in sorted(keys.values()) for marker in cached[key]]
@@ -0,0 +1,276 @@
+"""
+Precomputed "related content" across periods, figures and sites.
+
+Figures link to their period, and sites link to periods and figures, which
+together form one undirected graph. Graph holds it in compressed sparse row
+form (two flat arrays). For every node a RelatedContent row stores its direct
+neighbours and its highest-scoring figures and sites two hops away, so detail
+pages read one row instead of walking relations. A node reached through a
+shared figure or site scores 2 per path, through a shared period 1. After an
+edit only the nodes whose two-hop neighbourhood can have changed are
+recomputed, from the links around them (edges_around()); a hub's own
+suggestions are left to the next rebuild.
+"""
+from array import array
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, RelatedContent
+from .stats import ain_order, in_order
+
+RELATED_LIMIT = 6
+# Nodes with more links than this are hubs (a long period, say) and are not
+# walked through: they would cost the most and say the least
+HUB_LIMIT = 500
+WEIGHTS = {'period': 1, 'figure': 2, 'site': 2}
+BATCH_SIZE = 1000
+KINDS = {TimePeriod: 'period', HistoricalFigure: 'figure', HistoricalSite: 'site'}
+
+
+def node_label(node):
+    return f'{node[0]}:{node[1]}'
+
+
+def parse_label(label):
+    kind, pk = label.split(':')
+    return kind, int(pk)
+
+
+class Graph:
+    """Undirected graph over (kind, pk) nodes in CSR form"""
+
+    def __init__(self, edges):
+        pairs = []
+        for a, b in edges:
+            pairs.append((a, b))
+            pairs.append((b, a))
+        self.nodes = sorted({a for a, _ in pairs})
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        degree = [0] * (len(self.nodes) + 1)
+        for a, _ in pairs:
+            degree[self.index[a] + 1] += 1
+        for i in range(len(self.nodes)):
+            degree[i + 1] += degree[i]
+        self.offsets = array('l', degree)
+        self.targets = array('l', [0] * len(pairs))
+        fill = list(degree[:-1])
+        for a, b in pairs:
+            i = self.index[a]
+            self.targets[fill[i]] = self.index[b]
+            fill[i] += 1
+
+    def _neighbour_ids(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def neighbours(self, node):
+        i = self.index.get(node)
+        if i is None:
+            return []
+        return sorted(self.nodes[j] for j in self._neighbour_ids(i))
+
+    def related(self, node, limit=RELATED_LIMIT):
+        """Top figure and site pks two hops from node, excluding direct neighbours"""
+        i = self.index.get(node)
+        if i is None:
+            return {'figure': [], 'site': []}
+        direct = set(self._neighbour_ids(i))
+        scores = Counter()
+        for j in direct:
+            via = self.nodes[j]
+            if self.offsets[j + 1] - self.offsets[j] > HUB_LIMIT:
+                continue
+            for k in self._neighbour_ids(j):
+                if k != i and k not in direct:
+                    scores[k] += WEIGHTS[via[0]]
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.nodes[item[0]]))
+        found = {'figure': [], 'site': []}
+        for k, _ in ranked:
+            kind, pk = self.nodes[k]
+            if kind in found and len(found[kind]) < limit:
+                found[kind].append(pk)
+        return found
+
+    def row(self, node):
+        related = self.related(node)
+        return {
+            'neighbours': [node_label(n) for n in self.neighbours(node)],
+            'related_figures': related['figure'],
+            'related_sites': related['site'],
+        }
+
+
+def edges_from(figure_periods, site_periods, site_figures):
+    """Graph edges from (figure, period), (site, period) and (site, figure) pk pairs"""
+    for figure, period in figure_periods:
+        yield ('figure', figure), ('period', period)
+    for site, period in site_periods:
+        yield ('site', site), ('period', period)
+    for site, figure in site_figures:
+        yield ('site', site), ('figure', figure)
+
+
+def load_graph():
+    """Read the whole graph with three queries over integer columns"""
+    return Graph(edges_from(
+        HistoricalFigure.objects.order_by().values_list('pk', 'time_period_id').iterator(chunk_size=5000),
+        HistoricalSite.time_periods.through.objects.values_list('historicalsite_id', 'timeperiod_id')
+        .iterator(chunk_size=5000),
+        HistoricalSite.related_figures.through.objects.values_list('historicalsite_id', 'historicalfigure_id')
+        .iterator(chunk_size=5000),
+    ))
+
+
+def rebuild():
+    """Recompute every RelatedContent row"""
+    graph = load_graph()
+    rows = [RelatedContent(kind=kind, object_id=pk, **graph.row((kind, pk))) for kind, pk in graph.nodes]
+    with transaction.atomic():
+        RelatedContent.objects.all().delete()
+        RelatedContent.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def _by_kind(nodes):
+    """(kind, pks) batches of at most BATCH_SIZE nodes, for IN lookups"""
+    for kind in sorted({kind for kind, _ in nodes}):
+        pks = sorted(pk for node_kind, pk in nodes if node_kind == kind)
+        for start in range(0, len(pks), BATCH_SIZE):
+            yield kind, pks[start:start + BATCH_SIZE]
+
+
+def _stored_neighbours(nodes):
+    """{node: neighbours} as the RelatedContent rows of the nodes last recorded them"""
+    stored = {}
+    for kind, pks in _by_kind(nodes):
+        for row in RelatedContent.objects.filter(kind=kind, object_id__in=pks).only('kind', 'object_id', 'neighbours'):
+            stored[row.kind, row.object_id] = [parse_label(label) for label in row.neighbours]
+    return stored
+
+
+def edges_around(nodes):
+    """Every edge touching the nodes, with up to three queries per batch of them"""
+    nodes = sorted(nodes)
+    PeriodLink = HistoricalSite.time_periods.through
+    FigureLink = HistoricalSite.related_figures.through
+    edges = set()
+    for start in range(0, len(nodes), BATCH_SIZE):
+        batch = nodes[start:start + BATCH_SIZE]
+        periods, figures, sites = ([pk for kind, pk in batch if kind == wanted] for wanted in ('period', 'figure', 'site'))
+        figure_periods = site_periods = site_figures = ()
+        if periods or figures:
+            figure_periods = HistoricalFigure.objects.filter(
+                Q(pk__in=figures) | Q(time_period_id__in=periods),
+            ).values_list('pk', 'time_period_id')
+        if periods or sites:
+            site_periods = PeriodLink.objects.filter(
+                Q(historicalsite_id__in=sites) | Q(timeperiod_id__in=periods),
+            ).values_list('historicalsite_id', 'timeperiod_id')
+        if figures or sites:
+            site_figures = FigureLink.objects.filter(
+                Q(historicalsite_id__in=sites) | Q(historicalfigure_id__in=figures),
+            ).values_list('historicalsite_id', 'historicalfigure_id')
+        edges.update(edges_from(figure_periods, site_periods, site_figures))
+    return edges
+
+
+class Neighbourhood:
+    """The part of the graph around some nodes, read outwards as it is needed"""
+
+    def __init__(self):
+        self.edges = set()
+        self.adjacency = {}
+        # Nodes whose every link has been read
+        self.loaded = set()
+
+    def load(self, nodes):
+        missing = set(nodes) - self.loaded
+        for a, b in edges_around(missing) - self.edges:
+            self.edges.add((a, b))
+            self.adjacency.setdefault(a, set()).add(b)
+            self.adjacency.setdefault(b, set()).add(a)
+        self.loaded |= missing
+
+    def neighbours(self, node):
+        return self.adjacency.get(node, set())
+
+    def is_hub(self, node):
+        return len(self.neighbours(node)) > HUB_LIMIT
+
+
+def refresh(kind, pk):
+    """
+    Recompute the rows a change to one node's links can have affected, and return those nodes
+
+    The stored neighbour lists are the graph before the change. Every edge
+    that appeared or disappeared touches the node, so the affected nodes are
+    the node, its old and new neighbours, and the neighbours of those that
+    gained or lost the edge, unless that is a hub: Graph.related() does not
+    walk through hubs, so their other neighbours' suggestions cannot change.
+    Only the links of the affected nodes and of their neighbours are read.
+    """
+    return refresh_nodes({(kind, pk)})
+
+
+def refresh_nodes(nodes):
+    """refresh() for every node whose links changed, such as the rows of a bulk import"""
+    around = Neighbourhood()
+    around.load(nodes)
+    stored = _stored_neighbours(nodes)
+    changed, affected = set(), set(nodes)
+    for node in nodes:
+        old = set(stored.get(node, []))
+        new = around.neighbours(node)
+        changed |= old ^ new
+        affected |= old | new
+    around.load(changed)
+    walked = {endpoint for endpoint in changed if not around.is_hub(endpoint)}
+    for endpoint in walked:
+        affected |= around.neighbours(endpoint)
+    for neighbours in _stored_neighbours(walked).values():
+        affected.update(neighbours)
+
+    # A row needs the node's links and, for its suggestions, its neighbours' links
+    around.load(affected)
+    around.load({neighbour for node in affected if not around.is_hub(node) for neighbour in around.neighbours(node)})
+    graph = Graph(around.edges)
+    rows, hubs = [], []
+    for node in affected:
+        if node in graph.index and around.is_hub(node):
+            hubs.append(node)
+        elif node in graph.index:
+            rows.append(RelatedContent(kind=node[0], object_id=node[1], **graph.row(node)))
+    with transaction.atomic():
+        # Nodes left without links lose their row
+        for kind, pks in _by_kind(affected.difference(hubs)):
+            RelatedContent.objects.filter(kind=kind, object_id__in=pks).delete()
+        RelatedContent.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        # A hub's suggestions would need every neighbour's links: they wait for rebuild()
+        for kind, pk in hubs:
+            RelatedContent.objects.update_or_create(
+                kind=kind, object_id=pk, defaults={'neighbours': [node_label(n) for n in graph.neighbours((kind, pk))]},
+            )
+    return affected
+
+
+def related_for(instance):
+    """Related figures and sites for a detail page, in score order"""
+    row = RelatedContent.objects.filter(kind=KINDS[type(instance)], object_id=instance.pk).first()
+    if row is None:
+        return {'figures': [], 'sites': []}
+    return {
+        'figures': in_order(HistoricalFigure.objects.only('pk', 'name'), row.related_figures),
+        'sites': in_order(HistoricalSite.objects.only('pk', 'name'), row.related_sites),
+    }
+
+
+async def arelated_for(instance):
+    """Async version of related_for()"""
+    row = await RelatedContent.objects.filter(kind=KINDS[type(instance)], object_id=instance.pk).afirst()
+    if row is None:
+        return {'figures': [], 'sites': []}
+    return {
+        'figures': await ain_order(HistoricalFigure.objects.only('pk', 'name'), row.related_figures),
+        'sites': await ain_order(HistoricalSite.objects.only('pk', 'name'), row.related_sites),
+    }
@@ -0,0 +1,155 @@
+"""
+Responsive image derivatives.
+
+When an uploaded image changes, fixed-width thumbnails are generated with
+Pillow in the original family (JPEG, or PNG when the upload has transparency)
+plus WebP, and AVIF where the installed Pillow supports it. Their paths and
+dimensions are recorded in the object's `image_variants` field, which the
+{% responsive_image %} tag turns into <picture> sources with srcset/sizes.
+"""
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+QUALITY = {'JPEG': 82, 'WEBP': 80, 'AVIF': 60, 'PNG': None}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'AVIF': 'avif', 'PNG': 'png'}
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'AVIF': 'image/avif', 'PNG': 'image/png'}
+
+
+def modern_formats():
+    formats = ['WEBP']
+    if features.check('avif'):
+        formats.insert(0, 'AVIF')
+    return formats
+
+
+def needs_variants(instance):
+    """True when the stored variants do not describe the current image"""
+    source = instance.image.name if instance.image else ''
+    return (instance.image_variants or {}).get('source', '') != source
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _encode(image, image_format):
+    buffer = BytesIO()
+    options = {'optimize': True} if image_format in ('JPEG', 'PNG') else {}
+    if QUALITY[image_format] is not None:
+        options['quality'] = QUALITY[image_format]
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def delete_variants(storage, variants):
+    for variant in (variants or {}).get('variants', []):
+        storage.delete(variant['name'])
+
+
+def build_variants(field):
+    """Generate every derivative for an image field and describe them"""
+    storage = field.storage
+    with field.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+
+    fallback = 'PNG' if _has_alpha(image) else 'JPEG'
+    if fallback == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif fallback == 'PNG' and image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    directory, filename = posixpath.split(field.name)
+    stem = posixpath.splitext(filename)[0]
+    widths = [width for width in THUMBNAIL_WIDTHS if width < image.width] or [image.width]
+
+    variants = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for image_format in [fallback] + modern_formats():
+            name = posixpath.join(directory, 'variants', f'{stem}-{width}w.{EXTENSIONS[image_format]}')
+            if storage.exists(name):
+                storage.delete(name)
+            saved = storage.save(name, _encode(resized, image_format))
+            variants.append({
+                'name': saved,
+                'format': image_format,
+                'width': width,
+                'height': height,
+            })
+
+    return {
+        'source': field.name,
+        'width': image.width,
+        'height': image.height,
+        'fallback': fallback,
+        'variants': variants,
+    }
+
+
+def _variants_of_others(source, instance):
+    """image_variants of the other objects showing the same stored image"""
+    found = []
+    for model in (TimePeriod, HistoricalFigure, HistoricalSite):
+        others = model.objects.filter(image=source)
+        if model is type(instance):
+            others = others.exclude(pk=instance.pk)
+        found.extend(others.values_list('image_variants', flat=True))
+    return found
+
+
+def generate_variants(instance, reuse=True):
+    """Regenerate derivatives for an object and store their description"""
+    # Uploads are content-addressed, so several objects can share one image and its variants
+    previous = (instance.image_variants or {}).get('source')
+    if previous and not _variants_of_others(previous, instance):
+        delete_variants(instance._meta.get_field('image').storage, instance.image_variants)
+    description = {}
+    if instance.image:
+        shared = [
+            variants for variants in _variants_of_others(instance.image.name, instance)
+            if variants.get('source') == instance.image.name
+        ] if reuse else []
+        description = shared[0] if shared else build_variants(instance.image)
+    # update() keeps this out of post_save; touching updated_at retires cached cards
+    now = timezone.now()
+    type(instance).objects.filter(pk=instance.pk).update(image_variants=description, updated_at=now)
+    instance.image_variants = description
+    instance.updated_at = now
+    return description
+
+
+def picture_context(field, variants):
+    """Sources, srcset and intrinsic size for rendering one <picture>"""
+    storage = field.storage
+    by_format = {}
+    for variant in (variants or {}).get('variants', []):
+        by_format.setdefault(variant['format'], []).append(variant)
+
+    fallback = by_format.get((variants or {}).get('fallback'), [])
+    if not fallback:
+        return {'src': field.url, 'srcset': '', 'sources': [], 'width': None, 'height': None}
+
+    def srcset(entries):
+        return ', '.join(f"{storage.url(v['name'])} {v['width']}w" for v in entries)
+
+    largest = fallback[-1]
+    sources = [
+        {'type': MIME_TYPES[image_format], 'srcset': srcset(by_format[image_format])}
+        for image_format in ('AVIF', 'WEBP') if image_format in by_format
+    ]
+    return {
+        'src': storage.url(largest['name']),
+        'srcset': srcset(fallback),
+        'sources': sources,
+        'width': largest['width'],
+        'height': largest['height'],
+    }
@@ -0,0 +1,201 @@
+"""
+Listing projection: the narrow rows behind list pages, the timeline and home.
+
+Every period, figure and site has a card row (PeriodCard, FigureCard,
+SiteCard) that shares its primary key and holds only what its card shows:
+the display strings are already formatted and the <picture> sources and
+thumbnail URLs already resolved. List pages page through these rows in the
+same order as the source tables, by an index that carries every card column
+(INCLUDE on PostgreSQL), so descriptions and biographies are never read.
+
+Signals refresh a card when its object is saved, renaming a period rewrites
+the period name on its figures' cards, and the image task refreshes the card
+once the variants exist. Deleting an object cascades to its card.
+`manage.py rebuild_listing` recomputes every card.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from . import images
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, PeriodCard, FigureCard, SiteCard
+
+CARD_MODELS = {TimePeriod: PeriodCard, HistoricalFigure: FigureCard, HistoricalSite: SiteCard}
+# The source columns the cards are built from
+SOURCE_FIELDS = {
+    TimePeriod: ('name', 'start_year', 'end_year', 'description', 'image', 'image_variants'),
+    HistoricalFigure: ('name', 'birth_year', 'death_year', 'role', 'time_period_id', 'image', 'image_variants'),
+    HistoricalSite: ('name', 'city', 'built_year', 'image', 'image_variants'),
+}
+SUMMARY_WORDS = 30
+NAME_KEY_LENGTH = 200
+
+CYRILLIC = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh',
+    'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+    # Turkic Latin spellings
+    'ş': 'sh', 'ç': 'ch', 'ğ': 'g',
+    # The oʻ and gʻ apostrophe and its stand-ins
+    "'": '', 'ʻ': '', 'ʼ': '', '‘': '', '’': '', '`': '', '´': '',
+})
+# Uzbek Latin x and q are English kh and k
+SOUNDS = str.maketrans({'x': 'kh', 'q': 'k'})
+SEPARATORS = re.compile(r'[\W_]+')
+
+
+def _year(value):
+    return '' if value is None else str(value)
+
+
+def picture(instance):
+    if not instance.image:
+        return {}
+    return images.picture_context(instance.image, instance.image_variants)
+
+
+def period_values(period):
+    end = 'Present' if period.end_year is None else period.end_year
+    return {
+        'name': period.name,
+        'start_year': period.start_year,
+        'years': f'{period.start_year} - {end}',
+        'summary': Truncator(period.description).words(SUMMARY_WORDS),
+        'picture': picture(period),
+    }
+
+
+def figure_values(figure, period_name):
+    return {
+        'name': figure.name,
+        'birth_year': figure.birth_year,
+        'years': f'{_year(figure.birth_year)} - {_year(figure.death_year)}',
+        'role': figure.get_role_display(),
+        'period_name': period_name,
+        'picture': picture(figure),
+    }
+
+
+def site_values(site):
+    return {
+        'name': site.name,
+        'city': site.get_city_display(),
+        'built_year': site.built_year,
+        'picture': picture(site),
+    }
+
+
+def name_key(name):
+    """The spelling-insensitive form of a name or query, shared by the pickers and autocomplete
+
+    Case and accents are ignored, Uzbek Cyrillic is read as Latin, the o'/oʻ/o`
+    apostrophes are dropped, and x/kh and q/k are treated as the same letter,
+    so "Xiva", "Khiva" and "Хива" all find each other.
+    """
+    text = name.casefold().translate(CYRILLIC)
+    decomposed = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return SEPARATORS.sub(' ', text.translate(SOUNDS)).strip()
+
+
+def _card_key(name):
+    # Folding can lengthen a name (x becomes kh) past the column
+    return name_key(name)[:NAME_KEY_LENGTH]
+
+
+def _period_card(period):
+    return PeriodCard(period_id=period.pk, name_key=_card_key(period.name), **period_values(period))
+
+
+def _figure_card(figure, period_name):
+    return FigureCard(
+        figure_id=figure.pk, name_key=_card_key(figure.name), role_code=figure.role,
+        time_period_id=figure.time_period_id, **figure_values(figure, period_name),
+    )
+
+
+def _site_card(site):
+    return SiteCard(site_id=site.pk, name_key=_card_key(site.name), city_code=site.city, **site_values(site))
+
+
+def card_for(instance):
+    """An unsaved card describing the object as it is now"""
+    if isinstance(instance, TimePeriod):
+        return _period_card(instance)
+    if isinstance(instance, HistoricalFigure):
+        return _figure_card(instance, instance.time_period.name)
+    return _site_card(instance)
+
+
+def refresh(instance, created=False):
+    """Write the object's card, and the cards that show its name"""
+    card = card_for(instance)
+    card.save(force_insert=created)
+    # A new period has no figures yet
+    if isinstance(instance, TimePeriod) and not created:
+        FigureCard.objects.filter(figure__time_period=instance).update(
+            period_name=instance.name, updated_at=timezone.now(),
+        )
+    return card
+
+
+def cards(model, queryset):
+    """Cards of the objects a source queryset selects, in card order"""
+    return CARD_MODELS[model].objects.filter(pk__in=queryset.values('pk'))
+
+
+def _source(model):
+    return model.objects.only(*SOURCE_FIELDS[model])
+
+
+def refresh_cards(model, pks, batch_size=1000):
+    """Rewrite the cards of the given objects, a batch at a time, and the period names on figure cards"""
+    pks = sorted(pks)
+    for start in range(0, len(pks), batch_size):
+        chunk = pks[start:start + batch_size]
+        objects = list(_source(model).filter(pk__in=chunk))
+        if model is TimePeriod:
+            cards = [_period_card(period) for period in objects]
+        elif model is HistoricalFigure:
+            period_names = dict(TimePeriod.objects.filter(
+                pk__in={figure.time_period_id for figure in objects},
+            ).values_list('pk', 'name'))
+            cards = [_figure_card(figure, period_names[figure.time_period_id]) for figure in objects]
+        else:
+            cards = [_site_card(site) for site in objects]
+        with transaction.atomic():
+            CARD_MODELS[model].objects.filter(pk__in=chunk).delete()
+            CARD_MODELS[model].objects.bulk_create(cards)
+            if model is TimePeriod:
+                for period in objects:
+                    FigureCard.objects.filter(time_period=period).exclude(period_name=period.name).update(
+                        period_name=period.name, updated_at=timezone.now(),
+                    )
+
+
+def rebuild(batch_size=1000):
+    """Recompute every card from the source tables"""
+    period_names = dict(TimePeriod.objects.values_list('pk', 'name'))
+    periods = _source(TimePeriod)
+    figures = _source(HistoricalFigure)
+    sites = _source(HistoricalSite)
+    with transaction.atomic():
+        for card_model in CARD_MODELS.values():
+            card_model.objects.all().delete()
+        PeriodCard.objects.bulk_create(
+            (_period_card(period) for period in periods.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+        FigureCard.objects.bulk_create(
+            (_figure_card(figure, period_names[figure.time_period_id]) for figure in figures.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+        SiteCard.objects.bulk_create(
+            (_site_card(site) for site in sites.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+    return sum(card_model.objects.count() for card_model in CARD_MODELS.values())
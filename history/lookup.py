@@ -0,0 +1,46 @@
+"""
+Name lookups behind the related-object pickers on the edit forms.
+
+/lookup/<resource>/?q=sam returns the periods, figures or sites whose name
+starts with q, ignoring case, accents and the spellings listing.name_key folds
+together:
+
+    {"results": [{"id": 3, "label": "Registan (Samarkand)"}], "next": "?q=sam&after=..."}
+
+Matches are read from the listing cards through their name_key index, one
+keyset page at a time in name order, so a lookup costs the same whatever the
+size of the catalogue.
+"""
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from .listing import name_key
+from .metrics import query_budget
+from .models import PeriodCard, FigureCard, SiteCard
+from .pagination import paginate
+from .routers import replica_reads
+
+LOOKUPS = {
+    'periods': (PeriodCard, ('years',), lambda card: f'{card.name} ({card.years})'),
+    'figures': (FigureCard, ('years',), lambda card: f'{card.name} ({card.years})'),
+    'sites': (SiteCard, ('city',), lambda card: f'{card.name} ({card.city})'),
+}
+
+
+@query_budget(1)
+@replica_reads
+@require_GET
+def lookup(request, resource):
+    """Top name-prefix matches for a picker, as JSON"""
+    if resource not in LOOKUPS:
+        raise Http404(f'Unknown resource {resource!r}')
+    card_model, label_fields, label = LOOKUPS[resource]
+    queryset = card_model.objects.only('name', 'name_key', *label_fields)
+    prefix = name_key(request.GET.get('q', '').strip())
+    if prefix:
+        queryset = queryset.filter(name_key__startswith=prefix)
+    page = paginate(request, queryset, ordering='name_key')
+    return JsonResponse({
+        'results': [{'id': card.pk, 'label': label(card)} for card in page],
+        'next': page.next_query or None,
+    })
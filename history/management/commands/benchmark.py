@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from history import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Load-test every URL in history/urls.py against a running server and save the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per URL')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--user', help='Measure logged in as this existing user')
+        parser.add_argument('--only', nargs='+', help='Labels of the URLs to measure')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Baseline JSON file to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='p95 growth counted as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        cookie = benchmark.session_cookie(options['user']) if options['user'] else None
+
+        def progress(label, result):
+            queries = result.get('queries', {}).get('max', '-')
+            self.stdout.write(
+                f"{label:32} p50 {result.get('p50_ms', '-'):>8}ms  p95 {result.get('p95_ms', '-'):>8}ms  "
+                f"p99 {result.get('p99_ms', '-'):>8}ms  {result['throughput']:>8} req/s  "
+                f"queries {queries}  {result['statuses']}"
+            )
+
+        report = benchmark.run(
+            options['base_url'], requests=options['requests'], concurrency=options['concurrency'],
+            cookie=cookie, timeout=options['timeout'], only=options['only'], progress=progress,
+        )
+        if not report['workers']:
+            self.stderr.write('No X-Worker-* headers seen; start the server with METRICS_RESPONSE_HEADERS=True.')
+        for pid, worker in report['workers'].items():
+            self.stdout.write(f"worker {pid}: {worker['rss_bytes'] / 2 ** 20:.1f} MiB RSS")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}."))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as stream:
+                baseline = json.load(stream)
+            lines, regressions = benchmark.compare(baseline, report, options['threshold'])
+            self.stdout.write(f"Compared with {options['compare']} ({baseline.get('revision')}):")
+            for line in lines:
+                self.stdout.write(line)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} regressions')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from history import bulk
+
+
+class Command(BaseCommand):
+    help = 'Export periods, figures and sites as JSON Lines or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or '-' for stdout")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = self.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        writer = bulk.write_csv if file_format == 'csv' else bulk.write_jsonl
+        try:
+            count = writer(bulk.export_records(batch_size=options['batch_size']), stream)
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+        if path != '-':
+            self.stderr.write(self.style.SUCCESS(f'Exported {count} records to {path}.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from history import images, listing, pagecache, stats
+from history.models import TimePeriod, HistoricalFigure, HistoricalSite
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails and WebP/AVIF variants for images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        count = 0
+        for model in (TimePeriod, HistoricalFigure, HistoricalSite):
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True).iterator():
+                if options['force'] or images.needs_variants(instance):
+                    images.generate_variants(instance, reuse=not options['force'])
+                    listing.refresh(instance)
+                    pagecache.purge_object(instance)
+                    count += 1
+        stats.touch()
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {count} images.'))
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from history import bulk
+
+
+class Command(BaseCommand):
+    help = 'Import periods, figures and sites from a JSON Lines or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or '-' for stdin")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        reader = bulk.read_csv if file_format == 'csv' else bulk.read_jsonl
+        try:
+            importer = bulk.import_records(reader(stream), batch_size=options['batch_size'])
+        except (bulk.RecordError, ValueError) as exc:
+            raise CommandError(f'Import failed, nothing was saved: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        bulk.rebuild_derived(importer.imported, options['batch_size'])
+
+        for message in importer.skipped:
+            self.stderr.write(f'Skipped {message}')
+        for kind in ('period', 'figure', 'site'):
+            self.stdout.write(f'{kind}s: {importer.created[kind]} created, {importer.updated[kind]} updated')
+        self.stdout.write(self.style.SUCCESS('Import complete.'))
@@ -0,0 +1,18 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from history import prerender
+
+
+class Command(BaseCommand):
+    help = 'Render the public pages to static files for nginx, only those affected since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Rendering processes')
+        parser.add_argument('--full', action='store_true', help='Render every page, ignoring the last build')
+        parser.add_argument('--root', help='Output directory (default PRERENDER_ROOT)')
+
+    def handle(self, *args, **options):
+        rendered, removed = prerender.build(options['root'], workers=options['workers'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} pages, removed {removed}.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from history import listing
+
+
+class Command(BaseCommand):
+    help = 'Recompute the listing card of every period, figure and site'
+
+    def handle(self, *args, **options):
+        count = listing.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} listing cards.'))
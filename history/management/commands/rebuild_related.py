@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from history import graph
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed related content of every period, figure and site'
+
+    def handle(self, *args, **options):
+        count = graph.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt related content for {count} objects.'))
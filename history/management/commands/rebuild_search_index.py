@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from history import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for periods, figures and sites'
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} documents.'))
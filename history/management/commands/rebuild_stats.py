@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from history import stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized homepage statistics from scratch'
+
+    def handle(self, *args, **options):
+        result = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt homepage stats: {result}.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from history import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (image variants, search indexing, cache warming)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Worker started.')
+        try:
+            while True:
+                tasks.requeue_stale()
+                count = tasks.run_pending()
+                if count:
+                    self.stdout.write(f'Ran {count} jobs.')
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker stopped.')
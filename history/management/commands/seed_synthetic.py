@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from history import bulk, synthetic
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic catalogue for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periods', type=int, default=50)
+        parser.add_argument('--figures', type=int, default=2000)
+        parser.add_argument('--sites', type=int, default=1000)
+        parser.add_argument('--images', type=float, default=0.1, help='Share of objects given a generated photo')
+        parser.add_argument('--no-variants', action='store_true', help='Skip generating responsive image variants')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if min(options['periods'], options['figures'], options['sites']) < 0:
+            raise CommandError('--periods, --figures and --sites cannot be negative')
+        if options['periods'] == 0 and (options['figures'] or options['sites']):
+            raise CommandError('Figures and sites belong to periods: --periods must be at least 1')
+        records = synthetic.generate_records(
+            options['periods'], options['figures'], options['sites'], seed=options['seed'],
+        )
+        importer = bulk.import_records(records, batch_size=options['batch_size'])
+        pictured = synthetic.add_images(options['images'], seed=options['seed'], variants=not options['no_variants'])
+        for kind, pks in pictured.items():
+            importer.imported[kind].update(pks)
+        bulk.rebuild_derived(importer.imported, options['batch_size'])
+
+        for kind in ('period', 'figure', 'site'):
+            self.stdout.write(f'{kind}s: {importer.created[kind]} created, {importer.updated[kind]} updated')
+        self.stdout.write(f"images: {sum(len(pks) for pks in pictured.values())} generated")
+        self.stdout.write(self.style.SUCCESS('Synthetic catalogue ready.'))
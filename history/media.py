@@ -0,0 +1,94 @@
+"""
+Content-addressed uploads and media hand-off to nginx.
+
+Uploaded images are stored under the SHA-256 of their bytes
+(sites/3f/3f2a...c1.jpg), so a file name never changes content and the same
+image uploaded twice is stored once. Generated variants are named after
+their source, so they are shared as well; images.generate_variants only
+deletes them once no object uses the source any more.
+
+Public media is served by nginx straight from MEDIA_ROOT, with immutable
+cache headers for content-addressed names. Paths under a
+MEDIA_PROTECTED_PREFIXES prefix are routed to serve(), which checks access
+and hands the file back to nginx with X-Accel-Redirect, so Python never
+streams the bytes. Without nginx (MEDIA_ACCEL_REDIRECT off, the default
+under DEBUG) serve() sends the file itself.
+"""
+import hashlib
+import mimetypes
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models.fields.files import ImageField, ImageFieldFile
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.static import serve as static_serve
+
+CONTENT_ADDRESSED = re.compile(r'[0-9a-f]{64}')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        digest = content_digest(content)
+        extension = posixpath.splitext(name)[1].lower()
+        filename = f'{digest[:2]}/{digest}{extension}'
+        stored = self.field.generate_filename(self.instance, filename)
+        if not self.storage.exists(stored):
+            super().save(filename, content, save)
+            return
+        # The same bytes were uploaded before: point at that file
+        self.name = stored
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
+
+
+class ContentAddressedImageField(ImageField):
+    attr_class = ContentAddressedImageFieldFile
+
+
+def is_protected(path):
+    return path.startswith(tuple(settings.MEDIA_PROTECTED_PREFIXES))
+
+
+def authorize(request, path):
+    """Whether the request may read a media file; protected media needs a signed-in user"""
+    return not is_protected(path) or request.user.is_authenticated
+
+
+def cache_control(path):
+    if is_protected(path):
+        return 'private, max-age=3600'
+    if CONTENT_ADDRESSED.search(path):
+        return IMMUTABLE
+    return 'public, max-age=3600'
+
+
+def serve(request, path):
+    """Check access to a media file, then let nginx send it"""
+    if posixpath.normpath(path) != path or path.startswith(('/', '../')):
+        raise Http404('Invalid media path')
+    if not authorize(request, path):
+        return HttpResponseForbidden()
+    if settings.MEDIA_ACCEL_REDIRECT:
+        # nginx keeps this response's Content-Type and Cache-Control for the file
+        response = HttpResponse(content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_LOCATION + quote(path)
+    else:
+        response = static_serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = cache_control(path)
+    return response
@@ -0,0 +1,239 @@
+"""
+Per-view query and latency instrumentation.
+
+QueryMetricsMiddleware records, for every request, the query count, SQL time,
+duplicate queries (the same SQL issued more than once, the usual N+1
+signature) and the time spent outside SQL rendering the response. The numbers
+are aggregated into histograms per resolved URL name and exposed in the
+Prometheus text format at /metrics. Each gunicorn worker keeps its own
+histograms; the `pid` label tells them apart. Database connection pool
+counters (history/pool.py) are served alongside.
+
+A view's @query_budget covers its own queries. Upkeep done while it runs
+(jobs run inline with TASKS_EAGER, and rebuilding a per-process index or the
+stats row after a write) is recorded but not charged to the budget.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+from . import pool
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRICS = {
+    'heritage_view_queries': ('Number of SQL queries per request', QUERY_BUCKETS),
+    'heritage_view_duplicate_queries': ('Repeated SQL statements per request (N+1 signatures)', QUERY_BUCKETS),
+    'heritage_view_sql_seconds': ('Total SQL time per request', SECONDS_BUCKETS),
+    'heritage_view_render_seconds': ('Time per request spent outside SQL (view code and templates)', SECONDS_BUCKETS),
+    'heritage_view_duration_seconds': ('Total time per request', SECONDS_BUCKETS),
+}
+
+
+_upkeep = ContextVar('upkeep', default=False)
+
+
+def query_budget(limit, post=None):
+    """Declare the maximum number of queries a view may run, and for form views the maximum for a POST"""
+    def decorator(view):
+        view.query_budget = limit
+        view.post_query_budget = limit if post is None else post
+        return view
+    return decorator
+
+
+def budget_for(view, method):
+    """The query budget a view declares for a request method, None if it declares none"""
+    return getattr(view, 'post_query_budget' if method == 'POST' else 'query_budget', None)
+
+
+@contextmanager
+def upkeep():
+    """Queries that are not the request's own and do not count against its budget"""
+    token = _upkeep.set(True)
+    try:
+        yield
+    finally:
+        _upkeep.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    """Histograms keyed by metric name and view"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, metric, view, value):
+        with self.lock:
+            key = (metric, view)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(METRICS[metric][1])
+            self.histograms[key].observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        """Render all histograms in the Prometheus text exposition format"""
+        pid = os.getpid()
+        lines = []
+        with self.lock:
+            for metric, (help_text, _) in METRICS.items():
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for (name, view), histogram in sorted(self.histograms.items()):
+                    if name != metric:
+                        continue
+                    labels = f'view="{view}",pid="{pid}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.total}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts queries, SQL time and repeated statements"""
+
+    def __init__(self):
+        self.count = 0
+        self.upkeep = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.upkeep += _upkeep.get()
+            self.signatures[sql] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.signatures.values() if count > 1)
+
+
+def resident_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # No /proc (macOS): fall back to the peak RSS, which macOS reports in bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return 'unresolved'
+    return match.view_name
+
+
+def recording(recorder):
+    """Install the recorder on every database alias, so reads sent to a replica count too"""
+    stack = ExitStack()
+    for alias_connection in connections.all():
+        stack.enter_context(alias_connection.execute_wrapper(recorder))
+    return stack
+
+
+class QueryMetricsMiddleware:
+    """Record query counts and timings for every request, per URL name"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        self.observe(request, recorder, time.perf_counter() - start)
+        self.add_headers(response, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # Async views query from the request's sync_to_async thread, so the
+        # wrapper goes on that thread's connections, not the event loop's
+        stack = await sync_to_async(recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.observe(request, recorder, time.perf_counter() - start)
+        self.add_headers(response, recorder)
+        return response
+
+    def add_headers(self, response, recorder):
+        # For the benchmark harness; off in production
+        if settings.METRICS_RESPONSE_HEADERS:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Worker-Pid'] = str(os.getpid())
+            response['X-Worker-RSS'] = str(resident_bytes())
+
+    def observe(self, request, recorder, duration):
+        view = view_name(request)
+        registry.observe('heritage_view_queries', view, recorder.count)
+        registry.observe('heritage_view_duplicate_queries', view, recorder.duplicates)
+        registry.observe('heritage_view_sql_seconds', view, recorder.seconds)
+        registry.observe('heritage_view_render_seconds', view, max(duration - recorder.seconds, 0.0))
+        registry.observe('heritage_view_duration_seconds', view, duration)
+
+        budget = budget_for(getattr(request.resolver_match, 'func', None), request.method)
+        charged = recorder.count - recorder.upkeep
+        if budget is not None and charged > budget:
+            logger.warning('%s ran %d queries, over its budget of %d', view, charged, budget)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, reachable from METRICS_ALLOWED_IPS or by staff"""
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not (allowed or request.user.is_staff):
+        raise Http404
+    return HttpResponse(registry.render() + pool.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,107 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE history_searchdocument_fts USING fts5("
+    "title, body, content='history_searchdocument', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER history_searchdocument_ai AFTER INSERT ON history_searchdocument BEGIN "
+    "INSERT INTO history_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER history_searchdocument_ad AFTER DELETE ON history_searchdocument BEGIN "
+    "INSERT INTO history_searchdocument_fts(history_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER history_searchdocument_au AFTER UPDATE ON history_searchdocument BEGIN "
+    "INSERT INTO history_searchdocument_fts(history_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO history_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS history_searchdocument_au",
+    "DROP TRIGGER IF EXISTS history_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS history_searchdocument_ai",
+    "DROP TABLE IF EXISTS history_searchdocument_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX history_searchdocument_tsv ON history_searchdocument USING GIN (("
+    "setweight(to_tsvector('english'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, body), 'B')))",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS history_searchdocument_tsv",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+# The role and city labels as of this migration, which search.document_for puts first in the body
+ROLES = {
+    'ruler': 'Ruler/Khan', 'scientist': 'Scientist/Scholar', 'poet': 'Poet/Writer',
+    'warrior': 'Military Leader', 'architect': 'Architect/Builder', 'other': 'Other',
+}
+CITIES = {
+    'tashkent': 'Tashkent', 'samarkand': 'Samarkand', 'bukhara': 'Bukhara', 'khiva': 'Khiva',
+    'shahrisabz': 'Shahrisabz', 'termez': 'Termez', 'other': 'Other',
+}
+
+
+def populate_search_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('history', 'SearchDocument')
+    periods = apps.get_model('history', 'TimePeriod').objects.values_list('pk', 'name', 'description')
+    figures = apps.get_model('history', 'HistoricalFigure').objects.values_list('pk', 'name', 'role', 'biography')
+    sites = apps.get_model('history', 'HistoricalSite').objects.values_list('pk', 'name', 'city', 'description')
+    documents = [
+        SearchDocument(kind='period', object_id=pk, title=name, body=description)
+        for pk, name, description in periods.iterator()
+    ]
+    documents.extend(
+        SearchDocument(kind='figure', object_id=pk, title=name, body=f"{ROLES.get(role, role)}\n{biography}")
+        for pk, name, role, biography in figures.iterator()
+    )
+    documents.extend(
+        SearchDocument(kind='site', object_id=pk, title=name, body=f"{CITIES.get(city, city)}\n{description}")
+        for pk, name, city, description in sites.iterator()
+    )
+    SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0002_timeperiod_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('period', 'Time Period'), ('figure', 'Historical Figure'), ('site', 'Historical Site')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
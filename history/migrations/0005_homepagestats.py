@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+def populate_homepage_stats(apps, schema_editor):
+    HomepageStats = apps.get_model('history', 'HomepageStats')
+    TimePeriod = apps.get_model('history', 'TimePeriod')
+    HistoricalFigure = apps.get_model('history', 'HistoricalFigure')
+    HistoricalSite = apps.get_model('history', 'HistoricalSite')
+    HomepageStats.objects.create(
+        pk=1,
+        periods_count=TimePeriod.objects.count(),
+        figures_count=HistoricalFigure.objects.count(),
+        sites_count=HistoricalSite.objects.count(),
+        recent_figure_ids=list(HistoricalFigure.objects.order_by('-created_at').values_list('pk', flat=True)[:3]),
+        featured_site_ids=list(HistoricalSite.objects.order_by('name').values_list('pk', flat=True)[:3]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomepageStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periods_count', models.IntegerField(default=0)),
+                ('figures_count', models.IntegerField(default=0)),
+                ('sites_count', models.IntegerField(default=0)),
+                ('recent_figure_ids', models.JSONField(default=list)),
+                ('featured_site_ids', models.JSONField(default=list)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'homepage stats',
+            },
+        ),
+        migrations.RunPython(populate_homepage_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:20
+
+from django.db import migrations, models
+
+
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX history_timeperiod_span ON history_timeperiod USING GIST (("
+    "int4range(start_year, CASE WHEN end_year IS NULL THEN NULL "
+    "ELSE GREATEST(start_year, end_year) END, '[]')))",
+    "CREATE INDEX history_historicalfigure_span ON history_historicalfigure USING GIST (("
+    "int4range(LEAST(birth_year, death_year), GREATEST(birth_year, death_year), '[]'))) "
+    "WHERE birth_year IS NOT NULL OR death_year IS NOT NULL",
+    "CREATE INDEX history_historicalsite_span ON history_historicalsite USING GIST (("
+    "int4range(built_year, NULL, '[]'))) WHERE built_year IS NOT NULL",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS history_historicalsite_span",
+    "DROP INDEX IF EXISTS history_historicalfigure_span",
+    "DROP INDEX IF EXISTS history_timeperiod_span",
+]
+
+
+def create_range_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_range_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRESQL_REVERSE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0008_contentversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalfigure',
+            index=models.Index(fields=['birth_year', 'death_year'], name='figure_years'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalsite',
+            index=models.Index(fields=['built_year'], name='site_built_year'),
+        ),
+        migrations.AddIndex(
+            model_name='timeperiod',
+            index=models.Index(fields=['start_year', 'end_year'], name='period_years'),
+        ),
+        migrations.RunPython(create_range_indexes, drop_range_indexes),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+def populate_related_content(apps, schema_editor):
+    from history.graph import Graph, edges_from
+
+    RelatedContent = apps.get_model('history', 'RelatedContent')
+    HistoricalFigure = apps.get_model('history', 'HistoricalFigure')
+    HistoricalSite = apps.get_model('history', 'HistoricalSite')
+    graph = Graph(edges_from(
+        HistoricalFigure.objects.values_list('pk', 'time_period_id'),
+        HistoricalSite.time_periods.through.objects.values_list('historicalsite_id', 'timeperiod_id'),
+        HistoricalSite.related_figures.through.objects.values_list('historicalsite_id', 'historicalfigure_id'),
+    ))
+    RelatedContent.objects.bulk_create(
+        [RelatedContent(kind=kind, object_id=pk, **graph.row((kind, pk))) for kind, pk in graph.nodes],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0009_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('period', 'Time Period'), ('figure', 'Historical Figure'), ('site', 'Historical Site')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('neighbours', models.JSONField(default=list)),
+                ('related_figures', models.JSONField(default=list)),
+                ('related_sites', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name_plural': 'related content',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedcontent',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_related_content'),
+        ),
+        migrations.RunPython(populate_related_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,165 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:46
+
+from itertools import islice
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.text import Truncator
+
+
+BATCH_SIZE = 1000
+SUMMARY_WORDS = 30
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'AVIF': 'image/avif', 'PNG': 'image/png'}
+
+
+# Frozen copies of the listing and images helpers as of this migration
+def picture(instance):
+    if not instance.image:
+        return {}
+    field, variants = instance.image, instance.image_variants
+    storage = field.storage
+    by_format = {}
+    for variant in (variants or {}).get('variants', []):
+        by_format.setdefault(variant['format'], []).append(variant)
+    fallback = by_format.get((variants or {}).get('fallback'), [])
+    if not fallback:
+        return {'src': field.url, 'srcset': '', 'sources': [], 'width': None, 'height': None}
+
+    def srcset(entries):
+        return ', '.join(f"{storage.url(v['name'])} {v['width']}w" for v in entries)
+
+    largest = fallback[-1]
+    return {
+        'src': storage.url(largest['name']),
+        'srcset': srcset(fallback),
+        'sources': [
+            {'type': MIME_TYPES[image_format], 'srcset': srcset(by_format[image_format])}
+            for image_format in ('AVIF', 'WEBP') if image_format in by_format
+        ],
+        'width': largest['width'],
+        'height': largest['height'],
+    }
+
+
+def _year(value):
+    return '' if value is None else str(value)
+
+
+def period_values(period):
+    end = 'Present' if period.end_year is None else period.end_year
+    return {
+        'name': period.name,
+        'start_year': period.start_year,
+        'years': f'{period.start_year} - {end}',
+        'summary': Truncator(period.description).words(SUMMARY_WORDS),
+        'picture': picture(period),
+    }
+
+
+def figure_values(figure, period_name):
+    return {
+        'name': figure.name,
+        'birth_year': figure.birth_year,
+        'years': f'{_year(figure.birth_year)} - {_year(figure.death_year)}',
+        'role': figure.get_role_display(),
+        'period_name': period_name,
+        'picture': picture(figure),
+    }
+
+
+def site_values(site):
+    return {
+        'name': site.name,
+        'city': site.get_city_display(),
+        'built_year': site.built_year,
+        'picture': picture(site),
+    }
+
+
+def _create(model, cards):
+    cards = iter(cards)
+    batch = list(islice(cards, BATCH_SIZE))
+    while batch:
+        model.objects.bulk_create(batch)
+        batch = list(islice(cards, BATCH_SIZE))
+
+
+def populate_listing_cards(apps, schema_editor):
+    TimePeriod = apps.get_model('history', 'TimePeriod')
+    HistoricalFigure = apps.get_model('history', 'HistoricalFigure')
+    HistoricalSite = apps.get_model('history', 'HistoricalSite')
+    PeriodCard = apps.get_model('history', 'PeriodCard')
+    _create(PeriodCard, (
+        PeriodCard(period_id=period.pk, **period_values(period))
+        for period in TimePeriod.objects.iterator(chunk_size=BATCH_SIZE)
+    ))
+    period_names = dict(TimePeriod.objects.values_list('pk', 'name'))
+    FigureCard = apps.get_model('history', 'FigureCard')
+    _create(FigureCard, (
+        FigureCard(figure_id=figure.pk, **figure_values(figure, period_names[figure.time_period_id]))
+        for figure in HistoricalFigure.objects.iterator(chunk_size=BATCH_SIZE)
+    ))
+    SiteCard = apps.get_model('history', 'SiteCard')
+    _create(SiteCard, (
+        SiteCard(site_id=site.pk, **site_values(site))
+        for site in HistoricalSite.objects.iterator(chunk_size=BATCH_SIZE)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0010_relatedcontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteCard',
+            fields=[
+                ('site', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='history.historicalsite')),
+                ('name', models.CharField(max_length=200)),
+                ('city', models.CharField(max_length=50)),
+                ('built_year', models.IntegerField(blank=True, null=True)),
+                ('picture', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['name', 'site'], include=('city', 'built_year', 'picture', 'updated_at'), name='site_card_list')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PeriodCard',
+            fields=[
+                ('period', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='history.timeperiod')),
+                ('name', models.CharField(max_length=200)),
+                ('start_year', models.IntegerField()),
+                ('years', models.CharField(max_length=40)),
+                ('summary', models.TextField(blank=True)),
+                ('picture', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['start_year'],
+                'indexes': [models.Index(fields=['start_year', 'period'], include=('name', 'years', 'summary', 'picture', 'updated_at'), name='period_card_list')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FigureCard',
+            fields=[
+                ('figure', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='history.historicalfigure')),
+                ('name', models.CharField(max_length=200)),
+                ('birth_year', models.IntegerField(blank=True, null=True)),
+                ('years', models.CharField(max_length=40)),
+                ('role', models.CharField(max_length=50)),
+                ('period_name', models.CharField(max_length=200)),
+                ('picture', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['birth_year'],
+                'indexes': [models.Index(fields=['birth_year', 'figure'], include=('name', 'years', 'role', 'period_name', 'picture', 'updated_at'), name='figure_card_list')],
+            },
+        ),
+        migrations.RunPython(populate_listing_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:52
+
+from django.db import migrations
+import history.media
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0011_listing_cards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historicalfigure',
+            name='image',
+            field=history.media.ContentAddressedImageField(blank=True, null=True, upload_to='figures/'),
+        ),
+        migrations.AlterField(
+            model_name='historicalsite',
+            name='image',
+            field=history.media.ContentAddressedImageField(blank=True, null=True, upload_to='sites/'),
+        ),
+        migrations.AlterField(
+            model_name='timeperiod',
+            name='image',
+            field=history.media.ContentAddressedImageField(blank=True, null=True, upload_to='periods/'),
+        ),
+    ]
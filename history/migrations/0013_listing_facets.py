@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def populate_facet_columns(apps, schema_editor):
+    HistoricalFigure = apps.get_model('history', 'HistoricalFigure')
+    HistoricalSite = apps.get_model('history', 'HistoricalSite')
+    figure = HistoricalFigure.objects.filter(pk=OuterRef('pk'))
+    apps.get_model('history', 'FigureCard').objects.update(
+        role_code=Subquery(figure.values('role')[:1]),
+        time_period_id=Subquery(figure.values('time_period_id')[:1]),
+    )
+    site = HistoricalSite.objects.filter(pk=OuterRef('pk'))
+    apps.get_model('history', 'SiteCard').objects.update(city_code=Subquery(site.values('city')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0012_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='figurecard',
+            name='role_code',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='figurecard',
+            name='time_period',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='figure_cards', to='history.timeperiod'),
+        ),
+        migrations.AddField(
+            model_name='sitecard',
+            name='city_code',
+            field=models.CharField(default='', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_facet_columns, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='figurecard',
+            name='time_period',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='figure_cards', to='history.timeperiod'),
+        ),
+        migrations.AddIndex(
+            model_name='figurecard',
+            index=models.Index(fields=['role_code', 'birth_year', 'figure'], include=('name', 'years', 'role', 'period_name', 'picture', 'updated_at'), name='figure_card_role'),
+        ),
+        migrations.AddIndex(
+            model_name='figurecard',
+            index=models.Index(fields=['time_period', 'birth_year', 'figure'], include=('name', 'years', 'role', 'period_name', 'picture', 'updated_at'), name='figure_card_period'),
+        ),
+        migrations.AddIndex(
+            model_name='sitecard',
+            index=models.Index(fields=['city_code', 'name', 'site'], include=('city', 'built_year', 'picture', 'updated_at'), name='site_card_city'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:12
+
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+# listing.name_key as of this migration
+def name_key(name):
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def populate_name_keys(apps, schema_editor):
+    for model_name in ('PeriodCard', 'FigureCard', 'SiteCard'):
+        model = apps.get_model('history', model_name)
+        last = None
+        while True:
+            cards = model.objects.only('name').order_by('pk')
+            if last is not None:
+                cards = cards.filter(pk__gt=last)
+            cards = list(cards[:BATCH_SIZE])
+            if not cards:
+                break
+            for card in cards:
+                card.name_key = name_key(card.name)
+            model.objects.bulk_update(cards, ['name_key'])
+            last = cards[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0013_listing_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='figurecard',
+            name='name_key',
+            field=models.CharField(default='', max_length=200),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='periodcard',
+            name='name_key',
+            field=models.CharField(default='', max_length=200),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='sitecard',
+            name='name_key',
+            field=models.CharField(default='', max_length=200),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_name_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='figurecard',
+            index=models.Index(fields=['name_key'], name='figure_card_name', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='periodcard',
+            index=models.Index(fields=['name_key'], name='period_card_name', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='sitecard',
+            index=models.Index(fields=['name_key'], name='site_card_name', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:20
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0014_card_name_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsite',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='historicalsite',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='historicalsite',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddIndex(
+            model_name='historicalsite',
+            index=models.Index(fields=['geohash'], name='site_geohash'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:31
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# listing.name_key as of this migration
+CYRILLIC = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh',
+    'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+    'ş': 'sh', 'ç': 'ch', 'ğ': 'g',
+    "'": '', 'ʻ': '', 'ʼ': '', '‘': '', '’': '', '`': '', '´': '',
+})
+SOUNDS = str.maketrans({'x': 'kh', 'q': 'k'})
+SEPARATORS = re.compile(r'[\W_]+')
+
+
+def name_key(name):
+    text = name.casefold().translate(CYRILLIC)
+    decomposed = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return SEPARATORS.sub(' ', text.translate(SOUNDS)).strip()[:200]
+
+
+def fold_name_keys(apps, schema_editor):
+    for model_name in ('PeriodCard', 'FigureCard', 'SiteCard'):
+        model = apps.get_model('history', model_name)
+        last = None
+        while True:
+            cards = model.objects.only('name').order_by('pk')
+            if last is not None:
+                cards = cards.filter(pk__gt=last)
+            cards = list(cards[:BATCH_SIZE])
+            if not cards:
+                break
+            for card in cards:
+                card.name_key = name_key(card.name)
+            model.objects.bulk_update(cards, ['name_key'])
+            last = cards[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0015_site_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_name_keys, migrations.RunPython.noop),
+    ]
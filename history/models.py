@@ -1,5 +1,60 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connection
+from django.utils import timezone
+
+from .media import ContentAddressedImageField
+
+
+def catalogue_counts():
+    """Count periods, figures and sites in a single query"""
+    tables = [model._meta.db_table for model in (TimePeriod, HistoricalFigure, HistoricalSite)]
+    sql = 'SELECT ' + ', '.join(f'(SELECT COUNT(*) FROM {connection.ops.quote_name(table)})' for table in tables)
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        periods, figures, sites = cursor.fetchone()
+    return {'periods_count': periods, 'figures_count': figures, 'sites_count': sites}
+
+
+class TimePeriodQuerySet(models.QuerySet):
+    """Query plans for the period pages"""
+    
+    def for_detail(self):
+        return self.prefetch_related('figures', 'sites')
+    
+    def for_profile(self, user):
+        return self.filter(created_by=user).order_by('-created_at')
+
+
+class HistoricalFigureQuerySet(models.QuerySet):
+    """Query plans for the figure pages"""
+    
+    def for_list(self):
+        return self.select_related('time_period')
+    
+    def for_detail(self):
+        return self.select_related('time_period').prefetch_related('sites')
+    
+    def recent(self, limit=3):
+        return self.order_by('-created_at')[:limit]
+    
+    def for_profile(self, user):
+        return self.filter(created_by=user).order_by('-created_at')
+
+
+class HistoricalSiteQuerySet(models.QuerySet):
+    """Query plans for the site pages"""
+    
+    def for_detail(self):
+        return self.prefetch_related('time_periods', 'related_figures')
+    
+    def featured(self, limit=3):
+        return self.all()[:limit]
+    
+    def for_profile(self, user):
+        return self.filter(created_by=user).order_by('-created_at')
 
 
 class TimePeriod(models.Model):
@@ -8,12 +63,19 @@ class TimePeriod(models.Model):
     start_year = models.IntegerField()
     end_year = models.IntegerField(null=True, blank=True)  # null if ongoing
     description = models.TextField()
-    image = models.ImageField(upload_to='periods/', null=True, blank=True)
+    image = ContentAddressedImageField(upload_to='periods/', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = TimePeriodQuerySet.as_manager()
     
     class Meta:
         ordering = ['start_year']
+        indexes = [
+            models.Index(fields=['start_year', 'end_year'], name='period_years'),
+        ]
     
     def __str__(self):
         return self.name
@@ -36,12 +98,19 @@ class HistoricalFigure(models.Model):
     biography = models.TextField()
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='other')
     time_period = models.ForeignKey(TimePeriod, on_delete=models.CASCADE, related_name='figures')
-    image = models.ImageField(upload_to='figures/', null=True, blank=True)
+    image = ContentAddressedImageField(upload_to='figures/', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = HistoricalFigureQuerySet.as_manager()
     
     class Meta:
         ordering = ['birth_year']
+        indexes = [
+            models.Index(fields=['birth_year', 'death_year'], name='figure_years'),
+        ]
     
     def __str__(self):
         return self.name
@@ -62,15 +131,231 @@ class HistoricalSite(models.Model):
     name = models.CharField(max_length=200)
     city = models.CharField(max_length=20, choices=CITY_CHOICES)
     built_year = models.IntegerField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    geohash = models.CharField(max_length=12, blank=True, editable=False)  # geo.geohash_for(latitude, longitude)
     description = models.TextField()
     time_periods = models.ManyToManyField(TimePeriod, related_name='sites', blank=True)
     related_figures = models.ManyToManyField(HistoricalFigure, related_name='sites', blank=True)
-    image = models.ImageField(upload_to='sites/', null=True, blank=True)
+    image = ContentAddressedImageField(upload_to='sites/', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = HistoricalSiteQuerySet.as_manager()
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['built_year'], name='site_built_year'),
+            # Range scans over geohash cells (geo.in_cells)
+            models.Index(fields=['geohash'], name='site_geohash'),
+        ]
     
     def __str__(self):
-        return f"{self.name} ({self.city})"
\ No newline at end of file
+        return f"{self.name} ({self.city})"
+    
+    def clean(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError('Enter both latitude and longitude, or neither.')
+
+
+class SearchDocument(models.Model):
+    """Denormalized full-text search entry for a period, figure or site"""
+    KIND_CHOICES = [
+        ('period', 'Time Period'),
+        ('figure', 'Historical Figure'),
+        ('site', 'Historical Site'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=200)
+    body = models.TextField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind}: {self.title}"
+
+
+class HomepageStats(models.Model):
+    """Single-row table of homepage totals, maintained incrementally by signals"""
+    periods_count = models.IntegerField(default=0)
+    figures_count = models.IntegerField(default=0)
+    sites_count = models.IntegerField(default=0)
+    recent_figure_ids = models.JSONField(default=list)
+    featured_site_ids = models.JSONField(default=list)
+    version = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'homepage stats'
+    
+    def __str__(self):
+        return f"{self.periods_count} periods, {self.figures_count} figures, {self.sites_count} sites"
+
+
+class Job(models.Model):
+    """Background task queued for the run_worker command"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    key = models.CharField(max_length=200, blank=True, db_index=True)  # de-duplicates queued jobs
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run_after', 'pk']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class ContentVersion(models.Model):
+    """Change counter per content model, bumped by signals on every write"""
+    model = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.model} v{self.version}"
+
+
+class RelatedContent(models.Model):
+    """Precomputed links and two-hop recommendations of one period, figure or site"""
+    kind = models.CharField(max_length=10, choices=SearchDocument.KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    neighbours = models.JSONField(default=list)  # direct links as "kind:pk"
+    related_figures = models.JSONField(default=list)
+    related_sites = models.JSONField(default=list)
+    
+    class Meta:
+        verbose_name_plural = 'related content'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_related_content'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind}:{self.object_id}"
+
+
+class PeriodCard(models.Model):
+    """List-card projection of a TimePeriod, maintained by history.listing"""
+    kind = 'period'
+    period = models.OneToOneField(TimePeriod, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=200)
+    name_key = models.CharField(max_length=200)  # listing.name_key(name), for the lookup endpoint
+    start_year = models.IntegerField()
+    years = models.CharField(max_length=40)
+    summary = models.TextField(blank=True)  # the description cut to 30 words
+    picture = models.JSONField(default=dict, blank=True)  # <picture> sources, srcsets and size
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['start_year']
+        indexes = [
+            models.Index(
+                fields=['start_year', 'period'], include=['name', 'years', 'summary', 'picture', 'updated_at'],
+                name='period_card_list',
+            ),
+            # LIKE 'prefix%' can only use a pattern index under PostgreSQL's locale collations
+            models.Index(fields=['name_key'], opclasses=['varchar_pattern_ops'], name='period_card_name'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+
+class FigureCard(models.Model):
+    """List-card projection of a HistoricalFigure, maintained by history.listing"""
+    kind = 'figure'
+    figure = models.OneToOneField(HistoricalFigure, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=200)
+    name_key = models.CharField(max_length=200)  # listing.name_key(name), for the lookup endpoint
+    birth_year = models.IntegerField(null=True, blank=True)
+    years = models.CharField(max_length=40)
+    role = models.CharField(max_length=50)  # display label
+    period_name = models.CharField(max_length=200)
+    picture = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Facet filters; the composite indexes below cover them
+    role_code = models.CharField(max_length=20)
+    time_period = models.ForeignKey(TimePeriod, on_delete=models.CASCADE, related_name='figure_cards', db_index=False)
+    
+    class Meta:
+        ordering = ['birth_year']
+        indexes = [
+            models.Index(
+                fields=['birth_year', 'figure'], include=['name', 'years', 'role', 'period_name', 'picture', 'updated_at'],
+                name='figure_card_list',
+            ),
+            models.Index(
+                fields=['role_code', 'birth_year', 'figure'],
+                include=['name', 'years', 'role', 'period_name', 'picture', 'updated_at'],
+                name='figure_card_role',
+            ),
+            models.Index(
+                fields=['time_period', 'birth_year', 'figure'],
+                include=['name', 'years', 'role', 'period_name', 'picture', 'updated_at'],
+                name='figure_card_period',
+            ),
+            # LIKE 'prefix%' can only use a pattern index under PostgreSQL's locale collations
+            models.Index(fields=['name_key'], opclasses=['varchar_pattern_ops'], name='figure_card_name'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+
+class SiteCard(models.Model):
+    """List-card projection of a HistoricalSite, maintained by history.listing"""
+    kind = 'site'
+    site = models.OneToOneField(HistoricalSite, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    name = models.CharField(max_length=200)
+    name_key = models.CharField(max_length=200)  # listing.name_key(name), for the lookup endpoint
+    city = models.CharField(max_length=50)  # display label
+    built_year = models.IntegerField(null=True, blank=True)
+    picture = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    city_code = models.CharField(max_length=20)  # facet filter
+    
+    class Meta:
+        ordering = ['name']
+        indexes = [
+            models.Index(
+                fields=['name', 'site'], include=['city', 'built_year', 'picture', 'updated_at'],
+                name='site_card_list',
+            ),
+            models.Index(
+                fields=['city_code', 'name', 'site'], include=['city', 'built_year', 'picture', 'updated_at'],
+                name='site_card_city',
+            ),
+            # LIKE 'prefix%' can only use a pattern index under PostgreSQL's locale collations
+            models.Index(fields=['name_key'], opclasses=['varchar_pattern_ops'], name='site_card_name'),
+        ]
+    
+    def __str__(self):
+        return self.name
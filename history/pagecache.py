@@ -0,0 +1,181 @@
+"""
+Full-page cache for anonymous visitors.
+
+Views marked @cache_anonymous (home, search, timeline, lists and details)
+are stored whole in the 'pages' cache the first time an anonymous visitor
+requests them, keyed by host, path and query string. Only visitors without a
+session or messages cookie are served from or stored to the cache: signed-in
+users see edit buttons and their name in the nav, and a pending flash message
+belongs to one visitor. Responses that set cookies are never stored.
+
+Each path has a generation token that is part of its keys, so purging a path
+drops every query-string variant (all ?page=N of a list) with one write.
+Saving or deleting an object purges its detail page, the lists it appears on,
+home, timeline, search and the detail pages of the objects it links to or
+is suggested from. A page read from a replica within
+DATABASE_REPLICA_STICKY_SECONDS of a purge is not stored, as the replica may
+not have the edit yet. Cacheable responses also carry X-Accel-Expires, so nginx
+keeps its own copy for PAGE_CACHE_PROXY_SECONDS; it cannot be purged from
+here, so that lifetime is kept short.
+"""
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import reverse
+
+from .graph import KINDS, parse_label
+from .models import RelatedContent
+from .search import DETAIL_URLS
+
+LIST_URLS = {'period': 'history:period_list', 'figure': 'history:figure_list', 'site': 'history:site_list'}
+# Lists whose cards show something of another kind: figure cards name their period
+LISTED_ON = {'period': ('period', 'figure'), 'figure': ('figure',), 'site': ('site',)}
+SHARED_URLS = ('history:home', 'history:timeline', 'history:timeline_data', 'history:search', 'history:site_nearby', 'history:site_map')
+STORED_HEADERS = ('Content-Type', 'Content-Language', 'ETag', 'Last-Modified', 'Vary')
+
+
+def page_cache():
+    return caches['pages']
+
+
+def cache_anonymous(view):
+    """Mark a public view whose anonymous responses may be cached whole"""
+    view.cache_anonymous = True
+    return view
+
+
+def _generation_key(path):
+    return f'pagegen:{path}'
+
+
+def page_key(request, generation):
+    query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()
+    return f'page:{request.get_host()}:{request.path}:{generation}:{query}'
+
+
+def is_anonymous(request):
+    """True for visitors without a session or pending messages, without touching the session"""
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES and 'messages' not in request.COOKIES
+
+
+def purge_paths(paths):
+    """Drop every cached variant of the given paths"""
+    if settings.PAGE_CACHE and paths:
+        # Purge tokens are the purge time; tokens made for a missing key are negative
+        token = time.time_ns()
+        page_cache().set_many({_generation_key(path): token for path in paths}, None)
+
+
+def detail_paths(nodes):
+    return {reverse(DETAIL_URLS[kind], args=[pk]) for kind, pk in nodes}
+
+
+def linked_nodes(row):
+    """Objects whose detail pages show the object of a RelatedContent row"""
+    nodes = {parse_label(label) for label in row.neighbours}
+    nodes.update(('figure', figure) for figure in row.related_figures)
+    nodes.update(('site', site) for site in row.related_sites)
+    return nodes
+
+
+def pages_showing(kind, nodes):
+    """Detail pages of the nodes, plus the lists and shared pages showing objects of a kind"""
+    paths = detail_paths(nodes)
+    paths.update(reverse(LIST_URLS[listed]) for listed in LISTED_ON[kind])
+    paths.update(reverse(name) for name in SHARED_URLS)
+    return paths
+
+
+def paths_for(kind, pk, extra_nodes=()):
+    """Pages showing an object: its own, its lists, the shared pages and its graph neighbours"""
+    nodes = {(kind, pk), *extra_nodes}
+    row = RelatedContent.objects.filter(kind=kind, object_id=pk).first()
+    if row is not None:
+        nodes.update(linked_nodes(row))
+    return pages_showing(kind, nodes)
+
+
+def object_paths(instance):
+    kind = KINDS[type(instance)]
+    extra = [('period', instance.time_period_id)] if kind == 'figure' and instance.time_period_id else []
+    return paths_for(kind, instance.pk, extra)
+
+
+def purge_object(instance):
+    if settings.PAGE_CACHE:
+        purge_paths(object_paths(instance))
+
+
+class AnonymousPageCacheMiddleware:
+    """Serve and store whole pages of @cache_anonymous views for anonymous visitors"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        entry = self.entry(request, response)
+        if entry is not None:
+            page_cache().set(request.page_cache_key, entry)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        entry = self.entry(request, response)
+        if entry is not None:
+            await page_cache().aset(request.page_cache_key, entry)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.page_cache_key = None
+        if not (
+            settings.PAGE_CACHE and getattr(view_func, 'cache_anonymous', False)
+            and request.method in ('GET', 'HEAD') and is_anonymous(request)
+        ):
+            return None
+        cache = page_cache()
+        generation = cache.get(_generation_key(request.path))
+        if generation is None:
+            # A fresh token, so pages stored before an evicted purge stay unreachable
+            generation = -time.time_ns()
+            cache.add(_generation_key(request.path), generation, None)
+        key = page_key(request, generation)
+        entry = cache.get(key)
+        if entry is None:
+            request.page_cache_key = key
+            request.page_cache_generation = generation
+            return None
+        content, headers = entry
+        response = HttpResponse(content, headers=headers)
+        self.mark(response, 'HIT')
+        return response
+
+    def entry(self, request, response):
+        if getattr(request, 'page_cache_key', None) is None:
+            return None
+        if response.status_code != 200 or response.streaming or response.cookies or request.method != 'GET':
+            return None
+        if getattr(request, 'replica', None) and self.recently_purged(request.page_cache_generation):
+            # The replica may not have the write behind the purge yet; storing
+            # its page would bring the stale content back under the new token
+            return None
+        self.mark(response, 'MISS')
+        headers = {name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+        return response.content, headers
+
+    def recently_purged(self, generation):
+        return generation > 0 and time.time_ns() - generation < settings.DATABASE_REPLICA_STICKY_SECONDS * 10 ** 9
+    
+    def mark(self, response, status):
+        response['X-Page-Cache'] = status
+        response['X-Accel-Expires'] = str(settings.PAGE_CACHE_PROXY_SECONDS)
@@ -0,0 +1,195 @@
+"""Keyset (cursor) pagination for the public list pages"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+# Primary keys outside a 64-bit integer cannot exist and overflow the database
+MAX_PK = 2 ** 63 - 1
+
+
+def encode_cursor(values):
+    """Encode ordering values into an opaque, URL-safe cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into its ordering values, or None if it is invalid"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != 2 or not isinstance(values[1], int):
+        return None
+    return values
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move around it"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, params=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _query(self, key, cursor):
+        params = self.params.copy() if self.params is not None else None
+        if params is None:
+            return f'?{key}={cursor}'
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = cursor
+        return f'?{params.urlencode()}'
+
+    @property
+    def next_query(self):
+        return self._query('after', self.next_cursor) if self.has_next else ''
+
+    @property
+    def previous_query(self):
+        return self._query('before', self.previous_cursor) if self.has_previous else ''
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row of the previous page.
+
+    Rows are ordered by a single ordering field (the model's Meta.ordering by
+    default) with the primary key as a tie-breaker, so fetching a deep page
+    costs the same index seek as fetching the first one. NULLs sort first.
+    """
+
+    def __init__(self, queryset, page_size, ordering=None):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.field = ordering or queryset.model._meta.ordering[0]
+        self.model_field = queryset.model._meta.get_field(self.field)
+        self.nullable = self.model_field.null
+
+    def _ordered(self, reverse=False):
+        if reverse:
+            order = F(self.field).desc(nulls_last=True) if self.nullable else F(self.field).desc()
+            return self.queryset.order_by(order, '-pk')
+        order = F(self.field).asc(nulls_first=True) if self.nullable else F(self.field).asc()
+        return self.queryset.order_by(order, 'pk')
+
+    def _after(self, value, pk):
+        if value is None:
+            return Q(**{f'{self.field}__isnull': True, 'pk__gt': pk}) | Q(**{f'{self.field}__isnull': False})
+        return Q(**{f'{self.field}__gt': value}) | Q(**{self.field: value, 'pk__gt': pk})
+
+    def _before(self, value, pk):
+        if value is None:
+            return Q(**{f'{self.field}__isnull': True, 'pk__lt': pk})
+        condition = Q(**{f'{self.field}__lt': value}) | Q(**{self.field: value, 'pk__lt': pk})
+        if self.nullable:
+            condition |= Q(**{f'{self.field}__isnull': True})
+        return condition
+
+    def cursor_for(self, obj):
+        return encode_cursor([getattr(obj, self.field), obj.pk])
+
+    def _decode(self, cursor):
+        """A cursor's values as the ordering field's type, or None if they do not fit it"""
+        values = decode_cursor(cursor)
+        if values is None or abs(values[1]) > MAX_PK:
+            return None
+        try:
+            return [self.model_field.to_python(values[0]), values[1]]
+        except (ValidationError, TypeError, ValueError):
+            return None
+
+    def _window(self, after, before):
+        """The queryset (one row past the page) and the decoded cursors"""
+        after_values = self._decode(after)
+        before_values = self._decode(before) if after_values is None else None
+        if before_values is not None:
+            queryset = self._ordered(reverse=True).filter(self._before(*before_values))
+        else:
+            queryset = self._ordered()
+            if after_values is not None:
+                queryset = queryset.filter(self._after(*after_values))
+        return queryset[:self.page_size + 1], after_values, before_values
+
+    def _page(self, rows, after_values, before_values, params):
+        has_more = len(rows) > self.page_size
+        if before_values is not None:
+            rows = rows[:self.page_size][::-1]
+            previous_cursor = self.cursor_for(rows[0]) if rows and has_more else None
+            next_cursor = self.cursor_for(rows[-1]) if rows else None
+        else:
+            rows = rows[:self.page_size]
+            next_cursor = self.cursor_for(rows[-1]) if rows and has_more else None
+            previous_cursor = self.cursor_for(rows[0]) if rows and after_values is not None else None
+        return KeysetPage(rows, next_cursor, previous_cursor, params)
+
+    def page(self, after=None, before=None, params=None):
+        """Return the page that follows `after`, or precedes `before`"""
+        queryset, after_values, before_values = self._window(after, before)
+        return self._page(list(queryset), after_values, before_values, params)
+
+    async def apage(self, after=None, before=None, params=None):
+        """Async version of page(), fetching through the async ORM"""
+        queryset, after_values, before_values = self._window(after, before)
+        return self._page([obj async for obj in queryset], after_values, before_values, params)
+
+
+def get_page_size(request):
+    """Page size from ?page_size=, clamped to LIST_MAX_PAGE_SIZE"""
+    try:
+        size = int(request.GET.get('page_size', settings.LIST_PAGE_SIZE))
+    except ValueError:
+        size = settings.LIST_PAGE_SIZE
+    return max(1, min(size, settings.LIST_MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset, ordering=None):
+    """Return the keyset page requested by ?after= / ?before= for a list view"""
+    paginator = KeysetPaginator(queryset, get_page_size(request), ordering=ordering)
+    return paginator.page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        params=request.GET,
+    )
+
+
+async def apaginate(request, queryset, ordering=None):
+    """Async version of paginate()"""
+    paginator = KeysetPaginator(queryset, get_page_size(request), ordering=ordering)
+    return await paginator.apage(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        params=request.GET,
+    )
@@ -0,0 +1,207 @@
+"""
+Per-process database connection pool.
+
+Django opens a connection the first time a request queries and closes it
+when the request finishes. The pooled PostgreSQL backend (ENGINE
+history.backends.postgresql) takes connections from a ConnectionPool instead
+and gives them back on close, so a request pays no TCP or authentication
+round-trips. Every gunicorn worker process has its own pools: `size`
+connections are kept open, up to `max_overflow` more are opened under load and
+closed again when returned, and a checkout waits at most `timeout` seconds
+for a free connection. A connection idle for longer than `check_after`
+seconds is tested with SELECT 1 before it is handed out, and one older than
+`max_lifetime` is replaced.
+"""
+import os
+import threading
+import time
+from collections import Counter
+
+COUNTERS = {
+    'checkouts': 'Connections handed out',
+    'waits': 'Checkouts that had to wait for a free connection',
+    'wait_seconds': 'Time spent waiting for a free connection',
+    'overflows': 'Connections opened beyond the pool size',
+    'timeouts': 'Checkouts that gave up waiting',
+    'connects': 'New database connections opened',
+    'discards': 'Connections closed because they were broken, expired or overflow',
+}
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool timeout"""
+
+
+class ConnectionPool:
+    def __init__(self, size=4, max_overflow=4, timeout=10.0, check_after=30.0, max_lifetime=3600.0):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        # (connection, opened, returned), most recently returned last
+        self.idle = []
+        self.in_use = {}
+        self.open = 0
+        self.stats = Counter()
+
+    def getconn(self, connect):
+        """Check out a connection, opening one with connect() if needed"""
+        with self.condition:
+            self.stats['checkouts'] += 1
+            waited = None
+            while True:
+                if self.idle:
+                    conn, opened, returned = self.idle.pop()
+                    break
+                if self.open < self.size + self.max_overflow:
+                    self.open += 1
+                    if self.open > self.size:
+                        self.stats['overflows'] += 1
+                    conn = None
+                    break
+                if waited is None:
+                    self.stats['waits'] += 1
+                    waited = time.monotonic()
+                remaining = waited + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s')
+                self.condition.wait(remaining)
+            if waited is not None:
+                self.stats['wait_seconds'] += time.monotonic() - waited
+
+        if conn is not None:
+            now = time.monotonic()
+            if now - opened > self.max_lifetime or (now - returned > self.check_after and not _healthy(conn)):
+                # Reuse the slot for a fresh connection
+                self._close(conn)
+                conn = None
+        if conn is None:
+            try:
+                conn = connect()
+            except Exception:
+                with self.condition:
+                    self.open -= 1
+                    self.condition.notify()
+                raise
+            opened = time.monotonic()
+            with self.condition:
+                self.stats['connects'] += 1
+        with self.condition:
+            self.in_use[id(conn)] = opened
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection; broken ones and overflow are closed"""
+        with self.condition:
+            opened = self.in_use.pop(id(conn))
+        if not discard:
+            discard = not _reset(conn)
+        with self.condition:
+            if discard or self.open > self.size:
+                self.open -= 1
+            else:
+                self.idle.append((conn, opened, time.monotonic()))
+                conn = None
+            self.condition.notify()
+        if conn is not None:
+            self._close(conn)
+
+    def close_idle(self):
+        """Close every idle connection (connections in use are left alone)"""
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.open -= len(idle)
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def _close(self, conn):
+        with self.condition:
+            self.stats['discards'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self.open,
+                'idle': len(self.idle),
+                'in_use': len(self.in_use),
+                **{name: self.stats[name] for name in COUNTERS},
+            }
+
+
+def _healthy(conn):
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        finally:
+            cursor.close()
+        conn.rollback()
+    except Exception:
+        return False
+    return True
+
+
+def _reset(conn):
+    """Roll back whatever the last user left open; False if the connection is unusable"""
+    if getattr(conn, 'closed', False):
+        return False
+    try:
+        conn.rollback()
+    except Exception:
+        return False
+    return True
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool(key, **options):
+    """The pool for key in this process, created on first use"""
+    with _lock:
+        pool = _pools.get(key)
+        # A forked worker must not share its parent's sockets: start afresh
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[key] = ConnectionPool(**options)
+        return pool
+
+
+def close_all():
+    with _lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+def render():
+    """Pool gauges and counters in the Prometheus text exposition format"""
+    pid = os.getpid()
+    with _lock:
+        pools = sorted((key[0], pool.snapshot()) for key, pool in _pools.items() if pool.pid == pid)
+    if not pools:
+        return ''
+    lines = [
+        '# HELP heritage_db_pool_connections Pooled database connections by state',
+        '# TYPE heritage_db_pool_connections gauge',
+    ]
+    for alias, stats in pools:
+        for state in ('idle', 'in_use'):
+            lines.append(f'heritage_db_pool_connections{{alias="{alias}",pid="{pid}",state="{state}"}} {stats[state]}')
+    for name, help_text in COUNTERS.items():
+        metric = f'heritage_db_pool_{name}_total'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for alias, stats in pools:
+            lines.append(f'{metric}{{alias="{alias}",pid="{pid}"}} {stats[name]:g}')
+    return '\n'.join(lines) + '\n'
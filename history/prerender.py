@@ -0,0 +1,194 @@
+"""
+Pre-rendered public pages for nginx.
+
+`manage.py prerender` renders what an anonymous visitor sees of every public
+page (the @cache_anonymous views without URL parameters, and the detail page
+of every period, figure and site) to PRERENDER_ROOT/<path>/index.html.
+nginx serves those files to GET requests without a query string or session
+cookie (nginx/nginx.conf), so Django is left with signed-in users, writes,
+and list pages past the first.
+
+Pages are rendered through the full middleware stack in a pool of worker
+processes. The build records in a manifest when it started, the pages it
+wrote, and which objects' detail pages show each object, from the
+RelatedContent graph and figures' periods. The next build re-renders only
+what objects changed since then appear on: their own pages, their lists, the
+shared pages, and the pages of the objects they were or are now linked to.
+Pages whose file has gone missing are rendered again too. Paths that give
+no HTML page (the JSON endpoints, which need a query string) are noted and
+left alone until a --full build.
+
+With PRERENDER on, saving or deleting an object deletes the files of the
+pages showing it at once, so nginx passes those requests to Django until the
+next build writes them again.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls
+from .graph import KINDS, parse_label
+from .models import HistoricalFigure, RelatedContent
+from .pagecache import linked_nodes, object_paths, pages_showing
+from .search import DETAIL_URLS
+
+MANIFEST = '.prerender.json'
+CHUNK_SIZE = 50
+
+
+def file_for(path, root=None):
+    """Where the page at a URL path is written"""
+    return os.path.join(root or settings.PRERENDER_ROOT, path.strip('/'), 'index.html')
+
+
+def discard(paths, root=None):
+    """Delete the files of pages that are out of date"""
+    for path in paths:
+        try:
+            os.remove(file_for(path, root))
+        except FileNotFoundError:
+            pass
+
+
+def discard_object(instance):
+    if settings.PRERENDER:
+        discard(object_paths(instance))
+
+
+def _label(node):
+    return f'{node[0]}:{node[1]}'
+
+
+def current_links():
+    """{node: detail pages showing it} for every object, in one pass over the graph"""
+    links = {(kind, pk): set() for model, kind in KINDS.items() for pk in model.objects.values_list('pk', flat=True)}
+    for row in RelatedContent.objects.iterator():
+        node = (row.kind, row.object_id)
+        if node in links:
+            links[node].update(linked_nodes(row))
+    # A figure shows on its period's page before the graph has caught up
+    for pk, period in HistoricalFigure.objects.exclude(time_period=None).values_list('pk', 'time_period_id'):
+        links.setdefault(('figure', pk), set()).add(('period', period))
+    return links
+
+
+def public_paths(nodes):
+    paths = {
+        reverse(f'history:{pattern.name}')
+        for pattern in urls.urlpatterns
+        if getattr(pattern.callback, 'cache_anonymous', False) and not pattern.pattern.converters
+    }
+    paths.update(reverse(DETAIL_URLS[kind], args=[pk]) for kind, pk in nodes)
+    return paths
+
+
+def changed_since(since):
+    return {
+        (kind, pk)
+        for model, kind in KINDS.items()
+        for pk in model.objects.filter(updated_at__gte=since).values_list('pk', flat=True)
+    }
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as manifest:
+            data = json.load(manifest)
+    except FileNotFoundError:
+        return None
+    return {
+        'built_at': datetime.fromisoformat(data['built_at']),
+        'pages': set(data['pages']),
+        'skipped': set(data['skipped']),
+        'links': {parse_label(node): {parse_label(label) for label in linked} for node, linked in data['links'].items()},
+    }
+
+
+def save_manifest(root, built_at, pages, skipped, links):
+    data = {
+        'built_at': built_at.isoformat(),
+        'pages': sorted(pages),
+        'skipped': sorted(skipped),
+        'links': {_label(node): sorted(map(_label, linked)) for node, linked in links.items()},
+    }
+    _write(os.path.join(root, MANIFEST), json.dumps(data).encode())
+
+
+def _write(filename, content):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temporary = f'{filename}.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(content)
+    os.replace(temporary, filename)
+
+
+def _start_worker():
+    # Forked workers inherit the set-up apps; spawned ones start from scratch
+    if not apps.ready:
+        django.setup()
+
+
+def render_pages(paths, root):
+    """Render paths to files; returns the paths that rendered as HTML pages"""
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    rendered = []
+    for path in paths:
+        request = factory.get(path, HTTP_HOST=settings.PRERENDER_HOST, secure=True)
+        response = handler.get_response(request)
+        if response.status_code == 200 and response['Content-Type'].startswith('text/html'):
+            _write(file_for(path, root), response.content)
+            rendered.append(path)
+        response.close()
+    return rendered
+
+
+def build(root=None, workers=1, full=False):
+    """Render the pages affected since the last build (all of them the first time); returns (rendered, removed)"""
+    root = root or settings.PRERENDER_ROOT
+    started = timezone.now()
+    manifest = None if full else load_manifest(root)
+    links = current_links()
+    paths = public_paths(links)
+    if manifest is None:
+        targets, pages, skipped = set(paths), set(), set()
+    else:
+        # Views that gave no page, such as JSON endpoints needing a query string, until --full
+        skipped = manifest['skipped'] & paths
+        paths -= skipped
+        pages = manifest['pages'] & paths
+        targets = {path for path in pages if not os.path.exists(file_for(path, root))}
+        touched = changed_since(manifest['built_at']) | (manifest['links'].keys() - links.keys())
+        for node in touched:
+            nodes = {node} | manifest['links'].get(node, set()) | links.get(node, set())
+            targets.update(pages_showing(node[0], nodes) & paths)
+        # New objects and views
+        targets.update(paths - manifest['pages'])
+    removed = (manifest['pages'] - paths - skipped) if manifest else set()
+    discard(removed, root)
+
+    ordered = sorted(targets)
+    if workers > 1 and len(ordered) > CHUNK_SIZE:
+        chunks = [ordered[i:i + CHUNK_SIZE] for i in range(0, len(ordered), CHUNK_SIZE)]
+        # Worker processes must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker) as pool:
+            rendered = [path for done in pool.map(render_pages, chunks, [root] * len(chunks)) for path in done]
+    else:
+        rendered = render_pages(ordered, root)
+
+    # A page that no longer renders must not be served from an old file
+    discard(targets - set(rendered), root)
+    pages = (pages - targets) | set(rendered)
+    save_manifest(root, started, pages, skipped | (targets - pages), links)
+    return len(rendered), len(removed)
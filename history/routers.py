@@ -0,0 +1,118 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads of this app's models go to
+a read replica only inside views marked @replica_reads (home, lists, details,
+search, timeline and the API) and only for GET and HEAD requests. Everything
+else reads from the primary: the edit views, auth and sessions, management
+commands and background jobs. ReplicaRoutingMiddleware picks one replica per
+request, so a page never mixes two replicas.
+
+Replicas lag behind the primary, so a session that has just written is held
+on the primary for DATABASE_REPLICA_STICKY_SECONDS: after site_create
+redirects to site_detail, the new site is read back from the primary. Within
+a request, reads after a write go to the primary as well.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+STICKY_SESSION_KEY = '_primary_until'
+REPLICATED_APPS = {'history'}
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_state = ContextVar('database_routing', default=None)
+
+
+def replica_reads(view):
+    """Mark a read-only view whose queries may be served by a replica"""
+    view.replica_reads = True
+    return view
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return None
+        if model._meta.app_label not in REPLICATED_APPS:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label in REPLICATED_APPS:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """Route a request's reads to a replica, and keep writing sessions on the primary"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            self.stick(request)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            await sync_to_async(self.stick)(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        request.replica = None
+        if state is None or not settings.DATABASE_REPLICAS:
+            return None
+        if getattr(view_func, 'replica_reads', False) and request.method in ('GET', 'HEAD') and not self.stuck(request):
+            state.replica = request.replica = random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def stuck(self, request):
+        session = getattr(request, 'session', None)
+        # Anonymous visitors without a session never wrote anything
+        if session is None or (session.session_key is None and not session.modified):
+            return False
+        return session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+    def stick(self, request):
+        session = getattr(request, 'session', None)
+        if session is not None and settings.DATABASE_REPLICAS:
+            session[STICKY_SESSION_KEY] = time.time() + settings.DATABASE_REPLICA_STICKY_SECONDS
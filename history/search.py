@@ -0,0 +1,168 @@
+"""
+Full-text search across periods, figures and sites.
+
+Every TimePeriod, HistoricalFigure and HistoricalSite is mirrored into a
+SearchDocument row. On PostgreSQL the documents carry a GIN index over their
+weighted tsvector; on SQLite an FTS5 external-content table is kept in sync by
+triggers. Both are created in migration 0003.
+"""
+import html
+import re
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from .graph import KINDS
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, SearchDocument
+
+PG_CONFIG = 'english'
+PG_VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, d.title), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, d.body), 'B')"
+)
+START, STOP = '\x02', '\x03'
+
+DETAIL_URLS = {
+    'period': 'history:period_detail',
+    'figure': 'history:figure_detail',
+    'site': 'history:site_detail',
+}
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    object_id: int
+    title: str
+    snippet: str
+    rank: float
+
+    @property
+    def url(self):
+        return reverse(DETAIL_URLS[self.kind], args=[self.object_id])
+
+    def get_kind_display(self):
+        return dict(SearchDocument.KIND_CHOICES)[self.kind]
+
+
+def document_for(instance):
+    """Return (kind, title, body) describing how an object is indexed"""
+    if isinstance(instance, TimePeriod):
+        return 'period', instance.name, instance.description
+    if isinstance(instance, HistoricalFigure):
+        return 'figure', instance.name, f"{instance.get_role_display()}\n{instance.biography}"
+    if isinstance(instance, HistoricalSite):
+        return 'site', instance.name, f"{instance.get_city_display()}\n{instance.description}"
+    raise TypeError(f"{type(instance).__name__} is not searchable")
+
+
+def index_object(instance):
+    """Create or refresh the search document for one object"""
+    kind, title, body = document_for(instance)
+    SearchDocument.objects.update_or_create(
+        kind=kind, object_id=instance.pk, defaults={'title': title, 'body': body},
+    )
+
+
+def remove_object(instance):
+    """Drop the search document for a deleted object"""
+    kind = document_for(instance)[0]
+    SearchDocument.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+def index_objects(model, pks, batch_size=1000):
+    """Rewrite the search documents of the given objects, a batch at a time"""
+    pks = sorted(pks)
+    for start in range(0, len(pks), batch_size):
+        chunk = pks[start:start + batch_size]
+        documents = []
+        for instance in model.objects.filter(pk__in=chunk):
+            kind, title, body = document_for(instance)
+            documents.append(SearchDocument(kind=kind, object_id=instance.pk, title=title, body=body))
+        with transaction.atomic():
+            SearchDocument.objects.filter(kind=KINDS[model], object_id__in=chunk).delete()
+            SearchDocument.objects.bulk_create(documents)
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild every search document from the source tables"""
+    SearchDocument.objects.all().delete()
+    # bulk_create() lists what it is given, so write a batch at a time
+    documents, count = [], 0
+    for model in (TimePeriod, HistoricalFigure, HistoricalSite):
+        for instance in model.objects.all().iterator(chunk_size=batch_size):
+            kind, title, body = document_for(instance)
+            documents.append(SearchDocument(kind=kind, object_id=instance.pk, title=title, body=body))
+            if len(documents) >= batch_size:
+                SearchDocument.objects.bulk_create(documents)
+                count += len(documents)
+                documents = []
+    SearchDocument.objects.bulk_create(documents)
+    return count + len(documents)
+
+
+def _highlight(text):
+    return mark_safe(html.escape(text).replace(START, '<mark>').replace(STOP, '</mark>'))
+
+
+def _fts5_query(query):
+    # Quote every term so user input can never be parsed as FTS5 syntax,
+    # and match each one as a prefix.
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _search_sqlite(query, limit):
+    match = _fts5_query(query)
+    if not match:
+        return []
+    sql = """
+        SELECT d.kind, d.object_id,
+               highlight(history_searchdocument_fts, 0, %s, %s),
+               snippet(history_searchdocument_fts, 1, %s, %s, '…', 24),
+               bm25(history_searchdocument_fts, 10.0, 1.0) AS rank
+        FROM history_searchdocument_fts
+        JOIN history_searchdocument d ON d.id = history_searchdocument_fts.rowid
+        WHERE history_searchdocument_fts MATCH %s
+        ORDER BY rank, d.id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [START, STOP, START, STOP, match, limit])
+        # bm25() is lower-is-better; flip it so rank reads the same on both backends
+        return [(kind, pk, title, snippet, -rank) for kind, pk, title, snippet, rank in cursor.fetchall()]
+
+
+def _search_postgresql(query, limit):
+    options = f'StartSel={START}, StopSel={STOP}, MaxFragments=2, MaxWords=30, MinWords=10'
+    sql = f"""
+        SELECT d.kind, d.object_id,
+               ts_headline(%s::regconfig, d.title, q, %s),
+               ts_headline(%s::regconfig, d.body, q, %s),
+               ts_rank({PG_VECTOR}, q) AS rank
+        FROM history_searchdocument d, websearch_to_tsquery(%s::regconfig, %s) q
+        WHERE {PG_VECTOR} @@ q
+        ORDER BY rank DESC, d.id
+        LIMIT %s
+    """
+    params = [PG_CONFIG, 'HighlightAll=true, ' + options, PG_CONFIG, options, PG_CONFIG, query, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search(query, limit=50):
+    """Return ranked, highlighted hits across all three models"""
+    query = query.strip()
+    if not query:
+        return []
+    if connection.vendor == 'postgresql':
+        rows = _search_postgresql(query, limit)
+    else:
+        rows = _search_sqlite(query, limit)
+    return [
+        SearchHit(kind, object_id, _highlight(title), _highlight(snippet), rank)
+        for kind, object_id, title, snippet, rank in rows
+    ]
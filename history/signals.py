@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+
+from . import autocomplete, fragments, geo, graph, images, listing, pagecache, prerender, stats, search, tasks, versions
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+
+CONTENT_MODELS = (TimePeriod, HistoricalFigure, HistoricalSite)
+
+
+def set_geohash(sender, instance, **kwargs):
+    """Index the site's coordinates for the nearby and map queries"""
+    instance.geohash = geo.geohash_for(instance.latitude, instance.longitude)
+
+
+def refresh_listing(sender, instance, created=False, raw=False, **kwargs):
+    """Write the object's listing card, before anything renders it"""
+    if not raw:
+        listing.refresh(instance, created)
+
+
+def update_autocomplete(sender, instance, raw=False, **kwargs):
+    """Put the saved name in this worker's autocomplete index"""
+    if not raw:
+        autocomplete.object_saved(instance)
+
+
+def remove_from_autocomplete(sender, instance, **kwargs):
+    """Drop a deleted name from this worker's autocomplete index"""
+    autocomplete.object_deleted(instance)
+
+
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """Keep the search document in step with the saved object"""
+    if not raw:
+        tasks.enqueue_for('index_object', instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    """Drop the search document of a deleted object"""
+    search.remove_object(instance)
+
+
+def update_homepage_stats(sender, instance, created=False, raw=False, **kwargs):
+    """Apply a saved object to the materialized homepage statistics"""
+    if not raw:
+        stats.object_saved(instance, created)
+
+
+def remove_from_homepage_stats(sender, instance, **kwargs):
+    """Apply a deleted object to the materialized homepage statistics"""
+    stats.object_deleted(instance)
+
+
+def update_image_variants(sender, instance, raw=False, **kwargs):
+    """Generate thumbnails and WebP/AVIF variants when the image changes"""
+    if not raw and images.needs_variants(instance):
+        tasks.enqueue_for('generate_image_variants', instance)
+
+
+def bump_version(sender, raw=False, **kwargs):
+    """Record that the model's content changed"""
+    if not raw:
+        versions.bump(sender)
+
+
+def bump_related_versions(sender, instance, action, model, **kwargs):
+    """Record that both sides of a site relation changed"""
+    if action.startswith('post_'):
+        versions.bump(type(instance), model)
+
+
+def invalidate_cards(sender, instance, created=False, **kwargs):
+    """Drop cached cards for a saved or deleted object"""
+    fragments.invalidate(sender, [instance.pk])
+    if sender is TimePeriod and not created:
+        # Figure cards show the name of their period
+        fragments.invalidate(HistoricalFigure, instance.figures.values_list('pk', flat=True))
+
+
+def purge_pages(sender, instance, raw=False, **kwargs):
+    """Drop the cached pages that show a saved or deleted object"""
+    if not raw:
+        pagecache.purge_object(instance)
+
+
+def discard_prerendered(sender, instance, raw=False, **kwargs):
+    """Delete the pre-rendered files of the pages that show a saved or deleted object"""
+    if not raw:
+        prerender.discard_object(instance)
+
+
+def discard_related_prerendered(sender, instance, action, model, pk_set, **kwargs):
+    """Delete the pre-rendered files on both sides of a changed site relation"""
+    if action.startswith('post_') and settings.PRERENDER:
+        prerender.discard_object(instance)
+        pks = changed_pks(instance, action, pk_set)
+        prerender.discard(pagecache.detail_paths((graph.KINDS[model], pk) for pk in pks))
+
+
+def remember_cleared(sender, instance, action, model, **kwargs):
+    """Note the objects a clear() is about to unlink, which post_clear is not told"""
+    if action == 'pre_clear':
+        columns = {field.related_model: field.attname for field in sender._meta.fields if field.is_relation}
+        linked = sender.objects.filter(**{columns[type(instance)]: instance.pk}).values_list(columns[model], flat=True)
+        instance._cleared_pks = set(linked)
+
+
+def changed_pks(instance, action, pk_set):
+    """The pks on the other side of a relation change, including those a clear() removed"""
+    if action == 'post_clear':
+        return getattr(instance, '_cleared_pks', set())
+    return pk_set or set()
+
+
+def purge_related_pages(sender, instance, action, model, pk_set, **kwargs):
+    """Drop the cached pages on both sides of a changed site relation"""
+    if action.startswith('post_'):
+        pagecache.purge_object(instance)
+        pks = changed_pks(instance, action, pk_set)
+        pagecache.purge_paths(pagecache.detail_paths((graph.KINDS[model], pk) for pk in pks))
+
+
+def warm_caches(sender, instance, raw=False, **kwargs):
+    """Re-render the object's card and the homepage ahead of the next visitor"""
+    # Only worth doing when the worker shares the cache with the web processes
+    if not raw and 'locmem' not in settings.CACHES['fragments']['BACKEND']:
+        tasks.enqueue_for('warm_caches', instance)
+
+
+def refresh_related_content(sender, instance, raw=False, **kwargs):
+    """Recompute the precomputed related content around an object whose links changed"""
+    if not raw:
+        tasks.enqueue_for('refresh_related', instance)
+
+
+def refresh_related_links(sender, instance, action, **kwargs):
+    """Recompute the precomputed related content after a site relation changed"""
+    if action.startswith('post_'):
+        tasks.enqueue_for('refresh_related', instance)
+
+
+def invalidate_related_cards(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Drop cached cards on both sides of a changed site relation"""
+    if not action.startswith('post_'):
+        return
+    fragments.invalidate(type(instance), [instance.pk])
+    pks = changed_pks(instance, action, pk_set)
+    if pks:
+        fragments.invalidate(model, pks)
+
+
+for model in CONTENT_MODELS:
+    post_save.connect(refresh_listing, sender=model)
+    post_save.connect(update_search_index, sender=model)
+    post_save.connect(update_image_variants, sender=model)
+    post_delete.connect(remove_from_search_index, sender=model)
+    post_save.connect(update_autocomplete, sender=model)
+    post_delete.connect(remove_from_autocomplete, sender=model)
+    post_save.connect(invalidate_cards, sender=model)
+    post_delete.connect(invalidate_cards, sender=model)
+    post_save.connect(update_homepage_stats, sender=model)
+    post_delete.connect(remove_from_homepage_stats, sender=model)
+    post_save.connect(warm_caches, sender=model)
+    post_save.connect(bump_version, sender=model)
+    post_delete.connect(bump_version, sender=model)
+    # Before refresh_related_content, while the stored neighbours are still the old ones
+    post_save.connect(purge_pages, sender=model)
+    post_delete.connect(purge_pages, sender=model)
+    post_save.connect(discard_prerendered, sender=model)
+    post_delete.connect(discard_prerendered, sender=model)
+    post_delete.connect(refresh_related_content, sender=model)
+
+pre_save.connect(set_geohash, sender=HistoricalSite)
+
+# A figure's period is its only link held on the model itself
+post_save.connect(refresh_related_content, sender=HistoricalFigure)
+
+for through in (HistoricalSite.time_periods.through, HistoricalSite.related_figures.through):
+    m2m_changed.connect(remember_cleared, sender=through)
+    m2m_changed.connect(invalidate_related_cards, sender=through)
+    m2m_changed.connect(bump_related_versions, sender=through)
+    m2m_changed.connect(purge_related_pages, sender=through)
+    m2m_changed.connect(discard_related_prerendered, sender=through)
+    m2m_changed.connect(refresh_related_links, sender=through)
@@ -0,0 +1,114 @@
+// Typeahead for the LookupSelect widgets (history/widgets.py): typing queries
+// the lookup endpoint, picking a match adds it to the hidden <select>, and the
+// chosen objects are listed with a button to remove each.
+(function () {
+    'use strict';
+
+    var DELAY = 150;
+
+    function setup(container) {
+        var select = container.querySelector('select');
+        var search = container.querySelector('.lookup-search');
+        var results = container.querySelector('.lookup-results');
+        var chosen = document.createElement('ul');
+        var timer = null;
+        var sequence = 0;
+
+        chosen.className = 'lookup-chosen';
+        container.insertBefore(chosen, search);
+        select.hidden = true;
+        select.required = false;
+        // The unchosen options and the empty one are only there for browsers without this script
+        Array.prototype.slice.call(select.options).forEach(function (option) {
+            if (!option.defaultSelected || !option.value) {
+                option.remove();
+            }
+        });
+
+        function renderChosen() {
+            chosen.textContent = '';
+            Array.prototype.forEach.call(select.options, function (option) {
+                var item = document.createElement('li');
+                var remove = document.createElement('button');
+                item.textContent = option.textContent;
+                remove.type = 'button';
+                remove.textContent = '×';
+                remove.setAttribute('aria-label', 'Remove ' + option.textContent);
+                remove.addEventListener('click', function () {
+                    option.remove();
+                    renderChosen();
+                });
+                item.appendChild(remove);
+                chosen.appendChild(item);
+            });
+        }
+
+        function choose(result) {
+            var value = String(result.id);
+            var present = Array.prototype.some.call(select.options, function (option) {
+                return option.value === value;
+            });
+            if (!select.multiple) {
+                select.textContent = '';
+                present = false;
+            }
+            if (!present) {
+                select.appendChild(new Option(result.label, value, true, true));
+            }
+            search.value = '';
+            show([]);
+            renderChosen();
+        }
+
+        function show(matches) {
+            results.textContent = '';
+            matches.forEach(function (result) {
+                var item = document.createElement('li');
+                item.textContent = result.label;
+                // mousedown runs before the search box loses focus
+                item.addEventListener('mousedown', function (event) {
+                    event.preventDefault();
+                    choose(result);
+                });
+                results.appendChild(item);
+            });
+            results.hidden = !matches.length;
+        }
+
+        search.addEventListener('input', function () {
+            var query = search.value.trim();
+            clearTimeout(timer);
+            if (!query) {
+                show([]);
+                return;
+            }
+            timer = setTimeout(function () {
+                var current = ++sequence;
+                fetch(container.dataset.lookupUrl + '?q=' + encodeURIComponent(query), {
+                    headers: {'Accept': 'application/json'},
+                    credentials: 'same-origin'
+                })
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        // Ignore answers to queries the user has already typed past
+                        if (current === sequence) {
+                            show(data.results);
+                        }
+                    });
+            }, DELAY);
+        });
+        search.addEventListener('keydown', function (event) {
+            // Enter picks the first match instead of submitting the form
+            if (event.key === 'Enter' && !results.hidden) {
+                event.preventDefault();
+                results.firstChild.dispatchEvent(new MouseEvent('mousedown', {cancelable: true}));
+            }
+        });
+        search.addEventListener('blur', function () {
+            results.hidden = true;
+        });
+        renderChosen();
+    }
+
+    document.querySelectorAll('.lookup').forEach(setup);
+})();
@@ -0,0 +1,139 @@
+"""
+Materialized homepage statistics.
+
+HomepageStats holds the three totals and the ids of the homepage's recent
+figures and featured sites. Signals keep it current with F() increments, and
+every change bumps `version`. The homepage reads that one row and serves the
+listing cards from the default cache under the current version.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+
+from .metrics import upkeep
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, HomepageStats, FigureCard, SiteCard, catalogue_counts
+
+STATS_PK = 1
+COUNT_FIELDS = {
+    TimePeriod: 'periods_count',
+    HistoricalFigure: 'figures_count',
+    HistoricalSite: 'sites_count',
+}
+
+
+def recent_figure_ids():
+    return list(HistoricalFigure.objects.recent().values_list('pk', flat=True))
+
+
+def featured_site_ids():
+    return list(HistoricalSite.objects.featured().values_list('pk', flat=True))
+
+
+def rebuild():
+    """Recompute every statistic from the source tables"""
+    stats, _ = HomepageStats.objects.update_or_create(
+        pk=STATS_PK,
+        defaults={
+            **catalogue_counts(),
+            'recent_figure_ids': recent_figure_ids(),
+            'featured_site_ids': featured_site_ids(),
+        },
+    )
+    HomepageStats.objects.filter(pk=STATS_PK).update(version=F('version') + 1)
+    stats.refresh_from_db()
+    return stats
+
+
+def get_stats():
+    stats = HomepageStats.objects.filter(pk=STATS_PK).first()
+    if stats is None:
+        with upkeep():
+            stats = rebuild()
+    return stats
+
+
+def _update(**changes):
+    if not HomepageStats.objects.filter(pk=STATS_PK).update(version=F('version') + 1, **changes):
+        rebuild()
+
+
+def touch():
+    """Retire the cached homepage cards without changing any totals"""
+    _update()
+
+
+def object_saved(instance, created):
+    """Apply one saved object to the statistics"""
+    changes = {}
+    if created:
+        field = COUNT_FIELDS[type(instance)]
+        changes[field] = F(field) + 1
+    if isinstance(instance, HistoricalFigure):
+        changes['recent_figure_ids'] = recent_figure_ids()
+    elif isinstance(instance, HistoricalSite):
+        changes['featured_site_ids'] = featured_site_ids()
+    elif not created:
+        # Editing a period changes nothing the homepage shows
+        return
+    _update(**changes)
+
+
+def object_deleted(instance):
+    """Apply one deleted object to the statistics"""
+    field = COUNT_FIELDS[type(instance)]
+    changes = {field: F(field) - 1}
+    if isinstance(instance, HistoricalFigure):
+        changes['recent_figure_ids'] = recent_figure_ids()
+    elif isinstance(instance, HistoricalSite):
+        changes['featured_site_ids'] = featured_site_ids()
+    _update(**changes)
+
+
+def in_order(queryset, ids):
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def _context(stats, cards):
+    return {
+        'periods_count': stats.periods_count,
+        'figures_count': stats.figures_count,
+        'sites_count': stats.sites_count,
+        **cards,
+    }
+
+
+def homepage_context():
+    """Homepage totals and cards from one row read plus a versioned cache entry"""
+    stats = get_stats()
+    key = f'homepage:cards:{stats.version}'
+    cards = cache.get(key)
+    if cards is None:
+        cards = {
+            'recent_figures': in_order(FigureCard.objects.all(), stats.recent_figure_ids),
+            'featured_sites': in_order(SiteCard.objects.all(), stats.featured_site_ids),
+        }
+        cache.set(key, cards, 60 * 60)
+    return _context(stats, cards)
+
+
+async def ain_order(queryset, ids):
+    objects = await queryset.ain_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+async def ahomepage_context():
+    """Async version of homepage_context()"""
+    stats = await HomepageStats.objects.filter(pk=STATS_PK).afirst()
+    if stats is None:
+        with upkeep():
+            stats = await sync_to_async(rebuild)()
+    key = f'homepage:cards:{stats.version}'
+    cards = await cache.aget(key)
+    if cards is None:
+        cards = {
+            'recent_figures': await ain_order(FigureCard.objects.all(), stats.recent_figure_ids),
+            'featured_sites': await ain_order(SiteCard.objects.all(), stats.featured_site_ids),
+        }
+        await cache.aset(key, cards, 60 * 60)
+    return _context(stats, cards)
@@ -0,0 +1,60 @@
+"""
+Static file storage with hashed names and pre-compressed siblings.
+
+collectstatic copies every static file under a content-hashed name
+(style.3f2a9c1e.css) and records the mapping in staticfiles.json, so
+{% static %} links change whenever a file does and nginx can let browsers
+keep them for a year. Text files also get .gz and .br siblings, written once
+here at maximum compression, which nginx serves as they are (gzip_static)
+instead of compressing on every request. A sibling is only kept when it is
+smaller than the original.
+"""
+import gzip
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.ico')
+# Below this the compression framing outweighs the savings
+MIN_COMPRESS_SIZE = 256
+
+
+def _gzip(content):
+    # mtime=0 keeps the output identical between runs
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def _brotli(content):
+    return brotli.compress(content, quality=11)
+
+
+ENCODINGS = {'.gz': _gzip, '.br': _brotli}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            for compressed, processed in self.compress(name):
+                yield name, compressed, processed
+
+    def compress(self, name):
+        """Write the .gz and .br siblings of a collected file"""
+        if not name.endswith(COMPRESSED_EXTENSIONS):
+            return
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, encode in ENCODINGS.items():
+            encoded = encode(content)
+            if len(encoded) >= len(content):
+                continue
+            target = name + suffix
+            if self.exists(target):
+                self.delete(target)
+            self._save(target, ContentFile(encoded))
+            yield target, True
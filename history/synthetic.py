@@ -0,0 +1,118 @@
+"""
+Synthetic heritage catalogue for load tests and benchmarks.
+
+Records are generated from a seeded random.Random, so the same arguments
+always produce the same catalogue, and written through bulk.import_records.
+Rerunning with the same seed updates the rows instead of duplicating them.
+Fan-out is deliberately uneven: period popularity follows a Pareto
+distribution, so a few periods own most figures and sites, and sites link to
+figures of their own periods the way real monuments do.
+"""
+import random
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from PIL import Image, ImageDraw
+
+from . import images
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+
+SYLLABLES = [
+    'al', 'bek', 'dor', 'gul', 'ja', 'kho', 'mir', 'nur', 'ob', 'qo', 'ra', 'sam',
+    'shah', 'tem', 'ul', 'xon', 'yor', 'zar', 'iz', 'bu',
+]
+PERIOD_WORDS = ['Empire', 'Khanate', 'Dynasty', 'Era', 'Emirate', 'Kingdom']
+SITE_WORDS = ['Madrasa', 'Mosque', 'Mausoleum', 'Minaret', 'Caravanserai', 'Fortress', 'Bazaar', 'Palace']
+WORDS = (
+    'ancient silk road caravan city scholar poet ruler architect minaret dome tile mosaic '
+    'trade library observatory garden fortress river oasis desert dynasty court manuscript '
+    'astronomy mathematics poetry calligraphy craftsmen bazaar pilgrimage restoration heritage'
+).split()
+ROLES = [role for role, _ in HistoricalFigure.ROLE_CHOICES]
+CITIES = [city for city, _ in HistoricalSite.CITY_CHOICES]
+# Uzbekistan's bounding box
+LATITUDES = (37.2, 45.6)
+LONGITUDES = (56.0, 73.1)
+IMAGE_SIZE = (1600, 1000)
+
+
+def _word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def _text(rng, low=40, high=120):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def generate_records(periods, figures, sites, seed=0):
+    """Yield (line_number, record) pairs in the bulk import format"""
+    rng = random.Random(seed)
+    line = 0
+    spans = []
+    for i in range(periods):
+        start = rng.randint(-500, 1950)
+        end = None if rng.random() < 0.05 else start + rng.randint(20, 400)
+        spans.append((f'{_word(rng)} {rng.choice(PERIOD_WORDS)} {i + 1}', start, end))
+        line += 1
+        yield line, {
+            'type': 'period', 'name': spans[-1][0], 'start_year': start, 'end_year': end,
+            'description': _text(rng),
+        }
+
+    weights = [rng.paretovariate(1.2) for _ in range(periods)]
+    figures_by_period = [[] for _ in range(periods)]
+    for i in range(figures):
+        period = rng.choices(range(periods), weights)[0]
+        name, start, end = spans[period]
+        birth = rng.randint(start - 40, end if end is not None else start + 100)
+        figure_name = f'{_word(rng)} {_word(rng)} {i + 1}'
+        figures_by_period[period].append(figure_name)
+        line += 1
+        yield line, {
+            'type': 'figure', 'name': figure_name, 'birth_year': birth,
+            'death_year': birth + rng.randint(25, 85), 'biography': _text(rng, 80, 250),
+            'role': rng.choice(ROLES), 'time_period': name,
+        }
+
+    for i in range(sites):
+        linked = set(rng.choices(range(periods), weights, k=rng.randint(1, 3)))
+        candidates = [figure for period in linked for figure in figures_by_period[period]]
+        count = min(len(candidates), int(rng.paretovariate(1.5)) - 1)
+        line += 1
+        yield line, {
+            'type': 'site', 'name': f'{_word(rng)} {rng.choice(SITE_WORDS)} {i + 1}',
+            'city': rng.choice(CITIES), 'built_year': min(spans[period][1] for period in linked) + rng.randint(0, 50),
+            'description': _text(rng), 'time_periods': [spans[period][0] for period in sorted(linked)],
+            'related_figures': rng.sample(candidates, count) if count > 0 else [],
+            'latitude': round(rng.uniform(*LATITUDES), 5), 'longitude': round(rng.uniform(*LONGITUDES), 5),
+        }
+
+
+def _image(rng):
+    image = Image.new('RGB', IMAGE_SIZE, tuple(rng.randint(40, 200) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randint(0, IMAGE_SIZE[0]), rng.randint(0, IMAGE_SIZE[1])
+        radius = rng.randint(40, 300)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return ContentFile(buffer.getvalue())
+
+
+def add_images(fraction, seed=0, variants=True):
+    """Attach a generated photo to a share of the objects that have none; returns their pks per type"""
+    rng = random.Random(seed)
+    pictured = {}
+    for kind, model in (('period', TimePeriod), ('figure', HistoricalFigure), ('site', HistoricalSite)):
+        field = model._meta.get_field('image')
+        pks = list(model.objects.filter(Q(image='') | Q(image__isnull=True)).order_by('pk').values_list('pk', flat=True))
+        pictured[kind] = rng.sample(pks, int(len(pks) * fraction))
+        for pk in pictured[kind]:
+            name = field.storage.save(f'{field.upload_to}synthetic-{pk}.jpg', _image(rng))
+            model.objects.filter(pk=pk).update(image=name)
+            if variants:
+                images.generate_variants(model.objects.get(pk=pk))
+    return pictured
@@ -0,0 +1,150 @@
+"""
+Database-backed background jobs.
+
+Work that does not need to finish inside the request (image decoding and
+resizing, search-index and related-content updates, cache warming) is queued as a Job row and
+executed by `manage.py run_worker`. Failed jobs are retried with exponential
+backoff until max_attempts. With TASKS_EAGER set, jobs run inline instead,
+which is what local development and the test suite use.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragments, graph, images, listing, metrics, pagecache, prerender, search, stats
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+STALE_AFTER = timedelta(minutes=10)
+
+
+def task(func):
+    """Register a function so it can be queued by name"""
+    TASKS[func.__name__] = func
+    return func
+
+
+def enqueue(name, key='', **payload):
+    """Queue a registered task, or run it now when TASKS_EAGER is set"""
+    if settings.TASKS_EAGER:
+        # Background work in production, so not the request's queries
+        with metrics.upkeep():
+            TASKS[name](**payload)
+        return None
+    if key and Job.objects.filter(key=key, status=Job.QUEUED).exists():
+        return None
+    return Job.objects.create(name=name, key=key, payload=payload)
+
+
+def enqueue_for(name, instance):
+    """Queue a task that takes a model label and pk"""
+    label = instance._meta.label_lower
+    return enqueue(name, key=f'{name}:{label}:{instance.pk}', model=label, pk=instance.pk)
+
+
+def _load(model, pk):
+    return apps.get_model(model).objects.filter(pk=pk).first()
+
+
+@task
+def index_object(model, pk):
+    instance = _load(model, pk)
+    if instance is not None:
+        search.index_object(instance)
+
+
+@task
+def generate_image_variants(model, pk):
+    instance = _load(model, pk)
+    if instance is not None and images.needs_variants(instance):
+        images.generate_variants(instance)
+        # The card carries the new <picture> sources
+        listing.refresh(instance)
+        stats.touch()
+        pagecache.purge_object(instance)
+        prerender.discard_object(instance)
+
+
+@task
+def warm_caches(model, pk):
+    card = listing.CARD_MODELS[apps.get_model(model)].objects.filter(pk=pk).first()
+    if card is not None:
+        fragments.render_cards([card])
+    stats.homepage_context()
+
+
+@task
+def refresh_related(model, pk):
+    # Runs for deleted objects too, to drop them from their neighbours' rows
+    affected = graph.refresh(graph.KINDS[apps.get_model(model)], pk)
+    # Their suggestions may have changed
+    paths = pagecache.detail_paths(affected)
+    pagecache.purge_paths(paths)
+    if settings.PRERENDER:
+        prerender.discard(paths)
+
+
+def claim_next():
+    """Mark the next due job as running and return it, or None"""
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.first()
+        if job is None:
+            return None
+        claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, started_at=now,
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def run_job(job):
+    """Execute a claimed job and record its outcome"""
+    try:
+        TASKS[job.name](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+            logger.error('Job %s (%s) failed permanently', job.pk, job.name)
+        else:
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'last_error', 'run_after', 'finished_at'])
+    return job
+
+
+def requeue_stale():
+    """Return jobs left running by a worker that died to the queue"""
+    return Job.objects.filter(status=Job.RUNNING, started_at__lt=timezone.now() - STALE_AFTER).update(
+        status=Job.QUEUED,
+    )
+
+
+def run_pending(limit=None):
+    """Run due jobs until the queue is empty (or `limit` jobs ran)"""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
@@ -0,0 +1,53 @@
+import re
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.utils.safestring import mark_safe
+
+from .. import fragments, images
+
+register = template.Library()
+
+CARD_SIZES = '(max-width: 768px) 100vw, 350px'
+
+
+@register.simple_tag
+def render_cards(objects, variant='list'):
+    """Render cards for a list of periods, figures or sites from the fragment cache"""
+    return fragments.render_cards(objects, variant)
+
+
+@register.inclusion_tag('history/includes/responsive_image.html')
+def responsive_image(obj, sizes=CARD_SIZES):
+    """Render an object's image as a <picture> over its generated variants"""
+    context = images.picture_context(obj.image, obj.image_variants)
+    context.update({'alt': obj.name, 'sizes': sizes})
+    return context
+
+
+@register.inclusion_tag('history/includes/responsive_image.html')
+def card_image(card, sizes=CARD_SIZES):
+    """Render a listing card's precomputed <picture>"""
+    return {**card.picture, 'alt': card.name, 'sizes': sizes}
+
+
+@lru_cache(maxsize=None)
+def _minified_css(path):
+    found = finders.find(path)
+    if found is None:
+        raise ValueError(f'Static file {path!r} not found')
+    with open(found, encoding='utf-8') as source:
+        css = source.read()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{}:;,>])\s*', r'\1', css).strip()
+
+
+@register.simple_tag
+def inline_css(path):
+    """A static stylesheet's contents, minified, for a <style> block"""
+    if settings.DEBUG:
+        _minified_css.cache_clear()
+    return mark_safe(_minified_css(path))
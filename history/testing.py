@@ -0,0 +1,27 @@
+from django.urls import resolve
+from urllib.parse import urlsplit
+
+from . import metrics
+
+
+class QueryBudgetMixin:
+    """TestCase mixin that fails when a view runs more queries than its @query_budget"""
+
+    def assertWithinQueryBudget(self, url, data=None, method='get', client=None, **kwargs):
+        """Request url and count its queries the way QueryMetricsMiddleware charges them"""
+        client = client or self.client
+        match = resolve(urlsplit(url).path)
+        budget = metrics.budget_for(match.func, method.upper())
+        if budget is None:
+            self.fail(f'{match.view_name} does not declare a query budget')
+        recorder = metrics.QueryRecorder()
+        with metrics.recording(recorder):
+            response = getattr(client, method)(url, data, **kwargs)
+        charged = recorder.count - recorder.upkeep
+        if charged > budget:
+            statements = '\n'.join(f'{count} x {sql}' for sql, count in recorder.signatures.items())
+            self.fail(
+                f'{match.view_name} ran {charged} queries, budget is {budget} '
+                f'({recorder.upkeep} more were upkeep):\n{statements}'
+            )
+        return response
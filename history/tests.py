@@ -1,7 +1,38 @@
-from django.test import TestCase, Client
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+import brotli
+from PIL import Image
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, Client, override_settings
 from django.contrib.auth.models import User
-from django.urls import reverse
-from .models import TimePeriod, HistoricalFigure, HistoricalSite
+from django.urls import resolve, reverse
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, HomepageStats, Job, RelatedContent, FigureCard, PeriodCard, SiteCard
+from . import api, async_views, autocomplete, benchmark, bulk, fragments, geo, graph, listing, metrics, pool, prerender, routers, search, stats, synthetic, tasks, timeline, views, widgets
+from .pagination import encode_cursor
+from .search import search as search_documents
+from .testing import QueryBudgetMixin
 
 
 class ModelTests(TestCase):
@@ -113,4 +144,1738 @@ class AuthenticationTests(TestCase):
             'username': 'testuser',
             'password': 'testpass123',
         })
-        self.assertEqual(response.status_code, 302)  # Redirects after login
\ No newline at end of file
+        self.assertEqual(response.status_code, 302)  # Redirects after login
+
+
+class PaginationTests(TestCase):
+    """Test keyset pagination on list pages"""
+    
+    def setUp(self):
+        """Create more rows than fit on one page"""
+        self.client = Client()
+        self.period = TimePeriod.objects.create(name='Period', start_year=1370, description='Test')
+        for i in range(5):
+            HistoricalFigure.objects.create(
+                name=f'Figure {i}',
+                birth_year=None if i < 2 else 1400 + i,
+                biography='Bio',
+                time_period=self.period
+            )
+            HistoricalSite.objects.create(name=f'Site {i}', city='bukhara', description='Desc')
+    
+    def test_pages_cover_all_rows_once(self):
+        """Test following next cursors visits every figure exactly once"""
+        seen = []
+        query = '?page_size=2'
+        while True:
+            response = self.client.get(reverse('history:figure_list') + query)
+            page = response.context['page']
+            seen.extend(figure.name for figure in page)
+            if not page.has_next:
+                break
+            query = page.next_query + '&page_size=2'
+        self.assertEqual(sorted(seen), [f'Figure {i}' for i in range(5)])
+        self.assertEqual(len(seen), 5)
+    
+    def test_previous_cursor_returns_previous_page(self):
+        """Test going back from the second page returns the first page"""
+        first = self.client.get(reverse('history:site_list') + '?page_size=2').context['page']
+        second = self.client.get(reverse('history:site_list') + first.next_query + '&page_size=2').context['page']
+        self.assertEqual([site.name for site in second], ['Site 2', 'Site 3'])
+        back = self.client.get(reverse('history:site_list') + second.previous_query + '&page_size=2').context['page']
+        self.assertEqual([site.name for site in back], ['Site 0', 'Site 1'])
+        self.assertFalse(back.has_previous)
+    
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        """Test a garbage cursor shows the first page"""
+        response = self.client.get(reverse('history:site_list') + '?after=not-a-cursor')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'][0].name, 'Site 0')
+    
+    def test_cursor_of_the_wrong_type_falls_back_to_first_page(self):
+        """Test a well-formed cursor whose values do not fit the ordering field shows the first page"""
+        for values in (['abc', 1], [1400, 10 ** 30]):
+            response = self.client.get(reverse('history:figure_list'), {'after': encode_cursor(values)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['page']), 5)
+
+
+class SearchTests(TestCase):
+    """Test full-text search"""
+    
+    def setUp(self):
+        """Create searchable content"""
+        self.client = Client()
+        self.period = TimePeriod.objects.create(
+            name='Timurid Empire',
+            start_year=1370,
+            description='An empire founded by Amir Temur with its capital in Samarkand'
+        )
+        self.figure = HistoricalFigure.objects.create(
+            name='Ulugh Beg',
+            birth_year=1394,
+            biography='Astronomer and ruler who built an observatory in Samarkand',
+            role='scientist',
+            time_period=self.period
+        )
+        self.site = HistoricalSite.objects.create(
+            name='Samarkand Observatory',
+            city='samarkand',
+            description='Observatory built by <Ulugh Beg>',
+        )
+    
+    def test_search_returns_hits_from_all_models(self):
+        """Test one query finds periods, figures and sites"""
+        response = self.client.get(reverse('history:search'), {'q': 'samarkand'})
+        kinds = {hit.kind for hit in response.context['results']}
+        self.assertEqual(kinds, {'period', 'figure', 'site'})
+    
+    def test_title_matches_rank_first(self):
+        """Test a match in the name outranks a match in the body"""
+        response = self.client.get(reverse('history:search'), {'q': 'observatory'})
+        results = response.context['results']
+        self.assertEqual(results[0].kind, 'site')
+        self.assertEqual(len(results), 2)
+    
+    def test_hits_are_highlighted_and_escaped(self):
+        """Test matched terms are marked and body HTML is escaped"""
+        response = self.client.get(reverse('history:search'), {'q': 'ulugh'})
+        self.assertContains(response, '<mark>Ulugh</mark>')
+        self.assertContains(response, '&lt;<mark>Ulugh</mark> Beg&gt;')
+    
+    def test_index_follows_updates_and_deletes(self):
+        """Test the index is kept current by signals"""
+        self.figure.name = 'Mirzo Ulugbek'
+        self.figure.save()
+        self.assertEqual([hit.object_id for hit in search_documents('mirzo')], [self.figure.pk])
+        self.site.delete()
+        self.assertNotIn('site', {hit.kind for hit in search_documents('observatory')})
+    
+    def test_rebuild_writes_in_batches(self):
+        """Test the rebuild command indexes every object a batch at a time"""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(search.rebuild_index(batch_size=2), 3)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "history_searchdocument"')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual({hit.kind for hit in search_documents('samarkand')}, {'period', 'figure', 'site'})
+    
+    def test_query_syntax_is_not_interpreted(self):
+        """Test FTS operators in user input do not raise"""
+        response = self.client.get(reverse('history:search'), {'q': 'samarkand" OR NEAR('})
+        self.assertEqual(response.status_code, 200)
+
+
+class FragmentCacheTests(TestCase):
+    """Test the rendered card cache"""
+    
+    def setUp(self):
+        """Create content and start from an empty fragment cache"""
+        caches['fragments'].clear()
+        self.client = Client()
+        self.period = TimePeriod.objects.create(name='Shaybanid Khanate', start_year=1500, description='Test')
+        self.figure = HistoricalFigure.objects.create(
+            name='Muhammad Shaybani', biography='Bio', role='ruler', time_period=self.period
+        )
+        self.site = HistoricalSite.objects.create(name='Mir-i-Arab Madrasa', city='bukhara', description='Desc')
+    
+    def test_cards_are_cached_after_first_render(self):
+        """Test list cards are stored under their model, variant and pk"""
+        self.client.get(reverse('history:site_list'))
+        key = fragments.card_key('site', self.site.pk, 'list')
+        marker, html = caches['fragments'].get(key)
+        self.assertEqual(marker, self.site.card.updated_at.isoformat())
+        self.assertIn('Mir-i-Arab Madrasa', html)
+    
+    def test_saving_object_invalidates_its_card(self):
+        """Test an edited object is re-rendered on the next request"""
+        self.client.get(reverse('history:site_list'))
+        self.site.name = 'Kalyan Minaret'
+        self.site.save()
+        response = self.client.get(reverse('history:site_list'))
+        self.assertContains(response, 'Kalyan Minaret')
+        self.assertNotContains(response, 'Mir-i-Arab Madrasa')
+    
+    def test_renaming_period_invalidates_figure_cards(self):
+        """Test figure cards pick up a renamed period"""
+        self.client.get(reverse('history:figure_list'))
+        self.period.name = 'Bukhara Khanate'
+        self.period.save()
+        response = self.client.get(reverse('history:figure_list'))
+        self.assertContains(response, 'Period: Bukhara Khanate')
+    
+    def test_m2m_change_invalidates_site_card(self):
+        """Test changing site relations drops the cached card"""
+        self.client.get(reverse('history:site_list'))
+        self.site.time_periods.add(self.period)
+        key = fragments.card_key('site', self.site.pk, 'list')
+        self.assertIsNone(caches['fragments'].get(key))
+    
+    @override_settings(TASKS_EAGER=False)
+    def test_clear_invalidates_cards_on_the_other_side(self):
+        """Test clearing a period's sites drops the cached cards of those sites"""
+        self.site.time_periods.add(self.period)
+        self.client.get(reverse('history:site_list'))
+        key = fragments.card_key('site', self.site.pk, 'list')
+        self.assertIsNotNone(caches['fragments'].get(key))
+        self.period.sites.clear()
+        self.assertIsNone(caches['fragments'].get(key))
+
+
+class MetricsTests(TestCase):
+    """Test query instrumentation and the metrics endpoint"""
+    
+    def setUp(self):
+        """Start from empty histograms"""
+        metrics.registry.clear()
+        self.client = Client()
+        TimePeriod.objects.create(name='Test Period', start_year=1500, description='Test')
+    
+    def test_requests_are_recorded_per_view(self):
+        """Test a request shows up in the exposition under its URL name"""
+        self.client.get(reverse('history:period_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE heritage_view_queries histogram', body)
+        self.assertIn('heritage_view_queries_count{view="history:period_list"', body)
+        self.assertIn('heritage_view_duplicate_queries_sum{view="history:period_list"', body)
+    
+    def test_duplicate_queries_are_counted(self):
+        """Test repeated statements are reported as N+1 signatures"""
+        recorder = metrics.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in (1, 2, 3):
+                list(TimePeriod.objects.filter(pk=pk))
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.duplicates, 2)
+    
+    def test_recorder_covers_every_database(self):
+        """Test the recorder is installed on each alias, replicas included, and removed afterwards"""
+        recorder = metrics.QueryRecorder()
+        with metrics.recording(recorder):
+            self.assertTrue(all(recorder in alias.execute_wrappers for alias in connections.all()))
+            list(TimePeriod.objects.using('default'))
+        self.assertEqual(recorder.count, 1)
+        self.assertFalse(any(recorder in alias.execute_wrappers for alias in connections.all()))
+    
+    def test_metrics_hidden_from_other_addresses(self):
+        """Test /metrics is not served to the public"""
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 404)
+    
+    def test_response_headers(self):
+        """Test benchmark headers are only added when enabled"""
+        response = self.client.get(reverse('history:period_list'))
+        self.assertNotIn('X-Query-Count', response)
+        with override_settings(METRICS_RESPONSE_HEADERS=True):
+            response = self.client.get(reverse('history:period_list'))
+        self.assertEqual(response['X-Query-Count'], '1')
+        self.assertGreater(int(response['X-Worker-RSS']), 0)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test every page stays within its declared query budget"""
+    
+    def setUp(self):
+        """Create a small connected catalogue and log in"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.period = TimePeriod.objects.create(name='Period', start_year=1370, description='Test', created_by=self.user)
+        self.figure = HistoricalFigure.objects.create(
+            name='Figure', biography='Bio', time_period=self.period, created_by=self.user
+        )
+        self.site = HistoricalSite.objects.create(name='Site', city='khiva', description='Desc', created_by=self.user)
+        self.site.time_periods.add(self.period)
+        self.site.related_figures.add(self.figure)
+        # Budgets describe steady state; the timeline index is rebuilt once per write
+        timeline.get_indexes(TimePeriod, HistoricalFigure, HistoricalSite)
+    
+    def test_pages_within_budget(self):
+        """Test read and edit pages against their budgets"""
+        urls = [
+            reverse('history:home'),
+            reverse('history:search') + '?q=period',
+            reverse('history:profile'),
+            reverse('history:period_list'),
+            reverse('history:figure_list'),
+            reverse('history:site_list'),
+            reverse('history:timeline') + '?year=1400',
+            reverse('history:timeline') + f'?period={self.period.pk}',
+            reverse('history:timeline_data') + '?start=1300&end=1500',
+        ]
+        for name in ('period', 'figure', 'site'):
+            pk = getattr(self, name).pk
+            for action in ('detail', 'edit', 'delete'):
+                urls.append(reverse(f'history:{name}_{action}', args=[pk]))
+            urls.append(reverse(f'history:{name}_create'))
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.assertWithinQueryBudget(url)
+                self.assertEqual(response.status_code, 200)
+    
+    def test_saves_within_post_budget(self):
+        """Test saves are held to their POST budgets, without the jobs run inline, as the middleware counts them"""
+        data = {'name': 'Site', 'city': 'bukhara', 'description': 'Desc', 'time_periods': [self.period.pk]}
+        url = reverse('history:site_edit', args=[self.site.pk])
+        with self.assertNoLogs('history.metrics', 'WARNING'):
+            response = self.assertWithinQueryBudget(url, data, method='post')
+        self.assertEqual(response.status_code, 302)
+        response = self.assertWithinQueryBudget(reverse('history:period_create'), {'name': 'New'}, method='post')
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget(reverse('history:figure_delete', args=[self.figure.pk]), method='post')
+        self.assertEqual(response.status_code, 302)
+
+
+class QueryPlanTests(TestCase):
+    """Test pages run a constant number of queries however many related rows exist"""
+    
+    def setUp(self):
+        """Create a period with many figures and sites"""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.period = TimePeriod.objects.create(name='Period', start_year=1370, description='Test', created_by=self.user)
+        self.site = HistoricalSite.objects.create(name='Site', city='khiva', description='Desc', created_by=self.user)
+        for i in range(6):
+            figure = HistoricalFigure.objects.create(
+                name=f'Figure {i}', biography='Bio', time_period=self.period, created_by=self.user
+            )
+            other = HistoricalSite.objects.create(name=f'Other {i}', city='termez', description='Desc')
+            other.time_periods.add(self.period)
+            other.related_figures.add(figure)
+            self.site.related_figures.add(figure)
+        self.site.time_periods.add(self.period)
+        self.figure = figure
+    
+    def test_home_queries(self):
+        """Test home reads one stats row once its cards are cached"""
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.client.get(reverse('history:home'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('history:home'))
+    
+    def test_period_detail_queries(self):
+        """Test period detail prefetches figures and sites"""
+        with self.assertNumQueries(3):
+            self.client.get(reverse('history:period_detail', args=[self.period.pk]))
+    
+    def test_figure_detail_queries(self):
+        """Test figure detail joins its period, prefetches sites and reads one suggestions row"""
+        with self.assertNumQueries(5):
+            self.client.get(reverse('history:figure_detail', args=[self.figure.pk]))
+    
+    def test_site_detail_queries(self):
+        """Test site detail prefetches periods and figures and reads one suggestions row"""
+        with self.assertNumQueries(5):
+            self.client.get(reverse('history:site_detail', args=[self.site.pk]))
+    
+    def test_profile_queries(self):
+        """Test profile counts come from the evaluated lists"""
+        self.client.login(username='testuser', password='testpass123')
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('history:profile'))
+        self.assertEqual(response.context['total_contributions'], 8)
+
+
+class HomepageStatsTests(TestCase):
+    """Test the materialized homepage statistics"""
+    
+    def setUp(self):
+        """Start from an empty homepage cache"""
+        cache.clear()
+        self.client = Client()
+        self.period = TimePeriod.objects.create(name='Period', start_year=1370, description='Test')
+    
+    def test_counters_follow_creates_and_deletes(self):
+        """Test totals are maintained incrementally"""
+        figure = HistoricalFigure.objects.create(name='Figure', biography='Bio', time_period=self.period)
+        HistoricalSite.objects.create(name='Site', city='khiva', description='Desc')
+        current = stats.get_stats()
+        self.assertEqual((current.periods_count, current.figures_count, current.sites_count), (1, 1, 1))
+        self.assertEqual(current.recent_figure_ids, [figure.pk])
+        figure.delete()
+        current = stats.get_stats()
+        self.assertEqual(current.figures_count, 0)
+        self.assertEqual(current.recent_figure_ids, [])
+    
+    def test_homepage_shows_edits(self):
+        """Test editing a featured site is visible on the next homepage"""
+        site = HistoricalSite.objects.create(name='Ark Fortress', city='bukhara', description='Desc')
+        self.assertContains(self.client.get(reverse('history:home')), 'Ark Fortress')
+        site.name = 'Ark of Bukhara'
+        site.save()
+        response = self.client.get(reverse('history:home'))
+        self.assertContains(response, 'Ark of Bukhara')
+        self.assertEqual(response.context['sites_count'], 1)
+    
+    def test_rebuild_command(self):
+        """Test rebuild_stats recomputes drifted counters"""
+        HomepageStats.objects.update(periods_count=42)
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertEqual(stats.get_stats().periods_count, 1)
+    
+    def test_missing_row_is_rebuilt(self):
+        """Test the homepage recovers if the stats row is gone"""
+        HomepageStats.objects.all().delete()
+        response = self.client.get(reverse('history:home'))
+        self.assertEqual(response.context['periods_count'], 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageVariantTests(TestCase):
+    """Test responsive image derivatives"""
+    
+    def setUp(self):
+        """Create a site with a wide uploaded image"""
+        caches['fragments'].clear()
+        self.client = Client()
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 500), 'teal').save(buffer, 'PNG')
+        self.site = HistoricalSite.objects.create(
+            name='Registan', city='samarkand', description='Desc',
+            image=SimpleUploadedFile('registan.png', buffer.getvalue(), content_type='image/png'),
+        )
+        self.site.refresh_from_db()
+    
+    def tearDown(self):
+        """Remove generated files"""
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+    
+    def test_variants_generated_on_upload(self):
+        """Test thumbnails narrower than the original are produced in every format"""
+        variants = self.site.image_variants
+        self.assertEqual(variants['source'], self.site.image.name)
+        self.assertEqual((variants['width'], variants['height']), (1000, 500))
+        self.assertEqual(sorted({v['width'] for v in variants['variants']}), [320, 640])
+        self.assertIn('WEBP', {v['format'] for v in variants['variants']})
+        for variant in variants['variants']:
+            self.assertTrue(default_storage.exists(variant['name']))
+            self.assertEqual(variant['height'], variant['width'] // 2)
+    
+    def test_card_uses_srcset(self):
+        """Test list cards emit a picture element with srcset and sizes"""
+        response = self.client.get(reverse('history:site_list'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '-320w.jpg 320w')
+        self.assertContains(response, 'sizes="(max-width: 768px) 100vw, 350px"')
+    
+    def test_unchanged_image_is_not_reprocessed(self):
+        """Test saving without a new image keeps the existing variants"""
+        before = self.site.image_variants
+        self.site.description = 'Changed'
+        self.site.save()
+        self.site.refresh_from_db()
+        self.assertEqual(self.site.image_variants, before)
+    
+    def test_removing_image_clears_variants(self):
+        """Test clearing the image deletes its derivatives"""
+        names = [v['name'] for v in self.site.image_variants['variants']]
+        self.site.image = None
+        self.site.save()
+        self.site.refresh_from_db()
+        self.assertEqual(self.site.image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    """Test the database-backed job queue"""
+    
+    def setUp(self):
+        """Create a period with queued side effects"""
+        self.period = TimePeriod.objects.create(name='Samanid State', start_year=819, description='Bukhara')
+    
+    def test_saves_queue_index_update(self):
+        """Test search indexing happens in the worker, not the request"""
+        job = Job.objects.get(name='index_object')
+        self.assertEqual(job.payload, {'model': 'history.timeperiod', 'pk': self.period.pk})
+        self.assertEqual(search_documents('samanid'), [])
+        call_command('run_worker', '--once', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual([hit.object_id for hit in search_documents('samanid')], [self.period.pk])
+    
+    def test_queued_jobs_are_deduplicated(self):
+        """Test repeated saves queue one index update"""
+        self.period.save()
+        self.period.save()
+        self.assertEqual(Job.objects.filter(name='index_object', status=Job.QUEUED).count(), 1)
+    
+    def test_failed_job_is_retried_then_marked_failed(self):
+        """Test failures back off and give up after max_attempts"""
+        tasks.TASKS['explode'] = lambda: 1 / 0
+        self.addCleanup(tasks.TASKS.pop, 'explode')
+        job = tasks.enqueue('explode')
+        Job.objects.exclude(pk=job.pk).delete()
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        tasks.run_job(tasks.claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ZeroDivisionError', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        tasks.run_job(tasks.claim_next())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+    
+    def test_stale_running_jobs_are_requeued(self):
+        """Test jobs abandoned by a dead worker go back to the queue"""
+        Job.objects.update(status=Job.RUNNING, started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(tasks.requeue_stale(), Job.objects.count())
+
+
+class BulkImportExportTests(TestCase):
+    """Test the import_heritage and export_heritage commands"""
+    
+    def setUp(self):
+        """Create a small connected catalogue"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, ignore_errors=True)
+        period = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, end_year=1507, description='Era')
+        figure = HistoricalFigure.objects.create(
+            name='Amir Temur', birth_year=1336, death_year=1405, biography='Founder', role='ruler', time_period=period
+        )
+        site = HistoricalSite.objects.create(name='Gur-e-Amir', city='samarkand', built_year=1403, description='Tomb')
+        site.time_periods.add(period)
+        site.related_figures.add(figure)
+    
+    def roundtrip(self, filename):
+        """Export, wipe the catalogue and import the file again"""
+        path = f'{self.tmpdir}/{filename}'
+        call_command('export_heritage', path, stdout=StringIO(), stderr=StringIO())
+        TimePeriod.objects.all().delete()
+        HistoricalSite.objects.all().delete()
+        call_command('import_heritage', path, '--batch-size', '2', stdout=StringIO(), stderr=StringIO())
+    
+    def assertCatalogueRestored(self):
+        site = HistoricalSite.objects.get(name='Gur-e-Amir')
+        self.assertEqual(site.built_year, 1403)
+        self.assertEqual([p.name for p in site.time_periods.all()], ['Timurid Empire'])
+        self.assertEqual([f.name for f in site.related_figures.all()], ['Amir Temur'])
+        figure = HistoricalFigure.objects.get(name='Amir Temur')
+        self.assertEqual((figure.role, figure.time_period.name), ('ruler', 'Timurid Empire'))
+        self.assertEqual(TimePeriod.objects.get().end_year, 1507)
+        self.assertEqual(stats.get_stats().sites_count, 1)
+        self.assertEqual(len(search_documents('amir')), 2)
+    
+    def test_jsonl_roundtrip(self):
+        """Test a JSON Lines export imports back with relations"""
+        self.roundtrip('catalogue.jsonl')
+        self.assertCatalogueRestored()
+    
+    def test_csv_roundtrip(self):
+        """Test a CSV export imports back with relations"""
+        self.roundtrip('catalogue.csv')
+        self.assertCatalogueRestored()
+    
+    def test_import_updates_existing_rows_by_name(self):
+        """Test records matching an existing name update it in place"""
+        path = f'{self.tmpdir}/update.jsonl'
+        with open(path, 'w') as stream:
+            stream.write('{"type": "period", "name": "Timurid Empire", "start_year": 1370, "description": "New"}\n')
+            stream.write('{"type": "figure", "name": "Ulugh Beg", "time_period": "Timurid Empire", "biography": "Astronomer"}\n')
+            stream.write('{"type": "figure", "name": "Nobody", "time_period": "Missing", "biography": "?"}\n')
+        stderr = StringIO()
+        call_command('import_heritage', path, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(TimePeriod.objects.get().description, 'New')
+        self.assertEqual(HistoricalFigure.objects.count(), 2)
+        self.assertIn("unknown time period 'Missing'", stderr.getvalue())
+    
+    def test_bad_values_skip_their_record(self):
+        """Test lists, fractions and values outside the choices are reported and skipped, not imported or fatal"""
+        path = f'{self.tmpdir}/bad.jsonl'
+        records = [
+            {'type': 'site', 'name': 'Listed Year', 'city': 'khiva', 'built_year': [1420]},
+            {'type': 'site', 'name': 'Fractional Year', 'city': 'khiva', 'built_year': 1420.7},
+            {'type': 'site', 'name': 'Atlantis Gate', 'city': 'atlantis'},
+            {'type': 'site', 'name': 'Odd Links', 'city': 'khiva', 'related_figures': 7},
+            {'type': 'figure', 'name': 'Court Jester', 'role': 'jester', 'time_period': 'Timurid Empire'},
+            {'type': 'period', 'name': 'Endless', 'start_year': 1500, 'end_year': {'year': 1600}},
+            {'type': 'site', 'name': 'Kalta Minor', 'city': 'khiva', 'built_year': '1851.0', 'latitude': 41.3779},
+        ]
+        with open(path, 'w') as stream:
+            stream.writelines(json.dumps(record) + '\n' for record in records)
+        stderr = StringIO()
+        call_command('import_heritage', path, stdout=StringIO(), stderr=stderr)
+        messages = stderr.getvalue()
+        for message in ('line 1: built_year must be a number', 'line 2: built_year must be a whole number',
+                        "line 3: unknown city 'atlantis'", 'line 4: related_figures must be a list of names',
+                        "line 5: unknown role 'jester'", 'line 6: end_year must be a number'):
+            self.assertIn(message, messages)
+        self.assertEqual(HistoricalSite.objects.get(name='Kalta Minor').built_year, 1851)
+        self.assertEqual(HistoricalSite.objects.count(), 2)
+        self.assertEqual(HistoricalFigure.objects.count(), 1)
+        self.assertEqual(TimePeriod.objects.count(), 1)
+    
+    @override_settings(PAGE_CACHE=True)
+    def test_import_refreshes_only_imported_rows(self):
+        """Test derived data is rewritten for the imported objects alone, and their pages purged"""
+        caches['pages'].clear()
+        site_card = SiteCard.objects.get()
+        figure = HistoricalFigure.objects.get()
+        page = reverse('history:figure_detail', args=[figure.pk])
+        self.client.get(page)
+        self.assertEqual(self.client.get(page)['X-Page-Cache'], 'HIT')
+        path = f'{self.tmpdir}/rename.jsonl'
+        with open(path, 'w') as stream:
+            stream.write('{"type": "period", "name": "Timurid Empire", "start_year": 1370, "description": "Renamed era"}\n')
+            stream.write('{"type": "figure", "name": "Ulugh Beg", "time_period": "Timurid Empire", "biography": "Astronomer"}\n')
+        call_command('import_heritage', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(SiteCard.objects.get().updated_at, site_card.updated_at)
+        self.assertEqual(len(search_documents('astronomer')), 1)
+        self.assertEqual(FigureCard.objects.count(), 2)
+        self.assertEqual(self.client.get(page)['X-Page-Cache'], 'MISS')
+        ulugh_beg = HistoricalFigure.objects.get(name='Ulugh Beg')
+        related = RelatedContent.objects.get(kind='figure', object_id=ulugh_beg.pk)
+        self.assertEqual(related.neighbours, [f'period:{figure.time_period_id}'])
+    
+    def test_bad_record_rolls_back(self):
+        """Test a malformed line aborts the whole import"""
+        path = f'{self.tmpdir}/bad.jsonl'
+        with open(path, 'w') as stream:
+            stream.write('{"type": "period", "name": "Samanids", "start_year": 819, "description": "x"}\n')
+            stream.write('{"type": "castle", "name": "?"}\n')
+        with self.assertRaises(CommandError):
+            call_command('import_heritage', path, '--batch-size', '1', stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(TimePeriod.objects.filter(name='Samanids').exists())
+
+
+class ApiTests(TestCase):
+    """Test the read-only JSON API"""
+    
+    def setUp(self):
+        """Create a small connected catalogue"""
+        self.client = Client()
+        self.period = TimePeriod.objects.create(name='Khiva Khanate', start_year=1511, end_year=1920, description='Era')
+        self.figure = HistoricalFigure.objects.create(
+            name='Muhammad Rahim Khan', biography='Bio', role='ruler', time_period=self.period
+        )
+        self.site = HistoricalSite.objects.create(name='Itchan Kala', city='khiva', description='Walled city')
+        self.site.time_periods.add(self.period)
+        self.site.related_figures.add(self.figure)
+    
+    def test_list_with_sparse_fieldset(self):
+        """Test ?fields= limits the returned attributes"""
+        response = self.client.get(reverse('history:api_list', args=['periods']), {'fields': 'name,end_year'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data, [{'name': 'Khiva Khanate', 'end_year': 1920, 'url': f'/api/v1/periods/{self.period.pk}/'}])
+    
+    def test_detail_with_includes(self):
+        """Test ?include= embeds related objects"""
+        url = reverse('history:api_detail', args=['sites', self.site.pk])
+        data = self.client.get(url, {'include': 'time_periods,related_figures'}).json()['data']
+        self.assertEqual(data['city'], 'khiva')
+        self.assertEqual([p['name'] for p in data['time_periods']], ['Khiva Khanate'])
+        self.assertEqual([f['id'] for f in data['related_figures']], [self.figure.pk])
+    
+    def test_includes_are_batched(self):
+        """Test embedding relations costs one query per relation, not per row"""
+        for i in range(5):
+            HistoricalFigure.objects.create(name=f'Figure {i}', biography='Bio', time_period=self.period)
+        url = reverse('history:api_list', args=['figures'])
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'include': 'time_period,sites'})
+        self.assertEqual(len(response.json()['data']), 6)
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'fields': 'name', 'include': 'time_period'})
+        self.assertEqual(response.json()['data'][0]['time_period']['name'], 'Khiva Khanate')
+    
+    def test_cursor_pagination(self):
+        """Test list responses link to the next page"""
+        HistoricalSite.objects.create(name='Kalta Minor', city='khiva', description='Minaret')
+        url = reverse('history:api_list', args=['sites'])
+        first = self.client.get(url, {'page_size': 1}).json()
+        self.assertEqual(first['data'][0]['name'], 'Itchan Kala')
+        second = self.client.get(first['links']['next']).json()
+        self.assertEqual(second['data'][0]['name'], 'Kalta Minor')
+        self.assertIsNone(second['links']['next'])
+    
+    def test_conditional_get(self):
+        """Test a matching ETag returns 304 until the content changes"""
+        url = reverse('history:api_detail', args=['figures', self.figure.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.figure.name = 'Feruz'
+        self.figure.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['name'], 'Feruz')
+    
+    def test_conditional_get_of_missing_object(self):
+        """Test validators that would match still give 404 for an object that does not exist"""
+        url = reverse('history:api_detail', args=['figures', self.figure.pk + 100])
+        etag, last_modified = api._validators(RequestFactory().get(url), api.RESOURCES['figures'], [])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(last_modified))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_relation_change_changes_etag(self):
+        """Test editing a site relation invalidates embedded representations"""
+        url = reverse('history:api_detail', args=['sites', self.site.pk])
+        etag = self.client.get(url, {'include': 'related_figures'})['ETag']
+        self.site.related_figures.clear()
+        response = self.client.get(url, {'include': 'related_figures'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['related_figures'], [])
+    
+    def test_unknown_field_is_rejected(self):
+        """Test invalid sparse fieldsets return 400"""
+        response = self.client.get(reverse('history:api_list', args=['sites']), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+
+class TimelineTests(TestCase):
+    """Test the timeline interval index and views"""
+    
+    def setUp(self):
+        """Create periods, figures and sites spread over several centuries"""
+        self.client = Client()
+        timeline.clear()
+        self.timurid = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, end_year=1507, description='Era')
+        self.soviet = TimePeriod.objects.create(name='Soviet Era', start_year=1924, end_year=1991, description='Era')
+        self.modern = TimePeriod.objects.create(name='Independence', start_year=1991, description='Ongoing')
+        self.ulugh_beg = HistoricalFigure.objects.create(
+            name='Ulugh Beg', birth_year=1394, death_year=1449, biography='Bio', time_period=self.timurid
+        )
+        self.navoi = HistoricalFigure.objects.create(
+            name='Alisher Navoi', birth_year=1441, death_year=1501, biography='Bio', time_period=self.timurid
+        )
+        self.unknown = HistoricalFigure.objects.create(name='Unknown', biography='Bio', time_period=self.timurid)
+        self.madrasa = HistoricalSite.objects.create(name='Ulugh Beg Madrasa', city='samarkand', built_year=1420, description='Desc')
+        self.undated = HistoricalSite.objects.create(name='Undated', city='other', description='Desc')
+    
+    def names(self, querysets):
+        return {model: sorted(queryset.values_list('name', flat=True)) for model, queryset in querysets.items()}
+    
+    def test_index_matches_brute_force(self):
+        """Test overlap queries against a linear scan"""
+        intervals = [((i * 37) % 500, None if i % 7 == 0 else (i * 37) % 500 + i % 40, i) for i in range(300)]
+        index = timeline.IntervalIndex(intervals)
+        for start, end in [(0, 0), (120, 130), (499, 499), (250, None), (600, 700), (-5, 10)]:
+            expected = [
+                key for first, last, key in sorted(intervals, key=lambda interval: (interval[0], interval[2]))
+                if first <= (float('inf') if end is None else end) and (last is None or last >= start)
+            ]
+            self.assertEqual(index.overlapping(start, end), expected)
+            self.assertEqual(index.overlapping(start, end, 5), expected[:5])
+    
+    def test_active_in_year(self):
+        """Test what existed in a single year"""
+        found = self.names(timeline.active_in(1420))
+        self.assertEqual(found[TimePeriod], ['Timurid Empire'])
+        self.assertEqual(found[HistoricalFigure], ['Ulugh Beg'])
+        self.assertEqual(found[HistoricalSite], ['Ulugh Beg Madrasa'])
+    
+    def test_ongoing_intervals(self):
+        """Test open-ended periods and sites reach the present"""
+        found = self.names(timeline.active_in(2020))
+        self.assertEqual(found[TimePeriod], ['Independence'])
+        self.assertEqual(found[HistoricalFigure], [])
+        self.assertEqual(found[HistoricalSite], ['Ulugh Beg Madrasa'])
+    
+    def test_index_follows_changes(self):
+        """Test the in-process index is rebuilt after a write"""
+        self.assertEqual(self.names(timeline.active_in(1500))[HistoricalFigure], ['Alisher Navoi'])
+        self.navoi.death_year = 1499
+        self.navoi.save()
+        self.assertEqual(self.names(timeline.active_in(1500))[HistoricalFigure], [])
+    
+    def test_limit_bounds_the_lookup(self):
+        """Test only a page of keys reaches the database, the earliest first"""
+        for i in range(views.TIMELINE_LIMIT + 10):
+            HistoricalSite.objects.create(name=f'Caravanserai {i:02}', city='other', built_year=1500 + i, description='Desc')
+        sites = timeline.active_in(2000, limit=3)[HistoricalSite]
+        self.assertLessEqual(len(sites.query.sql_with_params()[1]), 3)
+        self.assertEqual(sorted(sites.values_list('name', flat=True)), ['Caravanserai 00', 'Caravanserai 01', 'Ulugh Beg Madrasa'])
+        response = self.client.get(reverse('history:timeline'), {'year': 2000})
+        self.assertEqual(len(response.context['sites']), views.TIMELINE_LIMIT)
+    
+    def test_period_overlap_view(self):
+        """Test listing the figures and sites overlapping a period"""
+        response = self.client.get(reverse('history:timeline'), {'period': self.timurid.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(f.name for f in response.context['figures']), ['Alisher Navoi', 'Ulugh Beg'])
+        self.assertEqual([s.name for s in response.context['sites']], ['Ulugh Beg Madrasa'])
+    
+    def test_year_view(self):
+        """Test the year view shows what existed then"""
+        response = self.client.get(reverse('history:timeline'), {'year': 1991})
+        self.assertContains(response, 'Soviet Era')
+        self.assertContains(response, 'Independence')
+        self.assertNotContains(response, 'Ulugh Beg</h3>')
+    
+    def test_data_endpoint(self):
+        """Test the zoomable timeline returns items overlapping a window"""
+        response = self.client.get(reverse('history:timeline_data'), {'start': 1440, 'end': 1450})
+        items = response.json()['items']
+        self.assertEqual(
+            [(item['kind'], item['name']) for item in items],
+            [('period', 'Timurid Empire'), ('figure', 'Ulugh Beg'), ('site', 'Ulugh Beg Madrasa'), ('figure', 'Alisher Navoi')],
+        )
+        self.assertEqual(items[1]['url'], reverse('history:figure_detail', args=[self.ulugh_beg.pk]))
+        self.assertIsNone(items[2]['end'])
+    
+    def test_data_endpoint_rejects_bad_window(self):
+        """Test invalid windows return 400"""
+        response = self.client.get(reverse('history:timeline_data'), {'start': 1500, 'end': 1400})
+        self.assertEqual(response.status_code, 400)
+
+
+class RelatedContentTests(TestCase):
+    """Test the precomputed relationship graph"""
+    
+    def setUp(self):
+        """Create two periods with figures linked through shared sites"""
+        self.client = Client()
+        self.timurid = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, end_year=1507, description='Era')
+        self.shaybanid = TimePeriod.objects.create(name='Shaybanid', start_year=1500, end_year=1598, description='Era')
+        self.timur = HistoricalFigure.objects.create(name='Amir Temur', biography='Bio', time_period=self.timurid)
+        self.ulugh_beg = HistoricalFigure.objects.create(name='Ulugh Beg', biography='Bio', time_period=self.timurid)
+        self.abdullah = HistoricalFigure.objects.create(name='Abdullah Khan', biography='Bio', time_period=self.shaybanid)
+        self.registan = HistoricalSite.objects.create(name='Registan', city='samarkand', description='Desc')
+        self.gur_emir = HistoricalSite.objects.create(name='Gur-e-Amir', city='samarkand', description='Desc')
+        self.ark = HistoricalSite.objects.create(name='Ark', city='bukhara', description='Desc')
+        self.registan.related_figures.add(self.timur, self.ulugh_beg)
+        self.gur_emir.related_figures.add(self.timur, self.ulugh_beg)
+        self.ark.time_periods.add(self.timurid)
+        self.ark.related_figures.add(self.abdullah)
+    
+    def related(self, instance):
+        return {kind: [obj.name for obj in objects] for kind, objects in graph.related_for(instance).items()}
+    
+    def test_graph_csr_neighbours(self):
+        """Test the CSR graph returns each node's links"""
+        built = graph.load_graph()
+        self.assertEqual(
+            built.neighbours(('site', self.registan.pk)),
+            [('figure', self.timur.pk), ('figure', self.ulugh_beg.pk)],
+        )
+        self.assertEqual(len(built.targets), 2 * 9)
+    
+    def test_sites_sharing_most_figures(self):
+        """Test sites sharing figures outrank sites sharing a period"""
+        self.assertEqual(self.related(self.registan), {'figures': [], 'sites': ['Gur-e-Amir']})
+        self.assertEqual(self.related(self.timur)['sites'], ['Ark'])
+        self.assertEqual(self.related(self.timur)['figures'], ['Ulugh Beg'])
+    
+    def test_incremental_refresh_matches_rebuild(self):
+        """Test signal-driven refreshes leave the same rows as a full rebuild"""
+        self.ark.related_figures.add(self.timur)
+        self.ulugh_beg.time_period = self.shaybanid
+        self.ulugh_beg.save()
+        self.gur_emir.related_figures.remove(self.ulugh_beg)
+        self.registan.delete()
+        fields = ('kind', 'object_id', 'neighbours', 'related_figures', 'related_sites')
+        incremental = sorted(RelatedContent.objects.values_list(*fields))
+        graph.rebuild()
+        self.assertEqual(incremental, sorted(RelatedContent.objects.values_list(*fields)))
+        self.assertEqual(self.related(self.ark)['sites'], ['Gur-e-Amir'])
+    
+    def test_refresh_does_not_walk_through_hubs(self):
+        """Test a new link to a hub leaves the hub's other neighbours alone and reads no more than its links"""
+        graph.rebuild()
+        self.addCleanup(setattr, graph, 'HUB_LIMIT', graph.HUB_LIMIT)
+        graph.HUB_LIMIT = 2
+        figure = HistoricalFigure.objects.create(name='Babur', biography='Bio', time_period=self.shaybanid)
+        # Without signals, so the refresh below sees the change
+        HistoricalFigure.objects.filter(pk=figure.pk).update(time_period=self.timurid)
+        with CaptureQueriesContext(connection) as queries:
+            affected = graph.refresh('figure', figure.pk)
+        # Abdullah Khan lost a two-hop neighbour through Shaybanid; Timurid is a hub and is not walked
+        expected = {('figure', figure.pk), ('period', self.timurid.pk), ('period', self.shaybanid.pk), ('figure', self.abdullah.pk)}
+        self.assertEqual(affected, expected)
+        self.assertTrue(all('WHERE' in query['sql'] for query in queries if query['sql'].startswith('SELECT')))
+        hub = RelatedContent.objects.get(kind='period', object_id=self.timurid.pk)
+        self.assertIn(f'figure:{figure.pk}', hub.neighbours)
+    
+    def test_detail_pages_show_suggestions(self):
+        """Test figure and site pages list two-hop suggestions"""
+        response = self.client.get(reverse('history:site_detail', args=[self.registan.pk]))
+        self.assertEqual([site.name for site in response.context['suggested_sites']], ['Gur-e-Amir'])
+        response = self.client.get(reverse('history:figure_detail', args=[self.ulugh_beg.pk]))
+        self.assertContains(response, 'You May Also Explore')
+        self.assertContains(response, 'Ark</a>')
+
+
+class AsyncViewTests(TestCase):
+    """Test the async read views used in ASGI mode"""
+    
+    def setUp(self):
+        """Create a small connected catalogue"""
+        self.factory = AsyncRequestFactory()
+        self.period = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, end_year=1507, description='Era')
+        self.figure = HistoricalFigure.objects.create(name='Ulugh Beg', biography='Bio', time_period=self.period)
+        self.site = HistoricalSite.objects.create(name='Registan', city='samarkand', description='Desc')
+        self.site.time_periods.add(self.period)
+        self.site.related_figures.add(self.figure)
+    
+    def request(self, path):
+        request = self.factory.get(path)
+        request.user = AnonymousUser()
+        return request
+    
+    async def test_home(self):
+        """Test the async home page renders the materialized stats"""
+        response = await async_views.home(self.request('/'))
+        self.assertContains(response, 'Ulugh Beg')
+        self.assertContains(response, 'Registan')
+    
+    async def test_lists_match_sync_views(self):
+        """Test async list pages render the same page as the sync views"""
+        for name in ('period_list', 'figure_list', 'site_list'):
+            request = self.request(reverse(f'history:{name}'))
+            async_response = await getattr(async_views, name)(request)
+            sync_response = await sync_to_async(getattr(views, name))(self.request(reverse(f'history:{name}')))
+            self.assertEqual(async_response.content, sync_response.content)
+    
+    async def test_details(self):
+        """Test async detail pages, including prefetched relations"""
+        response = await async_views.period_detail(self.request('/'), pk=self.period.pk)
+        self.assertContains(response, 'Ulugh Beg')
+        response = await async_views.figure_detail(self.request('/'), pk=self.figure.pk)
+        self.assertContains(response, 'Registan')
+        response = await async_views.site_detail(self.request('/'), pk=self.site.pk)
+        self.assertContains(response, 'Timurid Empire')
+    
+    async def test_missing_detail(self):
+        """Test a missing object raises Http404"""
+        with self.assertRaises(Http404):
+            await async_views.site_detail(self.request('/'), pk=self.site.pk + 100)
+    
+    async def test_metrics_middleware_counts_async_queries(self):
+        """Test the middleware records queries made from async views"""
+        metrics.registry.clear()
+        middleware = metrics.QueryMetricsMiddleware(async_views.site_list)
+        request = self.request(reverse('history:site_list'))
+        request.resolver_match = resolve(reverse('history:site_list'))
+        response = await middleware(request)
+        self.assertEqual(response.status_code, 200)
+        histogram = metrics.registry.histograms[('heritage_view_queries', 'history:site_list')]
+        # The page and one grouped count per facet
+        self.assertEqual(histogram.sum, 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SyntheticDataTests(TestCase):
+    """Test the synthetic catalogue generator and the benchmark harness"""
+    
+    def tearDown(self):
+        """Remove generated files"""
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+    
+    def test_records_are_reproducible(self):
+        """Test the same seed yields the same records"""
+        first = list(synthetic.generate_records(5, 40, 20, seed=3))
+        self.assertEqual(first, list(synthetic.generate_records(5, 40, 20, seed=3)))
+        self.assertNotEqual(first, list(synthetic.generate_records(5, 40, 20, seed=4)))
+        self.assertEqual(len(first), 65)
+    
+    def test_seed_command(self):
+        """Test seeding builds related rows and derived data, and reruns update in place"""
+        out = StringIO()
+        call_command('seed_synthetic', periods=5, figures=40, sites=20, images=0.1, no_variants=True, stdout=out)
+        self.assertEqual((TimePeriod.objects.count(), HistoricalFigure.objects.count(), HistoricalSite.objects.count()), (5, 40, 20))
+        self.assertTrue(HistoricalSite.time_periods.through.objects.exists())
+        self.assertEqual(HomepageStats.objects.get().figures_count, 40)
+        self.assertTrue(RelatedContent.objects.exists())
+        self.assertEqual(HistoricalSite.objects.exclude(image='').count(), 2)
+        call_command('seed_synthetic', periods=5, figures=40, sites=20, images=0, stdout=StringIO())
+        self.assertEqual(HistoricalFigure.objects.count(), 40)
+    
+    def test_seed_command_needs_periods_for_figures_and_sites(self):
+        """Test asking for figures or sites without periods is refused before anything is written"""
+        with self.assertRaisesMessage(CommandError, '--periods must be at least 1'):
+            call_command('seed_synthetic', periods=0, figures=3, sites=0, images=0, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, '--periods must be at least 1'):
+            call_command('seed_synthetic', periods=0, figures=0, sites=2, images=0, stdout=StringIO())
+        self.assertFalse(TimePeriod.objects.exists())
+    
+    def test_benchmark_covers_every_route(self):
+        """Test the harness fills in every named URL except logout"""
+        call_command('seed_synthetic', periods=2, figures=3, sites=2, images=0, stdout=StringIO())
+        labels = [label for label, _ in benchmark.benchmark_urls()]
+        self.assertNotIn('logout', labels)
+        self.assertIn('api_detail[sites]', labels)
+        paths = dict(benchmark.benchmark_urls())
+        self.assertEqual(paths['search'], reverse('history:search') + '?q=samarkand')
+        for label, path in paths.items():
+            with self.subTest(label=label):
+                self.assertLess(self.client.get(path).status_code, 400)
+    
+    def test_compare_flags_regressions(self):
+        """Test slower p95 or extra queries are reported as regressions"""
+        baseline = {'urls': {
+            'home': {'p95_ms': 10.0, 'queries': {'max': 5}},
+            'search': {'p95_ms': 10.0, 'queries': {'max': 3}},
+        }}
+        current = {'urls': {
+            'home': {'p95_ms': 10.5, 'queries': {'max': 6}},
+            'search': {'p95_ms': 9.0, 'queries': {'max': 3}},
+        }}
+        lines, regressions = benchmark.compare(baseline, current)
+        self.assertEqual(regressions, 1)
+        self.assertTrue(lines[0].startswith('REGRESSION home'))
+
+
+class FakeConnection:
+    """Stands in for a DB-API connection in the pool tests"""
+    
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+    
+    def cursor(self):
+        if not self.healthy:
+            raise OSError('server closed the connection')
+        return self
+    
+    def execute(self, sql):
+        pass
+    
+    def fetchone(self):
+        return (1,)
+    
+    def rollback(self):
+        if not self.healthy:
+            raise OSError('server closed the connection')
+    
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    """Test the per-process database connection pool"""
+    
+    def test_connections_are_reused(self):
+        """Test a returned connection is handed out again without reconnecting"""
+        connections = pool.ConnectionPool(size=2)
+        first = connections.getconn(FakeConnection)
+        connections.putconn(first)
+        self.assertIs(connections.getconn(FakeConnection), first)
+        stats = connections.snapshot()
+        self.assertEqual((stats['checkouts'], stats['connects'], stats['in_use']), (2, 1, 1))
+    
+    def test_overflow_is_closed_on_return(self):
+        """Test connections beyond the pool size are opened under load and closed afterwards"""
+        connections = pool.ConnectionPool(size=1, max_overflow=1)
+        first, second = connections.getconn(FakeConnection), connections.getconn(FakeConnection)
+        connections.putconn(first)
+        connections.putconn(second)
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+        self.assertEqual((connections.snapshot()['overflows'], connections.snapshot()['idle']), (1, 1))
+    
+    def test_checkout_times_out(self):
+        """Test a checkout waits for a free connection and then gives up"""
+        connections = pool.ConnectionPool(size=1, max_overflow=0, timeout=0.01)
+        connections.getconn(FakeConnection)
+        with self.assertRaises(pool.PoolTimeout):
+            connections.getconn(FakeConnection)
+        stats = connections.snapshot()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+    
+    def test_broken_connections_are_replaced(self):
+        """Test an idle connection failing its health check is swapped for a new one"""
+        connections = pool.ConnectionPool(size=1, check_after=0)
+        first = connections.getconn(FakeConnection)
+        connections.putconn(first)
+        first.healthy = False
+        second = connections.getconn(FakeConnection)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(connections.snapshot()['open'], 1)
+    
+    def test_pool_metrics_are_exposed(self):
+        """Test pool counters appear on /metrics"""
+        self.addCleanup(pool._pools.clear)
+        connections = pool.get_pool(('pooltest', 'db', '', '', ''), size=1)
+        connections.putconn(connections.getconn(FakeConnection))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('heritage_db_pool_checkouts_total{alias="pooltest"', body)
+        self.assertIn('state="idle"} 1', body)
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaRoutingTests(TestCase):
+    """Test reads are sent to replicas and writing sessions stay on the primary"""
+    
+    def setUp(self):
+        """Create a period and a signed-in user"""
+        self.period = TimePeriod.objects.create(name='Test Period', start_year=1500, description='Test')
+        self.user = User.objects.create_user(username='writer', password='testpass123')
+    
+    def test_router_uses_the_request_replica(self):
+        """Test app reads go to the chosen replica until the request writes"""
+        state = routers.RoutingState()
+        state.replica = 'replica_1'
+        token = routers._state.set(state)
+        self.addCleanup(routers._state.reset, token)
+        router = routers.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(HistoricalSite), 'replica_1')
+        self.assertIsNone(router.db_for_read(User))
+        self.assertEqual(router.db_for_write(HistoricalSite), 'default')
+        self.assertIsNone(router.db_for_read(HistoricalSite))
+    
+    def test_public_views_read_from_a_replica(self):
+        """Test detail pages use a replica while edit pages stay on the primary"""
+        response = self.client.get(reverse('history:period_detail', args=[self.period.pk]))
+        self.assertEqual(response.wsgi_request.replica, 'default')
+        self.client.login(username='writer', password='testpass123')
+        response = self.client.get(reverse('history:period_create'))
+        self.assertIsNone(response.wsgi_request.replica)
+    
+    def test_writing_session_reads_its_writes(self):
+        """Test the redirect after a create is served from the primary"""
+        self.client.login(username='writer', password='testpass123')
+        response = self.client.post(reverse('history:period_create'), {
+            'name': 'New Period', 'start_year': 1600, 'description': 'Test',
+        }, follow=True)
+        self.assertContains(response, 'New Period')
+        self.assertIsNone(response.wsgi_request.replica)
+        session = self.client.session
+        session[routers.STICKY_SESSION_KEY] = 0
+        session.save()
+        response = self.client.get(reverse('history:period_list'))
+        self.assertEqual(response.wsgi_request.replica, 'default')
+    
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        """Test nothing is routed when no replica is configured"""
+        response = self.client.get(reverse('history:home'))
+        self.assertIsNone(response.wsgi_request.replica)
+
+
+@override_settings(PAGE_CACHE=True)
+class PageCacheTests(TestCase):
+    """Test the anonymous full-page cache and its purging"""
+    
+    def setUp(self):
+        """Create linked objects and start from an empty page cache"""
+        caches['pages'].clear()
+        self.period = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, description='Test')
+        self.figure = HistoricalFigure.objects.create(
+            name='Ulugh Beg', birth_year=1394, death_year=1449, biography='Astronomer',
+            role='scientist', time_period=self.period,
+        )
+        self.other = HistoricalSite.objects.create(name='Unrelated Fort', city='khiva', built_year=1800, description='Test')
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+    
+    def test_anonymous_pages_are_served_from_cache(self):
+        """Test the second anonymous visit runs no queries"""
+        url = reverse('history:period_detail', args=[self.period.pk])
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['X-Accel-Expires'], str(settings.PAGE_CACHE_PROXY_SECONDS))
+    
+    def test_signed_in_users_bypass_cache(self):
+        """Test pages with the user's nav are neither served from nor stored in the cache"""
+        url = reverse('history:home')
+        self.client.get(url)
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'testuser')
+    
+    def test_pending_messages_bypass_cache(self):
+        """Test a visitor with a flash message cookie reaches the view"""
+        url = reverse('history:period_list')
+        self.client.get(url)
+        self.client.cookies['messages'] = 'pending'
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+    
+    def test_save_purges_exactly_the_affected_pages(self):
+        """Test saving a figure purges its pages and leaves unrelated ones cached"""
+        urls = {
+            'figure': reverse('history:figure_detail', args=[self.figure.pk]),
+            'period': reverse('history:period_detail', args=[self.period.pk]),
+            'figure_list': reverse('history:figure_list'),
+            'home': reverse('history:home'),
+            'other': reverse('history:site_detail', args=[self.other.pk]),
+            'site_list': reverse('history:site_list'),
+        }
+        for url in urls.values():
+            self.client.get(url)
+        self.figure.name = 'Mirzo Ulugh Beg'
+        self.figure.save()
+        status = {name: self.client.get(url)['X-Page-Cache'] for name, url in urls.items()}
+        self.assertEqual(status, {
+            'figure': 'MISS', 'period': 'MISS', 'figure_list': 'MISS', 'home': 'MISS',
+            'other': 'HIT', 'site_list': 'HIT',
+        })
+        self.assertContains(self.client.get(urls['period']), 'Mirzo Ulugh Beg')
+    
+    def test_relation_change_purges_both_sides(self):
+        """Test linking a site to a figure purges the figure's page"""
+        url = reverse('history:figure_detail', args=[self.figure.pk])
+        self.client.get(url)
+        self.other.related_figures.add(self.figure)
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+    
+    @override_settings(TASKS_EAGER=False)
+    def test_clearing_relations_purges_both_sides(self):
+        """Test clear() from either side purges the pages that listed the other, without waiting for the worker"""
+        self.other.related_figures.add(self.figure)
+        self.other.time_periods.add(self.period)
+        figure_url = reverse('history:figure_detail', args=[self.figure.pk])
+        site_url = reverse('history:site_detail', args=[self.other.pk])
+        for url in (figure_url, site_url):
+            self.client.get(url)
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+        self.other.related_figures.clear()
+        self.assertEqual(self.client.get(figure_url)['X-Page-Cache'], 'MISS')
+        self.client.get(site_url)
+        self.assertEqual(self.client.get(site_url)['X-Page-Cache'], 'HIT')
+        self.period.sites.clear()
+        self.assertEqual(self.client.get(site_url)['X-Page-Cache'], 'MISS')
+    
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_replica_pages_are_not_stored_right_after_a_purge(self):
+        """Test a page a lagging replica may have served is not cached under the new generation"""
+        url = reverse('history:period_detail', args=[self.period.pk])
+        # Forget the purges made by setUp's creates
+        caches['pages'].clear()
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+        self.period.save()
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+        with override_settings(DATABASE_REPLICA_STICKY_SECONDS=0):
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'HIT')
+
+
+class ListingCardTests(TestCase):
+    """Test the listing projection behind list pages"""
+    
+    def setUp(self):
+        """Create a period, a figure and a site"""
+        self.period = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, description='Long era ' * 40)
+        self.figure = HistoricalFigure.objects.create(
+            name='Ulugh Beg', birth_year=1394, death_year=1449, biography='Astronomer',
+            role='scientist', time_period=self.period,
+        )
+        self.site = HistoricalSite.objects.create(name='Registan', city='samarkand', built_year=1420, description='Test')
+    
+    def test_saving_writes_display_ready_cards(self):
+        """Test each save stores the strings its card shows"""
+        self.assertEqual(self.period.card.years, '1370 - Present')
+        self.assertEqual(len(self.period.card.summary.split()), 30)
+        self.assertTrue(self.period.card.summary.endswith('…'))
+        self.assertEqual(
+            (self.figure.card.role, self.figure.card.years, self.figure.card.period_name),
+            ('Scientist/Scholar', '1394 - 1449', 'Timurid Empire'),
+        )
+        self.assertEqual(self.site.card.city, 'Samarkand')
+    
+    def test_renaming_period_updates_figure_cards(self):
+        """Test figure cards carry the new period name"""
+        self.period.name = 'Timurid Renaissance'
+        self.period.save()
+        self.assertEqual(FigureCard.objects.get(pk=self.figure.pk).period_name, 'Timurid Renaissance')
+    
+    def test_delete_removes_card(self):
+        """Test deleting an object cascades to its card"""
+        self.site.delete()
+        self.assertFalse(SiteCard.objects.exists())
+    
+    def test_rebuild_command_restores_cards(self):
+        """Test rebuild_listing recomputes cards lost to bulk writes"""
+        PeriodCard.objects.all().delete()
+        HistoricalSite.objects.filter(pk=self.site.pk).update(name='Registan Square')
+        out = StringIO()
+        call_command('rebuild_listing', stdout=out)
+        self.assertIn('Rebuilt 3 listing cards', out.getvalue())
+        self.assertEqual(PeriodCard.objects.get().name, 'Timurid Empire')
+        self.assertEqual(SiteCard.objects.get().name, 'Registan Square')
+    
+    def test_list_pages_read_only_card_tables(self):
+        """Test list pages never touch the wide source tables"""
+        caches['fragments'].clear()
+        for name, table in (
+            ('history:period_list', 'history_timeperiod'),
+            ('history:figure_list', 'history_historicalfigure'),
+            ('history:site_list', 'history_historicalsite'),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([query for query in queries if f'"{table}"' in query['sql']], name)
+
+
+class StaticAssetTests(TestCase):
+    """Test hashed, pre-compressed static files and the inlined critical CSS"""
+    
+    def setUp(self):
+        """Collect into a temporary static root"""
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+    
+    def test_collectstatic_writes_hashed_compressed_files(self):
+        """Test the manifest maps to hashed names with .gz and .br siblings"""
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'history.storage.CompressedManifestStaticFilesStorage'}}
+        with override_settings(STATIC_ROOT=self.static_root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            with open(f'{self.static_root}/staticfiles.json') as manifest:
+                hashed = json.load(manifest)['paths']['history/css/style.css']
+            self.assertRegex(hashed, r'^history/css/style\.[0-9a-f]{12}\.css$')
+            with open(f'{self.static_root}/{hashed}', 'rb') as original:
+                content = original.read()
+            with open(f'{self.static_root}/{hashed}.gz', 'rb') as compressed:
+                self.assertEqual(gzip.decompress(compressed.read()), content)
+            with open(f'{self.static_root}/{hashed}.br', 'rb') as compressed:
+                self.assertEqual(brotli.decompress(compressed.read()), content)
+            self.assertIn(f'/static/{hashed}', self.client.get(reverse('history:login')).content.decode())
+    
+    def test_critical_css_is_inlined(self):
+        """Test pages inline the critical rules and load the rest without blocking"""
+        response = self.client.get(reverse('history:login'))
+        self.assertContains(response, '<style>*{margin:0;')
+        self.assertContains(response, 'rel="preload" href="/static/history/css/style.css" as="style"')
+
+
+class MediaTests(TestCase):
+    """Test content-addressed uploads and the protected media hand-off"""
+    
+    def setUp(self):
+        """Prepare an image upload"""
+        self.client = Client()
+        buffer = BytesIO()
+        Image.new('RGB', (800, 400), 'navy').save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+    
+    def tearDown(self):
+        """Remove stored files"""
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+    
+    def upload(self, name):
+        return SimpleUploadedFile(name, self.content, content_type='image/png')
+    
+    def test_uploads_are_named_by_content(self):
+        """Test the stored name is the SHA-256 of the bytes"""
+        site = HistoricalSite.objects.create(name='Ark', city='bukhara', description='Desc', image=self.upload('Ark Photo.PNG'))
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(site.image.name, f'sites/{digest[:2]}/{digest}.png')
+    
+    def test_duplicate_uploads_share_file_and_variants(self):
+        """Test the same image uploaded twice is stored once and outlives one of its users"""
+        first = HistoricalSite.objects.create(name='Ark', city='bukhara', description='Desc', image=self.upload('a.png'))
+        second = HistoricalSite.objects.create(name='Citadel', city='bukhara', description='Desc', image=self.upload('b.png'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants, second.image_variants)
+        self.assertEqual(len(default_storage.listdir(posixpath.dirname(first.image.name))[1]), 1)
+        first.image = None
+        first.save()
+        self.assertTrue(all(default_storage.exists(v['name']) for v in second.image_variants['variants']))
+    
+    def test_protected_media_requires_login(self):
+        """Test anonymous visitors cannot read protected media"""
+        default_storage.save('private/report.png', ContentFile(self.content))
+        self.assertEqual(self.client.get('/media/private/report.png').status_code, 403)
+    
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_protected_media_is_handed_to_nginx(self):
+        """Test an authorized request gets X-Accel-Redirect and no body"""
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get('/media/private/report.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/internal-media/private/report.png')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=3600')
+        self.assertEqual(response.content, b'')
+    
+    def test_content_addressed_media_is_immutable(self):
+        """Test hashed media names are cacheable for a year"""
+        site = HistoricalSite.objects.create(name='Ark', city='bukhara', description='Desc', image=self.upload('a.png'))
+        response = self.client.get(site.image.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+class FacetTests(TestCase):
+    """Test faceted filtering of the figure and site lists"""
+    
+    def setUp(self):
+        """Create sites and figures across cities, roles and periods"""
+        self.client = Client()
+        self.timurid = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, description='Era')
+        self.shaybanid = TimePeriod.objects.create(name='Shaybanid', start_year=1500, description='Era')
+        self.registan = HistoricalSite.objects.create(name='Registan', city='samarkand', description='Desc')
+        self.bibi = HistoricalSite.objects.create(name='Bibi-Khanym', city='samarkand', description='Desc')
+        self.ark = HistoricalSite.objects.create(name='Ark', city='bukhara', description='Desc')
+        self.registan.time_periods.add(self.timurid, self.shaybanid)
+        self.bibi.time_periods.add(self.timurid)
+        self.ark.time_periods.add(self.shaybanid)
+        HistoricalFigure.objects.create(name='Amir Temur', role='ruler', time_period=self.timurid, biography='Bio')
+        HistoricalFigure.objects.create(name='Ulugh Beg', role='scientist', time_period=self.timurid, biography='Bio')
+        HistoricalFigure.objects.create(name='Abdullah Khan', role='ruler', time_period=self.shaybanid, biography='Bio')
+    
+    def names(self, response):
+        return sorted(card.name for card in response.context['page'])
+    
+    def options(self, response, label):
+        group = next(group for group in response.context['facets'] if group['label'] == label)
+        return {option['label']: option['count'] for option in group['options'] if option['count']}
+    
+    def test_filters_combine(self):
+        """Test different facets narrow together and repeated values widen"""
+        url = reverse('history:site_list')
+        self.assertEqual(self.names(self.client.get(url, {'city': 'samarkand'})), ['Bibi-Khanym', 'Registan'])
+        self.assertEqual(self.names(self.client.get(url, {'city': 'samarkand', 'period': self.shaybanid.pk})), ['Registan'])
+        self.assertEqual(
+            self.names(self.client.get(url, {'city': ['samarkand', 'bukhara'], 'period': self.shaybanid.pk})),
+            ['Ark', 'Registan'],
+        )
+        url = reverse('history:figure_list')
+        self.assertEqual(self.names(self.client.get(url, {'role': 'ruler', 'period': self.timurid.pk})), ['Amir Temur'])
+    
+    def test_counts_follow_other_facets(self):
+        """Test a facet's counts apply the other facets but not its own selection"""
+        response = self.client.get(reverse('history:site_list'), {'city': 'samarkand'})
+        self.assertEqual(self.options(response, 'City'), {'Samarkand': 2, 'Bukhara': 1})
+        self.assertEqual(self.options(response, 'Time Period'), {'Timurid Empire': 2, 'Shaybanid': 1})
+        response = self.client.get(reverse('history:figure_list'), {'period': self.shaybanid.pk})
+        self.assertEqual(self.options(response, 'Role'), {'Ruler/Khan': 1})
+    
+    def test_invalid_values_are_ignored(self):
+        """Test unknown choices and non-numeric periods show the full list"""
+        response = self.client.get(reverse('history:site_list'), {'city': 'atlantis', 'period': 'x'})
+        self.assertEqual(len(response.context['page']), 3)
+        for period in ('\u00b2', '9' * 30, '-1'):
+            response = self.client.get(reverse('history:figure_list'), {'period': period})
+            self.assertEqual(response.status_code, 200)
+    
+    def test_counts_run_one_query_per_facet(self):
+        """Test facet counts do not grow with the number of choices"""
+        with self.assertNumQueries(3):
+            self.client.get(reverse('history:site_list'), {'city': 'samarkand', 'period': self.timurid.pk})
+    
+    def test_links_keep_other_filters(self):
+        """Test option links toggle their value and keep the rest of the query"""
+        response = self.client.get(reverse('history:figure_list'), {'role': 'ruler', 'after': 'x'})
+        role = response.context['facets'][0]['options']
+        ruler = next(option for option in role if option['label'] == 'Ruler/Khan')
+        self.assertTrue(ruler['selected'])
+        self.assertEqual(ruler['url'], '?')
+        scientist = next(option for option in role if option['label'] == 'Scientist/Scholar')
+        self.assertEqual(scientist['url'], '?role=ruler&role=scientist')
+
+
+class LookupPickerTests(TestCase):
+    """Test the typeahead pickers and their lookup endpoint"""
+    
+    def setUp(self):
+        """Create a catalogue larger than one lookup page"""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.period = TimePeriod.objects.create(name='Sāmānid Empire', start_year=819, end_year=999, description='Era')
+        self.figures = [
+            HistoricalFigure.objects.create(name=f'Figure {i:02}', biography='Bio', time_period=self.period)
+            for i in range(20)
+        ]
+        self.site = HistoricalSite.objects.create(name='Ismail Samani Mausoleum', city='bukhara', description='Desc')
+        self.site.time_periods.add(self.period)
+        self.site.related_figures.add(self.figures[3])
+    
+    def test_lookup_matches_name_prefix(self):
+        """Test lookups ignore case and accents and read one index range"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('history:lookup', args=['periods']), {'q': 'SAMA'})
+        self.assertEqual(response.json()['results'], [{'id': self.period.pk, 'label': 'Sāmānid Empire (819 - 999)'}])
+        response = self.client.get(reverse('history:lookup', args=['sites']), {'q': 'ismail s'})
+        self.assertEqual(response.json()['results'][0]['label'], 'Ismail Samani Mausoleum (Bukhara)')
+    
+    def test_lookup_folds_spellings_like_autocomplete(self):
+        """Test the pickers meet the same spellings as autocomplete"""
+        HistoricalSite.objects.create(name='Khiva Fortress', city='khiva', description='Desc')
+        for spelling in ('Xiva', 'Хива', 'khiva f'):
+            with self.subTest(spelling=spelling):
+                response = self.client.get(reverse('history:lookup', args=['sites']), {'q': spelling})
+                self.assertEqual([r['label'] for r in response.json()['results']], ['Khiva Fortress (Khiva)'])
+    
+    def test_lookup_is_paginated(self):
+        """Test matches come a page at a time in name order"""
+        url = reverse('history:lookup', args=['figures'])
+        first = self.client.get(url, {'q': 'fig', 'page_size': 15}).json()
+        self.assertEqual(len(first['results']), 15)
+        rest = self.client.get(url + first['next'] + '&page_size=15').json()
+        self.assertEqual([r['id'] for r in first['results'] + rest['results']], [f.pk for f in self.figures])
+        self.assertIsNone(rest['next'])
+        self.assertEqual(self.client.get(reverse('history:lookup', args=['dynasties'])).status_code, 404)
+    
+    def test_edit_form_renders_only_chosen_objects(self):
+        """Test the site form lists its own periods and figures and a first page, not the whole catalogue"""
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('history:site_edit', args=[self.site.pk]))
+        content = response.content.decode()
+        self.assertLessEqual(content.count('Figure '), widgets.NOSCRIPT_CHOICES + 1)
+        self.assertIn(f'<option value="{self.figures[3].pk}" selected>Figure 03</option>', content)
+        self.assertIn('history/js/lookup.js', content)
+    
+    def test_create_form_works_without_javascript(self):
+        """Test a required picker is required and offers objects to choose before the script runs"""
+        self.client.login(username='testuser', password='testpass123')
+        content = self.client.get(reverse('history:figure_create')).content.decode()
+        self.assertRegex(content, r'<select name="time_period"[^>]* required')
+        self.assertIn('<option value="" selected>---------</option>', content)
+        self.assertIn(f'<option value="{self.period.pk}">Sāmānid Empire</option>', content)
+    
+    def test_submitted_pks_are_validated(self):
+        """Test chosen pks are saved and unknown ones rejected"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('history:site_edit', args=[self.site.pk])
+        data = {'name': 'Samanid Mausoleum', 'city': 'bukhara', 'description': 'Desc', 'time_periods': [self.period.pk]}
+        response = self.client.post(url, {**data, 'related_figures': [self.figures[0].pk, self.figures[1].pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(self.site.related_figures.all()), set(self.figures[:2]))
+        response = self.client.post(url, {**data, 'related_figures': [999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['related_figures'])
+
+
+class AutocompleteTests(TestCase):
+    """Test the in-memory name autocomplete"""
+    
+    def setUp(self):
+        """Give each test a fresh index over some names"""
+        self.client = Client()
+        self.addCleanup(setattr, autocomplete, 'index', autocomplete.index)
+        autocomplete.index = autocomplete.PrefixIndex()
+        self.period = TimePeriod.objects.create(name='Khwarazmian Empire', start_year=1077, end_year=1231, description='Era')
+        self.figure = HistoricalFigure.objects.create(name='Amir Temur', biography='Bio', time_period=self.period)
+        self.site = HistoricalSite.objects.create(name='Itchan Kala of Xiva', city='khiva', description='Desc')
+        self.url = reverse('history:autocomplete')
+        # As wsgi.py does when the worker starts
+        autocomplete.warm()
+    
+    def labels(self, query):
+        return [result['label'] for result in self.client.get(self.url, {'q': query}).json()['results']]
+    
+    def test_spellings_fold_together(self):
+        """Test Cyrillic, apostrophes and x/kh, q/k spellings meet"""
+        for spelling in ('Khiva', 'Xiva', 'Хива', 'XIVA'):
+            self.assertEqual(listing.name_key(spelling), 'khiva')
+        self.assertEqual(listing.name_key("O'zbekiston"), listing.name_key('Oʻzbekiston'))
+        self.assertEqual(listing.name_key("O'zbekiston"), listing.name_key('Ўзбекистон'))
+        self.assertEqual(listing.name_key('Шоҳи Зинда'), 'shohi zinda')
+        self.assertEqual(listing.name_key('Qo‘qon'), listing.name_key('Kokon'))
+    
+    def test_matches_any_word_without_queries(self):
+        """Test names match from any word, whole-name matches first, from memory"""
+        self.assertEqual(self.labels('temur'), ['Amir Temur'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('Хи'), ['Itchan Kala of Xiva'])
+            self.assertEqual(self.labels('kh'), ['Khwarazmian Empire', 'Itchan Kala of Xiva'])
+        response = self.client.get(self.url, {'q': 'amir'})
+        self.assertEqual(response.json()['results'], [
+            {'kind': 'figure', 'id': self.figure.pk, 'label': 'Amir Temur', 'url': reverse('history:figure_detail', args=[self.figure.pk])},
+        ])
+        self.assertEqual(self.labels(''), [])
+    
+    def test_signals_update_this_workers_index(self):
+        """Test saves and deletes show at once in the worker making them"""
+        self.figure.name = 'Timur the Lame'
+        self.figure.save()
+        self.site.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('tim'), ['Timur the Lame'])
+            self.assertEqual(self.labels('temur'), [])
+            self.assertEqual(self.labels('xiva'), [])
+    
+    def test_other_workers_catch_up(self):
+        """Test another worker's index applies the changed cards once versions move"""
+        other = autocomplete.PrefixIndex()
+        other.refresh()
+        self.figure.name = 'Timur the Lame'
+        self.figure.save()
+        self.site.delete()
+        HistoricalSite.objects.create(name='Registan', city='samarkand', description='Desc')
+        other.refresh()
+        self.assertEqual([name for kind, pk, name in other.search('timur')], ['Timur the Lame'])
+        self.assertEqual(other.search('temur'), [])
+        self.assertEqual(other.search('xiva'), [])
+        self.assertEqual([name for kind, pk, name in other.search('reg')], ['Registan'])
+        self.assertEqual(other.keys, sorted(other.keys))
+
+
+class GeoTests(TestCase):
+    """Test site coordinates, nearby queries and map clusters"""
+    
+    SITES = [
+        ('Registan', 'samarkand', 39.6547, 66.9758),
+        ('Gur-e-Amir', 'samarkand', 39.6484, 66.9690),
+        ('Bibi-Khanym Mosque', 'samarkand', 39.6608, 66.9796),
+        ('Ark of Bukhara', 'bukhara', 39.7779, 64.4111),
+        ('Itchan Kala', 'khiva', 41.3783, 60.3639),
+    ]
+    
+    def setUp(self):
+        """Create sites across three cities and one without coordinates"""
+        self.client = Client()
+        cache.clear()
+        self.sites = [
+            HistoricalSite.objects.create(name=name, city=city, latitude=lat, longitude=lon, description='Desc')
+            for name, city, lat, lon in self.SITES
+        ]
+        HistoricalSite.objects.create(name='Unplaced Caravanserai', city='other', description='Desc')
+    
+    def test_geohash_follows_coordinates(self):
+        """Test the stored geohash is kept in step with the coordinates"""
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        site = self.sites[0]
+        self.assertEqual(site.geohash, geo.encode(39.6547, 66.9758))
+        site.latitude = site.longitude = None
+        site.save()
+        self.assertEqual(HistoricalSite.objects.get(pk=site.pk).geohash, '')
+        with self.assertRaises(ValidationError):
+            HistoricalSite(name='Half', city='other', description='Desc', latitude=40.0).full_clean()
+    
+    def test_nearby_within_radius(self):
+        """Test a radius query returns the sites inside it, nearest first, in one query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('history:site_nearby'), {'lat': 39.655, 'lon': 66.975, 'radius': 5})
+        names = [site['name'] for site in response.json()['sites']]
+        self.assertEqual(names, ['Registan', 'Bibi-Khanym Mosque', 'Gur-e-Amir'])
+        self.assertLess(response.json()['sites'][0]['distance_km'], 0.2)
+        response = self.client.get(reverse('history:site_nearby'), {'lat': 39.655, 'lon': 66.975, 'radius': 300})
+        self.assertEqual(len(response.json()['sites']), 4)
+        self.assertEqual(self.client.get(reverse('history:site_nearby'), {'lat': 95, 'lon': 66}).status_code, 400)
+    
+    def test_radius_near_a_pole_matches_a_full_scan(self):
+        """Test a radius query whose block would run over the pole misses nothing"""
+        polar = [
+            HistoricalSite.objects.create(name=f'Station {i}', city='other', latitude=lat, longitude=lon, description='Desc')
+            for i, (lat, lon) in enumerate(((-88.0, 90.0), (-89.9, -120.0), (-86.0, 170.0), (-80.0, 5.0)))
+        ]
+        for lat, lon, radius in ((-84.5, 0.0, 1000), (-89.2, 60.0, 300)):
+            expected = [
+                site.pk for site in sorted(polar, key=lambda site: geo.distance_km(lat, lon, site.latitude, site.longitude))
+                if geo.distance_km(lat, lon, site.latitude, site.longitude) <= radius
+            ]
+            with self.subTest(lat=lat, radius=radius):
+                self.assertTrue(expected)
+                self.assertEqual([row[0] for distance, row in geo.within(lat, lon, radius, 10)], expected)
+    
+    def test_nearest_matches_a_full_scan(self):
+        """Test k-nearest agrees with measuring every site"""
+        for lat, lon in ((39.7, 64.5), (41.0, 61.0), (45.0, 72.0), (-33.9, 151.2)):
+            expected = sorted(self.sites, key=lambda site: geo.distance_km(lat, lon, site.latitude, site.longitude))
+            for count in (1, 3, 5):
+                found = [row[0] for distance, row in geo.nearest(lat, lon, count)]
+                self.assertEqual(found, [site.pk for site in expected[:count]])
+        response = self.client.get(reverse('history:site_nearby'), {'lat': 39.7, 'lon': 64.5, 'limit': 2})
+        self.assertEqual([site['name'] for site in response.json()['sites']], ['Ark of Bukhara', 'Gur-e-Amir'])
+    
+    def test_map_clusters_by_zoom(self):
+        """Test markers merge when zoomed out and tiles are reused from the cache"""
+        url = reverse('history:site_map')
+        country = self.client.get(url, {'bbox': '55,37,74,46', 'zoom': 4}).json()['markers']
+        self.assertEqual([marker[2:] for marker in country], [[5, None]])
+        cities = self.client.get(url, {'bbox': '60,39,68,42', 'zoom': 7}).json()['markers']
+        self.assertEqual(sorted(marker[2] for marker in cities), [1, 1, 3])
+        self.assertIn([39.7779, 64.4111, 1, self.sites[3].pk], cities)
+        zoomed = self.client.get(url, {'bbox': '66.9,39.6,67.0,39.7', 'zoom': 13}).json()['markers']
+        self.assertEqual(sorted(marker[3] for marker in zoomed), sorted(site.pk for site in self.sites[:3]))
+        # Another viewport at the same zoom only reads the version
+        with self.assertNumQueries(1):
+            self.client.get(url, {'bbox': '61,39.5,67.5,41.5', 'zoom': 7})
+        self.assertEqual(self.client.get(url, {'bbox': '-180,-90,180,90', 'zoom': 10}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'bbox': 'nowhere', 'zoom': 4}).status_code, 400)
+    
+    def test_import_sets_geohash(self):
+        """Test bulk-imported coordinates are indexed"""
+        bulk.import_records([(1, {'type': 'site', 'name': 'Kalyan Minaret', 'city': 'bukhara',
+                                  'latitude': '39.7758', 'longitude': '64.4149'})])
+        site = HistoricalSite.objects.get(name='Kalyan Minaret')
+        self.assertEqual(site.geohash, geo.encode(39.7758, 64.4149))
+
+
+@override_settings(PRERENDER=True, PRERENDER_ROOT=tempfile.mkdtemp(), PRERENDER_HOST='localhost')
+class PrerenderTests(TestCase):
+    """Test the static export of the public pages"""
+    
+    def setUp(self):
+        """Start each test from an empty output directory"""
+        shutil.rmtree(settings.PRERENDER_ROOT, ignore_errors=True)
+        self.period = TimePeriod.objects.create(name='Timurid Empire', start_year=1370, end_year=1507, description='Era')
+        self.other_period = TimePeriod.objects.create(name='Shaybanid Dynasty', start_year=1500, end_year=1601, description='Era')
+        self.figure = HistoricalFigure.objects.create(name='Ulugh Beg', biography='Astronomer', time_period=self.period)
+        self.site = HistoricalSite.objects.create(name='Chor Minor', city='bukhara', description='Desc')
+    
+    def page(self, path):
+        with open(prerender.file_for(path)) as page:
+            return page.read()
+    
+    def site_pages(self):
+        return [reverse('history:site_detail', args=[self.site.pk]), reverse('history:site_list')]
+    
+    def build(self):
+        rendered, removed = prerender.build()
+        self.assertFalse(removed)
+        return rendered
+    
+    def test_first_build_renders_every_public_page(self):
+        """Test home, lists and every detail page are written, and parameterised endpoints are not"""
+        call_command('prerender', '--workers', '1', stdout=StringIO())
+        self.assertIn('Ulugh Beg', self.page(reverse('history:figure_detail', args=[self.figure.pk])))
+        self.assertIn('Chor Minor', self.page(reverse('history:site_list')))
+        self.assertIn('<html', self.page(reverse('history:home')))
+        self.assertFalse(os.path.exists(prerender.file_for(reverse('history:timeline_data'))))
+        self.assertFalse(os.path.exists(prerender.file_for(reverse('history:login'))))
+    
+    def test_later_builds_render_only_affected_pages(self):
+        """Test a change re-renders the pages showing the object, through its old and new period"""
+        self.build()
+        self.assertEqual(self.build(), 0)
+        figure_page = reverse('history:figure_detail', args=[self.figure.pk])
+        self.figure.name = 'Mirzo Ulugbek'
+        self.figure.time_period = self.other_period
+        self.figure.save()
+        # The edit deletes the stale file at once
+        self.assertFalse(os.path.exists(prerender.file_for(figure_page)))
+        before = {path: os.path.getmtime(prerender.file_for(path)) for path in self.site_pages()}
+        self.build()
+        self.assertIn('Mirzo Ulugbek', self.page(figure_page))
+        self.assertIn('Mirzo Ulugbek', self.page(reverse('history:period_detail', args=[self.other_period.pk])))
+        self.assertNotIn('Mirzo Ulugbek', self.page(reverse('history:period_detail', args=[self.period.pk])))
+        self.assertEqual(before, {path: os.path.getmtime(prerender.file_for(path)) for path in self.site_pages()})
+    
+    def test_deleted_objects_lose_their_page(self):
+        """Test a deleted object's page is removed and the pages linking it are rebuilt"""
+        self.build()
+        figure_page = reverse('history:figure_detail', args=[self.figure.pk])
+        self.figure.delete()
+        rendered, removed = prerender.build()
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(prerender.file_for(figure_page)))
+        self.assertNotIn('Ulugh Beg', self.page(reverse('history:period_detail', args=[self.period.pk])))
+    
+    @override_settings(TASKS_EAGER=False)
+    def test_cleared_relations_discard_both_sides(self):
+        """Test clear() deletes the files of the pages that listed the other side, without waiting for the worker"""
+        self.site.related_figures.add(self.figure)
+        self.build()
+        figure_page = reverse('history:figure_detail', args=[self.figure.pk])
+        self.site.related_figures.clear()
+        self.assertFalse(os.path.exists(prerender.file_for(figure_page)))
+    
+    def test_related_content_refresh_discards_pages(self):
+        """Test the background graph refresh deletes the pages whose suggestions it changed"""
+        self.build()
+        figure_page = reverse('history:figure_detail', args=[self.figure.pk])
+        tasks.refresh_related(self.figure._meta.label_lower, self.figure.pk)
+        self.assertFalse(os.path.exists(prerender.file_for(figure_page)))
+        self.assertTrue(os.path.exists(prerender.file_for(reverse('history:site_detail', args=[self.site.pk]))))
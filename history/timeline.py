@@ -0,0 +1,197 @@
+"""
+Timeline queries: what existed in a given year, and what overlaps a span.
+
+Every period, figure and site is a closed interval of years. Periods run
+start_year..end_year (a NULL end means ongoing), figures birth_year..death_year
+(a single known year is a point), and sites from built_year onwards. On
+PostgreSQL the overlap test is `&&` between int4range expressions backed by
+the GiST indexes of migration 0009. Other databases use an in-process
+interval index per model, rebuilt only when that model's ContentVersion moves.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+
+from . import versions
+from .metrics import upkeep
+from .models import TimePeriod, HistoricalFigure, HistoricalSite
+from .search import DETAIL_URLS
+
+INFINITY = float('inf')
+
+# The same expressions are indexed in migration 0009; keep them identical
+RANGE_SQL = {
+    TimePeriod: (
+        "int4range(start_year, CASE WHEN end_year IS NULL THEN NULL "
+        "ELSE GREATEST(start_year, end_year) END, '[]')"
+    ),
+    HistoricalFigure: "int4range(LEAST(birth_year, death_year), GREATEST(birth_year, death_year), '[]')",
+    HistoricalSite: "int4range(built_year, NULL, '[]')",
+}
+RANGE_CONDITION = {
+    TimePeriod: '',
+    HistoricalFigure: 'birth_year IS NOT NULL OR death_year IS NOT NULL',
+    HistoricalSite: 'built_year IS NOT NULL',
+}
+YEAR_FIELDS = {
+    TimePeriod: ('start_year', 'end_year'),
+    HistoricalFigure: ('birth_year', 'death_year'),
+    HistoricalSite: ('built_year', None),
+}
+KINDS = {TimePeriod: 'period', HistoricalFigure: 'figure', HistoricalSite: 'site'}
+
+
+def span(model, first, second):
+    """(start, end) of an object from its two year columns; end None is open"""
+    if model is TimePeriod:
+        return first, None if second is None else max(first, second)
+    if model is HistoricalFigure:
+        years = [year for year in (first, second) if year is not None]
+        return (min(years), max(years)) if years else None
+    return (first, None) if first is not None else None
+
+
+class IntervalIndex:
+    """
+    Static index over (start, end, key) intervals.
+
+    Intervals are sorted by start, and an implicit segment tree holds the
+    largest end in each run. An overlap query bisects to the intervals that
+    start early enough, then descends only into subtrees that still reach the
+    query, so it costs O(log n) per reported interval.
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: (interval[0], interval[2]))
+        self.starts = [start for start, _, _ in intervals]
+        self.keys = [key for _, _, key in intervals]
+        size = 1
+        while size < len(intervals):
+            size *= 2
+        self.size = size
+        self.max_end = [-INFINITY] * (2 * size)
+        for i, (_, end, _) in enumerate(intervals):
+            self.max_end[size + i] = INFINITY if end is None else end
+        for node in range(size - 1, 0, -1):
+            self.max_end[node] = max(self.max_end[2 * node], self.max_end[2 * node + 1])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def overlapping(self, start, end=None, limit=None):
+        """Keys of intervals meeting [start, end], in start order, the first limit of them"""
+        last = bisect_right(self.starts, INFINITY if end is None else end)
+        found = []
+        stack = [(1, 0, self.size)]
+        while stack and len(found) != limit:
+            node, low, high = stack.pop()
+            if low >= last or self.max_end[node] < start:
+                continue
+            if node >= self.size:
+                found.append(self.keys[low])
+                continue
+            middle = (low + high) // 2
+            # Right child first so the left one is popped, keeping start order
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+        return found
+
+
+_indexes = {}
+
+
+def build_index(model):
+    first, second = YEAR_FIELDS[model]
+    columns = ['pk', first] + ([second] if second else [])
+    intervals = []
+    for row in model.objects.order_by().values_list(*columns).iterator(chunk_size=2000):
+        years = span(model, row[1], row[2] if second else None)
+        if years is not None:
+            intervals.append((years[0], years[1], row[0]))
+    return IntervalIndex(intervals)
+
+
+def get_indexes(*models):
+    """In-process indexes for the given models, refreshed when their content changed"""
+    current = versions.current(*models)
+    indexes = {}
+    for model in models:
+        version = current[model._meta.label_lower][0]
+        cached = _indexes.get(model)
+        if cached is None or cached[0] != version:
+            with upkeep():
+                cached = _indexes[model] = (version, build_index(model))
+        indexes[model] = cached[1]
+    return indexes
+
+
+def clear():
+    _indexes.clear()
+
+
+def _overlap_filter(model, start, end):
+    sql = f"{RANGE_SQL[model]} && int4range(%s, %s, '[]')"
+    if RANGE_CONDITION[model]:
+        sql = f"({RANGE_CONDITION[model]}) AND {sql}"
+    return RawSQL(sql, [start, end], output_field=BooleanField())
+
+
+def _first(model, queryset, limit):
+    """The first limit objects of a queryset by the start of their span"""
+    if limit is None:
+        return queryset
+    return queryset.order_by(RawSQL(f'lower({RANGE_SQL[model]})', []).asc(), 'pk')[:limit]
+
+
+def overlapping(start, end=None, models=(TimePeriod, HistoricalFigure, HistoricalSite), limit=None):
+    """
+    Querysets of the objects of each model whose span meets [start, end]
+
+    Pass end=start for a single year, or end=None for "from start onwards".
+    With a limit, each queryset holds only the objects that start first.
+    """
+    if connection.vendor == 'postgresql':
+        return {
+            model: _first(model, model.objects.filter(_overlap_filter(model, start, end)), limit)
+            for model in models
+        }
+    indexes = get_indexes(*models)
+    # The index gives keys in start order; only a page of them is sent to the database
+    return {model: model.objects.filter(pk__in=indexes[model].overlapping(start, end, limit)) for model in models}
+
+
+def active_in(year, limit=None):
+    """Periods, figures and sites that existed in the given year"""
+    return overlapping(year, year, limit=limit)
+
+
+@dataclass
+class TimelineItem:
+    kind: str
+    object_id: int
+    name: str
+    start: int
+    end: int
+
+    @property
+    def url(self):
+        return reverse(DETAIL_URLS[self.kind], args=[self.object_id])
+
+
+def items(querysets, limit=None):
+    """Flatten overlapping() results into timeline items ordered by start year"""
+    found = []
+    for model, queryset in querysets.items():
+        first, second = YEAR_FIELDS[model]
+        rows = queryset.order_by(first, 'pk').values_list('pk', 'name', first, *([second] if second else []))
+        if limit is not None:
+            rows = rows[:limit]
+        for row in rows:
+            start, end = span(model, row[2], row[3] if second else None)
+            found.append(TimelineItem(KINDS[model], row[0], row[1], start, end))
+    found.sort(key=lambda item: (item.start, item.kind, item.object_id))
+    return found
@@ -1,32 +1,49 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, async_views, autocomplete, lookup, views
 
 app_name = 'history'
 
+# Read-only pages have async twins for ASGI deployments
+read_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('', views.home, name='home'),
+    path('', read_views.home, name='home'),
+    path('search/', views.search, name='search'),
+    path('timeline/', views.timeline, name='timeline'),
+    path('timeline/data/', views.timeline_data, name='timeline_data'),
     
     # Time Periods
-    path('periods/', views.period_list, name='period_list'),
-    path('periods/<int:pk>/', views.period_detail, name='period_detail'),
+    path('periods/', read_views.period_list, name='period_list'),
+    path('periods/<int:pk>/', read_views.period_detail, name='period_detail'),
     path('periods/create/', views.period_create, name='period_create'),
     path('periods/<int:pk>/edit/', views.period_edit, name='period_edit'),
     path('periods/<int:pk>/delete/', views.period_delete, name='period_delete'),
     
     # Historical Figures
-    path('figures/', views.figure_list, name='figure_list'),
-    path('figures/<int:pk>/', views.figure_detail, name='figure_detail'),
+    path('figures/', read_views.figure_list, name='figure_list'),
+    path('figures/<int:pk>/', read_views.figure_detail, name='figure_detail'),
     path('figures/create/', views.figure_create, name='figure_create'),
     path('figures/<int:pk>/edit/', views.figure_edit, name='figure_edit'),
     path('figures/<int:pk>/delete/', views.figure_delete, name='figure_delete'),
     
     # Historical Sites
-    path('sites/', views.site_list, name='site_list'),
-    path('sites/<int:pk>/', views.site_detail, name='site_detail'),
+    path('sites/', read_views.site_list, name='site_list'),
+    path('sites/nearby/', views.site_nearby, name='site_nearby'),
+    path('sites/map/', views.site_map, name='site_map'),
+    path('sites/<int:pk>/', read_views.site_detail, name='site_detail'),
     path('sites/create/', views.site_create, name='site_create'),
     path('sites/<int:pk>/edit/', views.site_edit, name='site_edit'),
     path('sites/<int:pk>/delete/', views.site_delete, name='site_delete'),
     
+    # JSON API
+    path('api/v1/<str:resource>/', api.resource_list, name='api_list'),
+    path('api/v1/<str:resource>/<int:pk>/', api.resource_detail, name='api_detail'),
+    
+    # Typeahead lookups for the edit forms
+    path('lookup/<str:resource>/', lookup.lookup, name='lookup'),
+    path('autocomplete/', autocomplete.autocomplete, name='autocomplete'),
+    
     # Authentication
     path('register/', views.register, name='register'),
     path('login/', views.user_login, name='login'),
@@ -0,0 +1,24 @@
+"""Per-model change counters used to validate cached representations"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContentVersion
+
+
+def bump(*models):
+    """Record a write to each of the given models"""
+    now = timezone.now()
+    labels = {model._meta.label_lower for model in models}
+    updated = ContentVersion.objects.filter(model__in=labels).update(version=F('version') + 1, changed_at=now)
+    if updated < len(labels):
+        existing = set(ContentVersion.objects.filter(model__in=labels).values_list('model', flat=True))
+        for label in labels - existing:
+            ContentVersion.objects.get_or_create(model=label, defaults={'version': 1, 'changed_at': now})
+
+
+def current(*models):
+    """Return {label: (version, changed_at)} for the given models in one query"""
+    labels = [model._meta.label_lower for model in models]
+    rows = ContentVersion.objects.filter(model__in=labels).values_list('model', 'version', 'changed_at')
+    found = {label: (version, changed_at) for label, version, changed_at in rows}
+    return {label: found.get(label, (0, None)) for label in labels}
@@ -1,41 +1,119 @@
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
-from .models import TimePeriod, HistoricalFigure, HistoricalSite
+from .models import TimePeriod, HistoricalFigure, HistoricalSite, PeriodCard, FigureCard, SiteCard
+from .facets import FIGURE_FACETS, SITE_FACETS, FacetedList
 from .forms import HistoricalFigureForm, TimePeriodForm, HistoricalSiteForm
-
-
+from .metrics import query_budget
+from .pagecache import cache_anonymous
+from .pagination import paginate
+from .routers import replica_reads
+from .search import search as search_documents
+from .graph import related_for
+from .stats import homepage_context
+from . import geo, listing, timeline as timeline_index
+
+
+@query_budget(5)
+@replica_reads
+@cache_anonymous
 def home(request):
-    """Home page with overview"""
-    periods_count = TimePeriod.objects.count()
-    figures_count = HistoricalFigure.objects.count()
-    sites_count = HistoricalSite.objects.count()
-    
-    recent_figures = HistoricalFigure.objects.all().order_by('-created_at')[:3]
-    featured_sites = HistoricalSite.objects.all()[:3]
-    
+    """Home page with overview, served from the materialized statistics"""
+    return render(request, 'history/home.html', homepage_context())
+
+
+@query_budget(3)
+@replica_reads
+@cache_anonymous
+def search(request):
+    """Ranked full-text search across periods, figures and sites"""
+    query = request.GET.get('q', '')
+    results = search_documents(query) if query else []
+    return render(request, 'history/search.html', {'query': query, 'results': results})
+
+
+TIMELINE_LIMIT = 48
+
+
+def _integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _coordinate(value, limit):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if -limit <= number <= limit else None
+
+
+@query_budget(6)
+@replica_reads
+@cache_anonymous
+def timeline(request):
+    """Everything that existed in ?year=, or that overlaps the period in ?period="""
+    year = _integer(request.GET.get('year'))
+    period_id = _integer(request.GET.get('period'))
+    period = None
+    found = {}
+    if period_id is not None:
+        period = get_object_or_404(TimePeriod, pk=period_id)
+        start, end = timeline_index.span(TimePeriod, period.start_year, period.end_year)
+        found = timeline_index.overlapping(start, end, models=(HistoricalFigure, HistoricalSite), limit=TIMELINE_LIMIT)
+    elif year is not None:
+        found = timeline_index.active_in(year, limit=TIMELINE_LIMIT)
     context = {
-        'periods_count': periods_count,
-        'figures_count': figures_count,
-        'sites_count': sites_count,
-        'recent_figures': recent_figures,
-        'featured_sites': featured_sites,
+        'year': year,
+        'period': period,
+        'periods': listing.cards(TimePeriod, found[TimePeriod])[:TIMELINE_LIMIT] if TimePeriod in found else [],
+        'figures': listing.cards(HistoricalFigure, found[HistoricalFigure])[:TIMELINE_LIMIT] if found else [],
+        'sites': listing.cards(HistoricalSite, found[HistoricalSite])[:TIMELINE_LIMIT] if found else [],
     }
-    return render(request, 'history/home.html', context)
+    return render(request, 'history/timeline.html', context)
+
+
+@query_budget(4)
+@replica_reads
+@cache_anonymous
+def timeline_data(request):
+    """JSON items overlapping ?start=..&end= for the zoomable timeline"""
+    start = _integer(request.GET.get('start'))
+    end = _integer(request.GET.get('end'))
+    if start is None or end is None or end < start:
+        return JsonResponse({'error': 'start and end must be years with start <= end'}, status=400)
+    limit = min(_integer(request.GET.get('limit')) or 200, 1000)
+    items = timeline_index.items(timeline_index.overlapping(start, end, limit=limit), limit=limit)
+    data = [
+        {'kind': item.kind, 'id': item.object_id, 'name': item.name,
+         'start': item.start, 'end': item.end, 'url': item.url}
+        for item in items
+    ]
+    return JsonResponse({'start': start, 'end': end, 'items': data})
 
 
 # ============= TIME PERIODS =============
+@query_budget(3)
+@replica_reads
+@cache_anonymous
 def period_list(request):
     """List all time periods"""
-    periods = TimePeriod.objects.all()
-    return render(request, 'history/period_list.html', {'periods': periods})
+    periods = paginate(request, PeriodCard.objects.all())
+    return render(request, 'history/period_list.html', {'periods': periods, 'page': periods})
 
 
+@query_budget(5)
+@replica_reads
+@cache_anonymous
 def period_detail(request, pk):
     """Detail view for a specific period"""
-    period = get_object_or_404(TimePeriod, pk=pk)
+    period = get_object_or_404(TimePeriod.objects.for_detail(), pk=pk)
     figures = period.figures.all()
     sites = period.sites.all()
     context = {
@@ -46,6 +124,7 @@ def period_detail(request, pk):
     return render(request, 'history/period_detail.html', context)
 
 
+@query_budget(7, post=10)
 @login_required
 def period_create(request):
     """Create a new time period"""
@@ -62,6 +141,7 @@ def period_create(request):
     return render(request, 'history/period_form.html', {'form': form, 'title': 'Add New Time Period'})
 
 
+@query_budget(7, post=12)
 @login_required
 def period_edit(request, pk):
     """Edit existing time period"""
@@ -77,6 +157,8 @@ def period_edit(request, pk):
     return render(request, 'history/period_form.html', {'form': form, 'title': 'Edit Time Period'})
 
 
+# Each of the period's figures adds its own deletes to the cascade
+@query_budget(3, post=17)
 @login_required
 def period_delete(request, pk):
     """Delete a time period"""
@@ -89,23 +171,35 @@ def period_delete(request, pk):
 
 
 # ============= HISTORICAL FIGURES =============
+@query_budget(5)
+@replica_reads
+@cache_anonymous
 def figure_list(request):
-    """List all historical figures"""
-    figures = HistoricalFigure.objects.all().select_related('time_period')
-    return render(request, 'history/figure_list.html', {'figures': figures})
+    """List historical figures, narrowed by role and period"""
+    faceted = FacetedList(request, FigureCard.objects.all(), FIGURE_FACETS)
+    figures = paginate(request, faceted.queryset)
+    context = {'figures': figures, 'page': figures, 'facets': faceted.facet_groups()}
+    return render(request, 'history/figure_list.html', context)
 
 
+@query_budget(7)
+@replica_reads
+@cache_anonymous
 def figure_detail(request, pk):
     """Detail view for a specific figure"""
-    figure = get_object_or_404(HistoricalFigure, pk=pk)
+    figure = get_object_or_404(HistoricalFigure.objects.for_detail(), pk=pk)
     related_sites = figure.sites.all()
+    suggested = related_for(figure)
     context = {
         'figure': figure,
         'related_sites': related_sites,
+        'suggested_figures': suggested['figures'],
+        'suggested_sites': suggested['sites'],
     }
     return render(request, 'history/figure_detail.html', context)
 
 
+@query_budget(7, post=15)
 @login_required
 def figure_create(request):
     """Create a new historical figure"""
@@ -122,6 +216,7 @@ def figure_create(request):
     return render(request, 'history/figure_form.html', {'form': form, 'title': 'Add New Historical Figure'})
 
 
+@query_budget(7, post=16)
 @login_required
 def figure_edit(request, pk):
     """Edit existing figure"""
@@ -137,6 +232,7 @@ def figure_edit(request, pk):
     return render(request, 'history/figure_form.html', {'form': form, 'title': 'Edit Historical Figure'})
 
 
+@query_budget(3, post=15)
 @login_required
 def figure_delete(request, pk):
     """Delete a figure"""
@@ -149,23 +245,82 @@ def figure_delete(request, pk):
 
 
 # ============= HISTORICAL SITES =============
+@query_budget(5)
+@replica_reads
+@cache_anonymous
 def site_list(request):
-    """List all historical sites"""
-    sites = HistoricalSite.objects.all()
-    return render(request, 'history/site_list.html', {'sites': sites})
-
-
+    """List historical sites, narrowed by city and period"""
+    faceted = FacetedList(request, SiteCard.objects.all(), SITE_FACETS)
+    sites = paginate(request, faceted.queryset)
+    context = {'sites': sites, 'page': sites, 'facets': faceted.facet_groups()}
+    return render(request, 'history/site_list.html', context)
+
+
+@query_budget(geo.NEAREST_PRECISION + 1)
+@replica_reads
+@cache_anonymous
+def site_nearby(request):
+    """JSON sites within ?radius= km of ?lat=&lon=, or the ?limit= nearest without a radius"""
+    latitude = _coordinate(request.GET.get('lat'), 90)
+    longitude = _coordinate(request.GET.get('lon'), 180)
+    if latitude is None or longitude is None:
+        return JsonResponse({'error': 'lat and lon must be coordinates in degrees'}, status=400)
+    limit = min(_integer(request.GET.get('limit')) or 20, 100)
+    radius = request.GET.get('radius')
+    if radius is None:
+        found = geo.nearest(latitude, longitude, limit)
+    else:
+        radius = _coordinate(radius, geo.MAX_RADIUS_KM)
+        if radius is None or radius <= 0:
+            return JsonResponse({'error': f'radius must be between 0 and {geo.MAX_RADIUS_KM} km'}, status=400)
+        found = geo.within(latitude, longitude, radius, limit)
+    sites = [
+        {'id': pk, 'name': name, 'city': city, 'lat': lat, 'lon': lon, 'distance_km': round(distance, 3),
+         'url': reverse('history:site_detail', args=[pk])}
+        for distance, (pk, name, city, lat, lon) in found
+    ]
+    return JsonResponse({'lat': latitude, 'lon': longitude, 'radius': radius, 'sites': sites})
+
+
+@query_budget(2)
+@replica_reads
+@cache_anonymous
+def site_map(request):
+    """JSON marker clusters for ?bbox=west,south,east,north at ?zoom="""
+    try:
+        west, south, east, north = (float(value) for value in request.GET.get('bbox', '').split(','))
+    except ValueError:
+        return JsonResponse({'error': 'bbox must be west,south,east,north in degrees'}, status=400)
+    zoom = _integer(request.GET.get('zoom'))
+    if zoom is None or not 0 <= zoom <= 20:
+        return JsonResponse({'error': 'zoom must be a map zoom level from 0 to 20'}, status=400)
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return JsonResponse({'error': 'bbox must be west,south,east,north in degrees'}, status=400)
+    try:
+        markers = geo.markers(south, west, north, east, zoom)
+    except ValueError as exc:
+        return JsonResponse({'error': f'{exc}; zoom in'}, status=400)
+    return JsonResponse({'zoom': zoom, 'markers': markers})
+
+
+@query_budget(8)
+@replica_reads
+@cache_anonymous
 def site_detail(request, pk):
     """Detail view for a specific site"""
-    site = get_object_or_404(HistoricalSite, pk=pk)
+    site = get_object_or_404(HistoricalSite.objects.for_detail(), pk=pk)
+    suggested = related_for(site)
     context = {
         'site': site,
         'time_periods': site.time_periods.all(),
         'related_figures': site.related_figures.all(),
+        'suggested_figures': suggested['figures'],
+        'suggested_sites': suggested['sites'],
     }
     return render(request, 'history/site_detail.html', context)
 
 
+@query_budget(7, post=26)
 @login_required
 def site_create(request):
     """Create a new historical site"""
@@ -183,6 +338,7 @@ def site_create(request):
     return render(request, 'history/site_form.html', {'form': form, 'title': 'Add New Historical Site'})
 
 
+@query_budget(7, post=35)
 @login_required
 def site_edit(request, pk):
     """Edit existing site"""
@@ -198,6 +354,7 @@ def site_edit(request, pk):
     return render(request, 'history/site_form.html', {'form': form, 'title': 'Edit Historical Site'})
 
 
+@query_budget(3, post=15)
 @login_required
 def site_delete(request, pk):
     """Delete a site"""
@@ -248,17 +405,19 @@ def user_logout(request):
     return redirect('history:home')
 
 
+@query_budget(5)
 @login_required
 def profile(request):
     """Enhanced user profile page"""
-    user_figures = HistoricalFigure.objects.filter(created_by=request.user).order_by('-created_at')
-    user_periods = TimePeriod.objects.filter(created_by=request.user).order_by('-created_at')
-    user_sites = HistoricalSite.objects.filter(created_by=request.user).order_by('-created_at')
+    # Evaluate each list once; the counts below and in the template reuse the result cache
+    user_figures = HistoricalFigure.objects.for_profile(request.user)
+    user_periods = TimePeriod.objects.for_profile(request.user)
+    user_sites = HistoricalSite.objects.for_profile(request.user)
     
     context = {
         'user_figures': user_figures,
         'user_periods': user_periods,
         'user_sites': user_sites,
-        'total_contributions': user_figures.count() + user_periods.count() + user_sites.count(),
+        'total_contributions': len(user_figures) + len(user_periods) + len(user_sites),
     }
     return render(request, 'history/profile.html', context)
\ No newline at end of file
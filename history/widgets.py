@@ -0,0 +1,59 @@
+"""
+Typeahead pickers for foreign keys and many-to-many fields.
+
+A plain Select renders an <option> for every row of the field's queryset,
+so the site and figure forms grew with the catalogue. These widgets render
+the objects already chosen and the first NOSCRIPT_CHOICES others, so the
+form can still be filled in without JavaScript; history/js/lookup.js drops
+the others and adds a search box that queries the lookup endpoint
+(history/lookup.py) for more. The form field is unchanged, so validation
+still only looks up the submitted pks.
+"""
+from django import forms
+from django.urls import reverse
+
+NOSCRIPT_CHOICES = 10
+
+
+class LookupMixin:
+    template_name = 'history/widgets/lookup_select.html'
+
+    class Media:
+        js = ['history/js/lookup.js']
+
+    def __init__(self, resource, attrs=None):
+        super().__init__(attrs)
+        self.resource = resource
+
+    def optgroups(self, name, value, attrs=None):
+        # The chosen objects and a first page of others in one query; the full queryset is never evaluated
+        pks = [pk for pk in value if pk.isdigit()]
+        queryset = self.choices.queryset
+        shown = queryset.filter(pk__in=queryset.values('pk')[:NOSCRIPT_CHOICES])
+        if pks:
+            shown |= queryset.filter(pk__in=pks)
+        field = self.choices.field
+        options = []
+        if not self.allow_multiple_selected and field.empty_label is not None:
+            options.append(self.create_option(name, '', field.empty_label, not pks, 0))
+        for obj in shown:
+            label = field.label_from_instance(obj)
+            options.append(self.create_option(name, obj.pk, label, str(obj.pk) in pks, len(options)))
+        return [(None, options, 0)]
+
+    def use_required_attribute(self, initial):
+        # Kept for browsers without the script; lookup.js drops it when it hides the <select>
+        return forms.Widget.use_required_attribute(self, initial)
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['lookup_url'] = reverse('history:lookup', args=[self.resource])
+        return context
+
+
+class LookupSelect(LookupMixin, forms.Select):
+    pass
+
+
+class LookupSelectMultiple(LookupMixin, forms.SelectMultiple):
+    pass
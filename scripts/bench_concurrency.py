@@ -0,0 +1,143 @@
+"""
+Concurrency benchmark for comparing SERVER_MODE=wsgi and SERVER_MODE=asgi.
+
+Fires --requests GETs at --concurrency in flight while --slow-clients
+connections trickle their request headers one byte at a time, the way a slow
+mobile client does. Sync workers are each held by one such connection, while
+uvicorn workers keep serving. Point it at gunicorn directly (port 8000), not
+through nginx, which buffers slow clients itself.
+
+    SERVER_MODE=wsgi sh scripts/serve.sh &
+    python scripts/bench_concurrency.py http://127.0.0.1:8000/periods/ --slow-clients 10
+    SERVER_MODE=asgi sh scripts/serve.sh &
+    python scripts/bench_concurrency.py http://127.0.0.1:8000/periods/ --slow-clients 10
+
+Only the standard library is used, so it runs from any machine.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def build_request(url):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return (
+        f'GET {path} HTTP/1.1\r\n'
+        f'Host: {parts.netloc}\r\n'
+        'User-Agent: bench_concurrency\r\n'
+        'Connection: close\r\n\r\n'
+    ).encode()
+
+
+async def fetch(host, port, request, timeout):
+    """Send one request and return (status, seconds)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, time.perf_counter() - start
+
+
+async def slow_client(host, port, request, interval, stop):
+    """Hold a connection open by sending the request one byte per interval"""
+    while not stop.is_set():
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(interval)
+            continue
+        try:
+            for i in range(len(request)):
+                if stop.is_set():
+                    break
+                writer.write(request[i:i + 1])
+                await writer.drain()
+                await asyncio.sleep(interval)
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    host, port = parts.hostname, parts.port or 80
+    request = build_request(args.url)
+
+    stop = asyncio.Event()
+    slow = [
+        asyncio.create_task(slow_client(host, port, request, args.slow_interval, stop))
+        for _ in range(args.slow_clients)
+    ]
+    if slow:
+        # Let the slow clients occupy their connections first
+        await asyncio.sleep(args.slow_interval * 2)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            try:
+                status, seconds = await fetch(host, port, request, args.timeout)
+            except (OSError, asyncio.TimeoutError):
+                failures += 1
+                return
+            if status == 200:
+                latencies.append(seconds)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    for task in slow:
+        task.cancel()
+    await asyncio.gather(*slow, return_exceptions=True)
+    return latencies, failures, elapsed
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('url')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--slow-interval', type=float, default=0.5, help='Seconds between bytes from slow clients')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    latencies, failures, elapsed = asyncio.run(run(args))
+    print(f'{args.url}: {args.requests} requests, {args.concurrency} concurrent, {args.slow_clients} slow clients')
+    print(f'  completed  {len(latencies)}   failed {failures}')
+    print(f'  throughput {len(latencies) / elapsed:.1f} req/s over {elapsed:.2f}s')
+    if latencies:
+        print(
+            f'  latency    p50 {percentile(latencies, 0.50) * 1000:.1f}ms'
+            f'   p95 {percentile(latencies, 0.95) * 1000:.1f}ms'
+            f'   p99 {percentile(latencies, 0.99) * 1000:.1f}ms'
+            f'   mean {statistics.mean(latencies) * 1000:.1f}ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
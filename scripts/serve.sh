@@ -0,0 +1,15 @@
+#!/bin/sh
+# Start the application server in the mode chosen by SERVER_MODE:
+#   wsgi - gunicorn sync workers (default)
+#   asgi - gunicorn managing uvicorn workers, with async read views
+set -e
+
+WORKERS=${WEB_WORKERS:-3}
+TIMEOUT=${WEB_TIMEOUT:-60}
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec gunicorn --bind 0.0.0.0:8000 --workers "$WORKERS" --timeout "$TIMEOUT" \
+        --worker-class uvicorn.workers.UvicornWorker uzbekistan_heritage.asgi:application
+fi
+
+exec gunicorn --bind 0.0.0.0:8000 --workers "$WORKERS" --timeout "$TIMEOUT" uzbekistan_heritage.wsgi:application
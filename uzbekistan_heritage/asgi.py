@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uzbekistan_heritage.settings')
 
 application = get_asgi_application()
+
+# Each worker builds its autocomplete index once, before serving
+from history import autocomplete  # noqa: E402
+
+autocomplete.warm()
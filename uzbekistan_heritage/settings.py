@@ -4,6 +4,8 @@ Django settings for uzbekistan_heritage project.
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -28,11 +30,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'history.metrics.QueryMetricsMiddleware',
+    'history.pagecache.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'history.routers.ReplicaRoutingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -58,16 +63,44 @@ WSGI_APPLICATION = 'uzbekistan_heritage.wsgi.application'
 
 # Database - PostgreSQL if DB_HOST is set, else SQLite
 if os.environ.get('DB_HOST'):
+    # With DB_POOL each worker process keeps a pool of open connections
+    # (history/pool.py) and Django returns its connection to the pool after
+    # every request; without it Django keeps one connection per thread for
+    # DB_CONN_MAX_AGE seconds.
+    DB_POOL = os.environ.get('DB_POOL', 'True') == 'True'
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'history.backends.postgresql' if DB_POOL else 'django.db.backends.postgresql',
             'NAME': os.environ.get('DB_NAME'),
             'USER': os.environ.get('DB_USER'),
             'PASSWORD': os.environ.get('DB_PASSWORD'),
             'HOST': os.environ.get('DB_HOST'),
             'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+                # Milliseconds; a runaway query is cancelled instead of holding a worker
+                'options': f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT', '30000'))}",
+            },
+            'POOL': {
+                'size': int(os.environ.get('DB_POOL_SIZE', '4')),
+                'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', '4')),
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                'check_after': float(os.environ.get('DB_POOL_CHECK_AFTER', '30')),
+                'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600')),
+            },
         }
     }
+    # psycopg 3 prepares a statement on the server once the same SQL has run
+    # this many times on a connection, which pooled connections live long
+    # enough to reach for the hot list and detail queries. Empty disables.
+    DB_PREPARE_THRESHOLD = os.environ.get('DB_PREPARE_THRESHOLD', '5')
+    if DB_PREPARE_THRESHOLD:
+        DATABASES['default']['OPTIONS'].update({
+            'prepare_threshold': int(DB_PREPARE_THRESHOLD),
+            'server_side_binding': True,
+        })
 else:
     DATABASES = {
         'default': {
@@ -76,6 +109,75 @@ else:
         }
     }
 
+# Read replicas - optional. DATABASE_REPLICA_HOSTS lists PostgreSQL replica
+# hosts; DATABASE_REPLICA_FILES lists SQLite files (a copy of db.sqlite3 is
+# enough to try routing locally). Each becomes a 'replica_N' alias with the
+# primary's other settings. See history/routers.py.
+DATABASE_REPLICAS = []
+for key, variable in (('HOST', 'DATABASE_REPLICA_HOSTS'), ('NAME', 'DATABASE_REPLICA_FILES')):
+    for location in filter(None, os.environ.get(variable, '').split(',')):
+        alias = f'replica_{len(DATABASE_REPLICAS) + 1}'
+        DATABASES[alias] = {**DATABASES['default'], key: location, 'TEST': {'MIRROR': 'default'}}
+        DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['history.routers.PrimaryReplicaRouter']
+# Seconds a session that wrote keeps reading from the primary
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', '15'))
+
+# The listing card indexes INCLUDE their columns on PostgreSQL; SQLite builds
+# them without, which is fine for development
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Caches - each cache can live in local memory (LRU), on disk, or in a local
+# Redis (run it with maxmemory-policy allkeys-lru). 'default' holds shared
+# data such as the homepage; 'fragments' holds rendered list cards; 'pages'
+# holds whole pages for anonymous visitors (history/pagecache.py). Purges
+# must reach every web worker and the job worker, so 'pages' defaults to the
+# file backend when DEBUG is off (cache/ is a volume shared in docker-compose).
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_LOCATIONS = {
+    'locmem': 'default',
+    'file': str(BASE_DIR / 'cache' / 'default'),
+    'redis': 'redis://127.0.0.1:6379/0',
+}
+FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'locmem')
+FRAGMENT_CACHE_LOCATIONS = {
+    'locmem': 'fragments',
+    'file': str(BASE_DIR / 'cache' / 'fragments'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'locmem' if DEBUG else 'file')
+PAGE_CACHE_LOCATIONS = {
+    'locmem': 'pages',
+    'file': str(BASE_DIR / 'cache' / 'pages'),
+    'redis': 'redis://127.0.0.1:6379/2',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]),
+    },
+    'fragments': {
+        'BACKEND': CACHE_BACKENDS[FRAGMENT_CACHE_BACKEND],
+        'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', FRAGMENT_CACHE_LOCATIONS[FRAGMENT_CACHE_BACKEND]),
+        'TIMEOUT': None,
+    },
+    'pages': {
+        'BACKEND': CACHE_BACKENDS[PAGE_CACHE_BACKEND],
+        'LOCATION': os.environ.get('PAGE_CACHE_LOCATION', PAGE_CACHE_LOCATIONS[PAGE_CACHE_BACKEND]),
+        'TIMEOUT': int(os.environ.get('PAGE_CACHE_SECONDS', '600')),
+    },
+}
+if FRAGMENT_CACHE_BACKEND != 'redis':
+    CACHES['fragments']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', '10000')),
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -101,10 +203,58 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# Hashed names plus .gz/.br siblings, written by collectstatic; off in
+# development, where files are served from the app directories as they are
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', str(not DEBUG)) == 'True'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'history.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 # Media files (user uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Media under these prefixes needs a signed-in user and is served through Django
+MEDIA_PROTECTED_PREFIXES = [prefix for prefix in os.environ.get('MEDIA_PROTECTED_PREFIXES', 'private/').split(',') if prefix]
+# Hand checked media to nginx's internal location instead of streaming it
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', str(not DEBUG)) == 'True'
+MEDIA_ACCEL_LOCATION = '/internal-media/'
+
+# List pages (keyset pagination)
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', '12'))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', '100'))
+
+# Autocomplete - how often a worker checks whether other workers changed any names
+AUTOCOMPLETE_REFRESH_SECONDS = int(os.environ.get('AUTOCOMPLETE_REFRESH_SECONDS', '5'))
+
+# Background jobs - run inline when eager, otherwise by `manage.py run_worker`
+TASKS_EAGER = os.environ.get('TASKS_EAGER', str(DEBUG)) == 'True'
+
+# Serving mode - 'asgi' runs uvicorn workers and routes read pages to the async views
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = SERVER_MODE == 'asgi'
+
+# Metrics - /metrics is served to these addresses (and to staff users)
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+# Add X-Query-Count, X-Worker-Pid and X-Worker-RSS to every response (manage.py benchmark)
+METRICS_RESPONSE_HEADERS = os.environ.get('METRICS_RESPONSE_HEADERS', 'False') == 'True'
+
+# Full-page cache for anonymous visitors; off in development so edits show at once
+PAGE_CACHE = os.environ.get('PAGE_CACHE', str(not DEBUG)) == 'True'
+if PAGE_CACHE and PAGE_CACHE_BACKEND == 'locmem' and not DEBUG:
+    raise ImproperlyConfigured('PAGE_CACHE needs a PAGE_CACHE_BACKEND shared by all processes (file or redis)')
+# How long nginx may keep its own copy; it is not purged on edits
+PAGE_CACHE_PROXY_SECONDS = int(os.environ.get('PAGE_CACHE_PROXY_SECONDS', '10'))
+
+# Pre-rendered public pages (manage.py prerender), served by nginx to anonymous visitors;
+# when on, edits delete the affected files until the next build
+PRERENDER = os.environ.get('PRERENDER', 'False') == 'True'
+PRERENDER_ROOT = os.environ.get('PRERENDER_ROOT', str(BASE_DIR / 'prerendered'))
+# Host the pages are rendered for; must be in ALLOWED_HOSTS
+PRERENDER_HOST = os.environ.get('PRERENDER_HOST', ALLOWED_HOSTS[0])
 
 # Login URL
 LOGIN_URL = 'history:login'
@@ -1,13 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from history import media
+from history.metrics import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('', include('history.urls')),
-]
-
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # nginx serves public media itself; protected media (and all media in development) comes here
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", media.serve, name='media'),
+]
\ No newline at end of file
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uzbekistan_heritage.settings')
 
 application = get_wsgi_application()
+
+# Each worker builds its autocomplete index once, before serving
+from history import autocomplete  # noqa: E402
+
+autocomplete.warm()